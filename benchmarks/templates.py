@@ -0,0 +1,61 @@
+"""
+Benchmark of attribute template rendering for deep attribute chains.
+
+Compares the former substitution loop (re-formatting the expression until
+no fields are left) with compiled templates bound to a resolved
+:class:`yasmon.templates.AttributePlan`.
+
+Usage: ``python benchmarks/templates.py [depth] [number]``
+"""
+
+from yasmon.templates import Template, AttributePlan
+
+import re
+import sys
+import timeit
+
+
+def legacy_process_attributes(expr: str, attrs: dict[str, str]) -> str:
+    max_depth = 42
+    regex = re.compile(r"\{[^{}]*\}")
+    search = regex.search(expr)
+
+    depth = 0
+    while search:
+        expr = expr.format(**attrs)
+        if depth < max_depth:
+            depth += 1
+        else:
+            raise RuntimeError(expr)
+        search = regex.search(expr)
+
+    return expr
+
+
+def main(depth: int = 40, number: int = 10000):
+    static = {'attr0': 'root {path}'}
+    for i in range(1, depth):
+        static[f'attr{i}'] = f'level {i} {{attr{i - 1}}} ({{change}})'
+    event = {'change': 'modified', 'path': '/tmp/file'}
+    expr = f'command {{attr{depth - 1}}} {{path}}'
+
+    plan = AttributePlan(static)
+    template = Template(expr)
+
+    def legacy():
+        return legacy_process_attributes(expr, static | event)
+
+    def compiled():
+        return plan.render(template, plan.bind(event))
+
+    assert legacy() == compiled()
+    legacy_time = min(timeit.repeat(legacy, number=number, repeat=3))
+    compiled_time = min(timeit.repeat(compiled, number=number, repeat=3))
+    print(f'depth {depth}, {number} renders')
+    print(f'legacy:   {legacy_time * 1e6 / number:8.2f} us/render')
+    print(f'compiled: {compiled_time * 1e6 / number:8.2f} us/render')
+    print(f'speedup:  {legacy_time / compiled_time:8.1f}x')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,12 +1,15 @@
 from yasmon.processor import YAMLProcessor
 from yasmon.tasks import TaskRunner
 from yasmon.callbacks import ShellCallback
+from yasmon.callbacks import OutputCapture
 from yasmon.callbacks import LoggerCallback
 from yasmon.callbacks import MailCallback
+from yasmon.callbacks import MailDigest
 from yasmon.callbacks import CallbackError
 from yasmon.callbacks import CallbackSyntaxError
 from yasmon.callbacks import CallbackCircularAttributeError
 from yasmon.callbacks import CallbackAttributeError
+from yasmon.templates import AttributePlan
 
 import unittest
 from unittest import mock
@@ -58,6 +61,72 @@ class ShellCallbackTest(unittest.TestCase):
         callback = ShellCallback.from_yaml('name', test_yaml)
         assert callback.name == 'name'
         assert callback.cmd == 'somecommand'
+        assert callback.when is None
+
+        test_yaml = """
+            type: shell
+            command: somecommand
+            when: size > 1 * MiB
+        """
+        callback = ShellCallback.from_yaml('name', test_yaml)
+        assert callback.when.expr == 'size > 1 * MiB'
+        assert callback.when({'size': '2097152'})
+
+        test_yaml = """
+            type: shell
+            argv:
+                - cp
+                - "{path}"
+                - /some/dir/
+        """
+        callback = ShellCallback.from_yaml('name', test_yaml)
+        assert callback.cmd is None
+        assert callback.argv == ['cp', '{path}', '/some/dir/']
+        assert callback.templates() == callback.argv
+
+        test_yaml = """
+            type: shell
+            command: some worker
+            coprocess: true
+            fields: [path]
+        """
+        callback = ShellCallback.from_yaml('name', test_yaml)
+        assert callback.coprocess
+        assert callback.templates() == ['{path}']
+
+        test_yaml = """
+            type: shell
+            argv: [gzip, --]
+            batch:
+                size: 100
+                wait: 0.5
+                input: stdin
+                item: "{dirname}/{basename}"
+        """
+        callback = ShellCallback.from_yaml('name', test_yaml)
+        assert callback.batcher.size == 100
+        assert callback.batcher.wait == 0.5
+        assert callback.batcher.input == 'stdin'
+        assert callback.templates() == ['gzip', '--',
+                                        '{dirname}/{basename}']
+        assert callback.limits is None
+
+        test_yaml = """
+            type: shell
+            command: somecommand
+            nice: 10
+            ionice: best-effort
+            ionice_level: 7
+            affinity: [0]
+            rlimits:
+                cpu: 60
+                nofile: 128
+        """
+        callback = ShellCallback.from_yaml('name', test_yaml)
+        assert callback.limits.nice == 10
+        assert callback.limits.ioprio == 2 << 13 | 7
+        assert callback.limits.affinity == [0]
+        assert len(callback.limits.limits) == 2
 
     def test_ShellCallback_raise_exceptions(self):
         """
@@ -87,6 +156,127 @@ class ShellCallbackTest(unittest.TestCase):
         fun = ShellCallback.from_yaml
         self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
 
+        # command and argv
+        test_yaml = """
+            type: shell
+            command: somecommand
+            argv: [somecommand]
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # argv not a non-empty list of strings
+        for argv in ['somecommand', '[]', '[somecommand, [arg]]']:
+            test_yaml = f"""
+                type: shell
+                argv: {argv}
+            """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid attribute field in argv
+        test_yaml = """
+            type: shell
+            argv: [somecommand, "{path!x}"]
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid coprocess
+        for options in ['coprocess: 1', 'fields: [path]',
+                        'coprocess: true\n            fields: path',
+                        'coprocess: true\n            fields: [[path]]']:
+            test_yaml = f"""
+            type: shell
+            command: somecommand
+            {options}
+        """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid output_limit
+        for output_limit in ['0', 'true', '1.5', 'x']:
+            test_yaml = f"""
+                type: shell
+                command: somecommand
+                output_limit: {output_limit}
+            """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid max_concurrency or timeout
+        for options in ['max_concurrency: -1', 'max_concurrency: 1.5',
+                        'max_concurrency: true', 'timeout: 0',
+                        'timeout: x', 'timeout: false']:
+            test_yaml = f"""
+                type: shell
+                command: somecommand
+                {options}
+            """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid batch
+        for batch in ['[]', '{sizes: 1}', '{size: 0}', '{size: true}',
+                      '{wait: 0}', '{wait: x}', '{input: env}',
+                      '{item: []}', '{item: "{path!x}"}']:
+            test_yaml = f"""
+                type: shell
+                command: somecommand
+                batch: {batch}
+            """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # invalid priority or limits
+        for options in ['nice: x', 'ionice: low', 'affinity: []',
+                        'rlimits: [cpu]', 'rlimits: {cpu: x}',
+                        'rlimits: {stack: 1}']:
+            test_yaml = f"""
+                type: shell
+                command: somecommand
+                {options}
+            """
+            fun = ShellCallback.from_yaml
+            self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # batch and coprocess
+        test_yaml = """
+            type: shell
+            command: somecommand
+            coprocess: true
+            batch: {}
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # attributes in the command of a coprocess
+        test_yaml = """
+            type: shell
+            argv: [somecommand, "{path}"]
+            coprocess: true
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # when not a string
+        test_yaml = """
+            type: shell
+            command: somecommand
+            when: []
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
+        # when not a valid condition
+        test_yaml = """
+            type: shell
+            command: somecommand
+            when: open(path)
+        """
+        fun = ShellCallback.from_yaml
+        self.assertRaises(CallbackSyntaxError, fun, 'name', test_yaml)
+
     def test_call_success(self):
         """
         Test ShellCallback.__call__() with stdout for success.
@@ -150,6 +340,297 @@ class ShellCallbackTest(unittest.TestCase):
             self.fail()
         self.stop_input_producer()
 
+    def test_call_argv(self):
+        """
+        Test ShellCallback.__call__() executes argv without a shell.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        attrs = {'path': "/some dir/it's $HOME; rm -rf x"}
+
+        loop = asyncio.new_event_loop()
+        callback = ShellCallback('name', argv=['printf', '%s|%s',
+                                               '{path}', '{basename}'])
+        stdout, stderr = loop.run_until_complete(callback(task, dict(
+            attrs, basename="it's $HOME; rm -rf x")))
+        assert stdout.decode() == f"{attrs['path']}|it's $HOME; rm -rf x"
+        assert stderr == b''
+        assert callback.stats.callbacks['name'].count == 1
+        assert callback.stats.tasks['task'].count == 1
+
+        callback = ShellCallback('name', argv=['/nonexistent/{path}'])
+        self.assertRaises(CallbackError, loop.run_until_complete,
+                          callback(task, attrs))
+        loop.close()
+
+    def test_call_output(self):
+        """
+        Test ShellCallback.__call__() streams and caps output.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        loop = asyncio.new_event_loop()
+
+        callback = ShellCallback('name', argv=[
+            'sh', '-c', 'cat; printf "a\\nb\\n"; printf c >&2'])
+        stdout, stderr = loop.run_until_complete(callback(task, {}))
+        assert stdout == b'a\nb\n'
+        assert stderr == b'c'
+
+        callback = ShellCallback('name', cmd='head -c 100000 /dev/zero',
+                                 output_limit=10)
+        stdout, stderr = loop.run_until_complete(callback(task, {}))
+        assert stdout == bytes(10)
+        assert stderr == b''
+        loop.close()
+
+    def test_call_timeout(self):
+        """
+        Test ShellCallback.__call__() kills the process group on timeout.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        loop = asyncio.new_event_loop()
+
+        # SIGTERM
+        callback = ShellCallback('name', timeout=0.2,
+                                 cmd='echo started; sleep 30 & sleep 30')
+        start = time.monotonic()
+        stdout, _ = loop.run_until_complete(callback(task, {}))
+        assert time.monotonic() - start < 5
+        assert stdout == b'started\n'
+        assert callback.timeouts == 1
+
+        # SIGKILL after grace period
+        callback = ShellCallback('name', timeout=0.2,
+                                 cmd="trap '' TERM; sleep 30 & sleep 30")
+        callback.grace = 0.5
+        start = time.monotonic()
+        loop.run_until_complete(callback(task, {}))
+        assert 0.7 <= time.monotonic() - start < 5
+        assert callback.timeouts == 1
+
+        # coprocess not responding is restarted
+        callback = ShellCallback('name', cmd='cat > /dev/null',
+                                 coprocess=True, timeout=0.2)
+        assert loop.run_until_complete(callback(task, {})) == (b'', b'')
+        assert callback.timeouts == 1
+        assert callback.proc is None
+        loop.close()
+
+    def test_call_cancel(self):
+        """
+        Test ShellCallback.__call__() kills and reaps cancelled commands.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        callback = ShellCallback('name', cmd='sleep 30')
+
+        async def run():
+            call = asyncio.ensure_future(callback(task, {}))
+            await asyncio.sleep(0.2)
+            assert callback.running == 1
+            call.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await call
+
+        loop = asyncio.new_event_loop()
+        start = time.monotonic()
+        loop.run_until_complete(run())
+        loop.close()
+
+        assert time.monotonic() - start < 5
+        assert callback.running == 0
+        assert callback.stats.callbacks['name'].count == 1
+        assert callback.stats.tasks['task'].count == 1
+
+    def test_call_max_concurrency(self):
+        """
+        Test ShellCallback.__call__() limits concurrent commands.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        callback = ShellCallback('name', cmd='sleep 0.3', max_concurrency=2)
+        counters = []
+
+        async def run():
+            calls = asyncio.gather(*(callback(task, {}) for _ in range(5)))
+            await asyncio.sleep(0.15)
+            counters.append((callback.queued, callback.running))
+            await calls
+            counters.append((callback.queued, callback.running))
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+        assert counters == [(3, 2), (0, 0)]
+
+    def test_call_batch(self):
+        """
+        Test ShellCallback.__call__() executes batches.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        out = os.path.abspath('tests/assets/tmp/batch_out')
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        paths = [f'/some dir/{i}' for i in range(7)]
+
+        async def run(callback):
+            for path in paths:
+                await callback(task, {'path': path, 'out': out})
+            await asyncio.sleep(0.1)
+            written = open(out).read() if os.path.exists(out) else ''
+            await asyncio.sleep(0.3)
+            await callback.stop()
+            return written
+
+        # argv
+        if os.path.exists(out):
+            os.remove(out)
+        callback = ShellCallback('name', argv=[
+            'sh', '-c', 'printf "%s|" "$@" >> "$0"; echo >> "$0"', '{out}'],
+            batch={'size': 3, 'wait': 0.2})
+        loop = asyncio.new_event_loop()
+        written = loop.run_until_complete(run(callback))
+        assert written == ''.join(
+            '|'.join(paths[i:i + 3]) + '|\n' for i in [0, 3])
+        assert open(out).read() == written + f'{paths[6]}|\n'
+
+        # stdin
+        os.remove(out)
+        callback = ShellCallback('name', cmd='tr "\\0" "\\n" >> {out}',
+                                 batch={'size': 10, 'wait': 10,
+                                        'input': 'stdin'})
+        assert loop.run_until_complete(run(callback)) == ''
+        assert open(out).read() == ''.join(f'{path}\n' for path in paths)
+        os.remove(out)
+
+        # commands rendered differently are batched separately
+        callback = ShellCallback('name', argv=[
+            'sh', '-c', 'printf "%s|" "$@" >> "$0"', '{out}'],
+            batch={'size': 10, 'wait': 10})
+        outs = [f'{out}{i % 2}' for i in range(len(paths))]
+
+        async def split():
+            for path, path_out in zip(paths, outs):
+                await callback(task, {'path': path, 'out': path_out})
+            await callback.stop()
+
+        loop.run_until_complete(split())
+        for i in range(2):
+            assert open(f'{out}{i}').read() == ''.join(
+                f'{path}|' for path in paths[i::2])
+            os.remove(f'{out}{i}')
+        loop.close()
+
+    def test_batch_chunks(self):
+        """
+        Test CommandBatcher.chunks() splits batches within ARG_MAX.
+        """
+
+        callback = ShellCallback('name', cmd='cmd', batch={})
+        batcher = callback.batcher
+        assert list(batcher.chunks('echo', ["a b", "c'd"])) == \
+            ["echo 'a b' 'c'\"'\"'d'"]
+
+        batcher.arg_max = lambda: 100
+        items = [str(i) * 20 for i in range(10)]
+        chunks = list(batcher.chunks(['cmd', '-v'], items))
+        assert len(chunks) == 5
+        assert all(chunk[:2] == ['cmd', '-v'] for chunk in chunks)
+        assert sum((chunk[2:] for chunk in chunks), []) == items
+        assert all(sum(len(arg) + 9 for arg in chunk) <= 100
+                   for chunk in chunks)
+
+        chunks = list(batcher.chunks('cmd', items))
+        assert len(chunks) == 3
+        assert all(len(chunk) <= 100 for chunk in chunks)
+
+    def test_output_capture(self):
+        """
+        Test OutputCapture spools output exceeding its limit.
+        """
+
+        async def capture(capture, data):
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return await capture(reader)
+
+        loop = asyncio.new_event_loop()
+        output = OutputCapture('name', 'stdout', 'INFO', 8)
+        with mock.patch.object(output, 'log') as log:
+            assert loop.run_until_complete(
+                capture(output, b'ab\ncd')) == b'ab\ncd'
+        assert log.call_args_list == [mock.call(b'ab'), mock.call(b'cd')]
+        assert output.spool is None
+
+        output = OutputCapture('name', 'stdout', 'INFO', 8)
+        output.chunk_size = 4
+        data = b'line\n' * 10
+        with mock.patch.object(output, 'log') as log:
+            assert loop.run_until_complete(capture(output, data)) == data[:8]
+        assert log.call_args_list == [mock.call(b'line')]
+        assert output.size == len(data)
+        with open(output.spool, 'rb') as fh:
+            assert fh.read() == data
+        os.remove(output.spool)
+        loop.close()
+
+    def test_call_coprocess(self):
+        """
+        Test ShellCallback.__call__() in coprocess mode.
+        """
+
+        task = mock.Mock()
+        task.name = 'task'
+        script = ('while read -r line; do '
+                  'case "$line" in *crash*) exit 3;; esac; '
+                  'echo "ok $line"; done')
+
+        loop = asyncio.new_event_loop()
+        callback = ShellCallback('name', argv=['sh', '-c', script],
+                                 coprocess=True, fields=['path'])
+        loop.run_until_complete(callback.start())
+        pid = callback.proc.pid
+
+        stdout, stderr = loop.run_until_complete(
+            callback(task, {'path': '/a b', 'other': 'x'}))
+        assert stdout == b'ok {"path": "/a b"}\n'
+        assert stderr == b''
+        loop.run_until_complete(callback(task, {'path': '/c'}))
+        assert callback.proc.pid == pid
+
+        # worker exits, the call fails and the worker is restarted
+        self.assertRaises(CallbackError, loop.run_until_complete,
+                          callback(task, {'path': 'crash'}))
+        assert callback.proc is None
+        stdout, _ = loop.run_until_complete(callback(task, {'path': '/d'}))
+        assert stdout == b'ok {"path": "/d"}\n'
+        assert callback.proc.pid != pid
+
+        loop.run_until_complete(callback.stop())
+        assert callback.proc is None
+        loop.close()
+
+    def test_coprocess_payload(self):
+        """
+        Test ShellCallback.payload() renders all attributes by default.
+        """
+
+        callback = ShellCallback('name', cmd='cat', coprocess=True)
+        attrs = AttributePlan({'target': '{dir}/x', 'dir': '/tmp'}).bind(
+            {'path': '/p', 'count': 2})
+        assert callback.payload(attrs) == {
+            'target': '/tmp/x', 'dir': '/tmp', 'path': '/p', 'count': '2'}
+        assert callback.payload({'path': '/q'}) == {'path': '/q'}
+
 
 class LoggerCallbackTest(unittest.TestCase):
 
@@ -360,6 +841,7 @@ class MailCallbackTest(unittest.TestCase):
                 - path/to/file1
                 - path/to/file2
             delay: 10
+            spool: /var/spool/yasmon
         """
         mail = MailCallback.from_yaml('name', test_yaml)
         assert mail.host == self.SMTP_HOST
@@ -373,6 +855,7 @@ class MailCallbackTest(unittest.TestCase):
         assert mail.message == '{message}'
         assert mail.attach == ['path/to/file1', 'path/to/file2']
         assert mail.delay == 10
+        assert mail.spool == '/var/spool/yasmon'
 
     def test_from_yaml_raise_exceptions(self):
         """
@@ -566,6 +1049,57 @@ class MailCallbackTest(unittest.TestCase):
         err = context.exception
         assert str(err) == "in callback 'name' 'delay' not an int"
 
+        # spool is not a string
+        test_yaml = f"""
+            host: "{self.SMTP_HOST}"
+            port: 587
+            spool: []
+            login: "{self.SMTP_LOGIN}"
+            password: "{self.SMTP_PASSWORD}"
+            from: "{{from}}"
+            to: "{{to}}"
+            subject: "Notification: {{subject}}"
+            security: starttls
+            message: "{{message}}"
+        """
+        with self.assertRaises(CallbackSyntaxError) as context:
+            fun('name', test_yaml)
+        err = context.exception
+        assert str(err) == "in callback 'name' 'spool' not a str"
+
+        # invalid digest
+        base_yaml = f"""
+            host: "{self.SMTP_HOST}"
+            port: 587
+            login: "{self.SMTP_LOGIN}"
+            password: "{self.SMTP_PASSWORD}"
+            from: "{{from}}"
+            to: "{{to}}"
+            subject: "Notification: {{subject}}"
+            security: starttls
+            message: "{{message}}"
+        """
+        invalid = [
+            ('digest: []', 'digest must be a dictionary'),
+            ('digest: {size: 2}\n            delay: 1',
+             "'delay' and 'digest' are exclusive"),
+            ('digest: {count: 2}', 'invalid digest key count'),
+            ('digest: {size: 0}', 'invalid digest size'),
+            ('digest: {size: true}', 'invalid digest size'),
+            ('digest: {wait: -1}', 'invalid digest wait'),
+            ('digest: {wait: "1"}', 'invalid digest wait'),
+        ]
+        for digest, msg in invalid:
+            with self.assertRaises(CallbackSyntaxError) as context:
+                fun('name', f'{base_yaml}    {digest}\n')
+            err = context.exception
+            assert str(err) == f"in callback 'name' {msg}"
+
+        mail = fun('name', f'{base_yaml}    digest: {{size: 2, wait: 0.5}}\n')
+        assert isinstance(mail.digest, MailDigest)
+        assert mail.digest.size == 2
+        assert mail.digest.wait == 0.5
+
         # host not a string
         test_yaml = f"""
             host: []
@@ -1075,3 +1609,106 @@ class MailCallbackTest(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
+
+
+class MailDigestTest(unittest.TestCase):
+    def callback(self, **digest) -> MailCallback:
+        mail = MailCallback('mail', 'localhost', 25, 'login', 'password',
+                            'starttls', 'to@localhost', 'subject {path}',
+                            'from@localhost', 'message {path}',
+                            ['tests/assets/{file}'], 10, digest=digest)
+        mail.send = mock.AsyncMock()
+        return mail
+
+    def call(self, mail: MailCallback, task: str, change: str, path: str):
+        task_ = mock.Mock()
+        task_.name = task
+        attrs = {'change': change, 'path': path,
+                 'file': 'watchfiles_test.sh'}
+        return mail(task_, attrs)
+
+    def test_size(self):
+        """
+        Test that a full digest is sent as a single mail.
+        """
+
+        async def run():
+            mail = self.callback(size=3, wait=60)
+            await self.call(mail, 'task0', 'added', '/a')
+            await self.call(mail, 'task1', 'added', '/b')
+            mail.send.assert_not_awaited()
+            await self.call(mail, 'task0', 'deleted', '/c')
+            mail.send.assert_awaited_once()
+            assert mail.digest.timer is None
+
+            digest = mail.send.await_args.args[0]
+            assert digest['Subject'] == '[3 events] subject /a'
+            assert digest['From'] == 'from@localhost'
+            assert digest['To'] == 'to@localhost'
+            content = digest.get_body(('plain',)).get_content()
+            assert content.startswith('3 events from ')
+            assert 'tasks: task0 2, task1 1\n' in content
+            assert 'changes: added 2, deleted 1\n' in content
+            assert ' task1: subject /b\nmessage /b\n' in content
+            assert '[3/3] ' in content
+            attachments = list(digest.iter_attachments())
+            assert len(attachments) == 1
+            assert attachments[0].get_filename() == 'watchfiles_test.sh'
+            with open('tests/assets/watchfiles_test.sh', 'rb') as fh:
+                assert attachments[0].get_payload(decode=True) == fh.read()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_wait(self):
+        """
+        Test that a digest is sent once its timer expires instead of
+        delaying each call, and that a single call is sent as is.
+        """
+
+        async def run():
+            mail = self.callback(size=100, wait=0.2)
+            start = time.monotonic()
+            await self.call(mail, 'task0', 'added', '/a')
+            timer = mail.digest.timer
+            await self.call(mail, 'task0', 'added', '/b')
+            assert time.monotonic() - start < 1
+            assert mail.digest.timer is timer
+            await asyncio.sleep(0.3)
+            mail.send.assert_awaited_once()
+            digest = mail.send.await_args.args[0]
+            assert digest['Subject'] == '[2 events] subject /a'
+
+            await self.call(mail, 'task0', 'modified', '/c')
+            await mail.stop()
+            assert mail.send.await_count == 2
+            single = mail.send.await_args.args[0]
+            assert single['Subject'] == 'subject /c'
+            assert mail.digest.timer is None
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_error(self):
+        """
+        Test that an error of a digest sent in the background is raised by
+        the next call.
+        """
+
+        async def run():
+            mail = self.callback(size=100, wait=0.1)
+            mail.send.side_effect = CallbackError('failed')
+            await self.call(mail, 'task0', 'added', '/a')
+            await asyncio.sleep(0.2)
+            with self.assertRaises(CallbackError):
+                await self.call(mail, 'task0', 'added', '/b')
+            await self.call(mail, 'task0', 'added', '/c')
+            mail.send.side_effect = None
+            await mail.stop()
+            assert mail.send.await_count == 2
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
@@ -0,0 +1,97 @@
+from yasmon.checkpoints import Checkpoint
+
+import watchfiles
+import unittest
+import shutil
+import os
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(CheckpointTest, self).__init__(*args, **kwargs)
+        self.root = os.path.abspath('tests/assets/tmp/checkpoint')
+        self.index = os.path.abspath('tests/assets/tmp/checkpoint.idx')
+
+    def setUp(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        if os.path.exists(self.index):
+            os.remove(self.index)
+        os.makedirs(os.path.join(self.root, 'a'))
+        for path in ['a/x', 'a.txt', 'a-b', 'b']:
+            with open(os.path.join(self.root, path), 'w') as fh:
+                fh.write(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        if os.path.exists(self.index):
+            os.remove(self.index)
+
+    def test_walk(self):
+        """
+        Test Checkpoint.walk() yields files ordered by path components.
+        """
+
+        paths = [record[0] for record in Checkpoint.walk([self.root])]
+        expected = [os.path.join(self.root, path)
+                    for path in ['a/x', 'a-b', 'a.txt', 'b']]
+        assert paths == expected
+        assert paths == sorted(paths, key=Checkpoint.key)
+
+        # file root
+        path = os.path.join(self.root, 'b')
+        assert [r[0] for r in Checkpoint.walk([path])] == [path]
+
+    def test_save_read(self):
+        """
+        Test Checkpoint.save() and Checkpoint.read() round trip.
+        """
+
+        checkpoint = Checkpoint(self.index)
+        assert list(checkpoint.read()) == []
+
+        # paths with spaces
+        with open(os.path.join(self.root, 'with space'), 'w') as fh:
+            fh.write('space')
+
+        checkpoint.save([self.root])
+        assert list(checkpoint.read()) == list(Checkpoint.walk([self.root]))
+
+        # invalid index
+        with open(self.index, 'wb') as fh:
+            fh.write(b'INVALID')
+        assert list(checkpoint.read()) == []
+
+    def test_diff(self):
+        """
+        Test Checkpoint.diff() for added, modified and deleted files.
+        """
+
+        checkpoint = Checkpoint(self.index)
+
+        # without index everything is added
+        changes = list(checkpoint.diff([self.root]))
+        assert len(changes) == 4
+        assert {c for (c, _) in changes} == {watchfiles.Change.added}
+
+        # unchanged
+        assert list(checkpoint.diff([self.root])) == []
+
+        # changes
+        os.remove(os.path.join(self.root, 'a-b'))
+        with open(os.path.join(self.root, 'a', 'y'), 'w') as fh:
+            fh.write('y')
+        with open(os.path.join(self.root, 'b'), 'w') as fh:
+            fh.write('modified')
+
+        changes = list(checkpoint.diff([self.root]))
+        assert changes == [
+            (watchfiles.Change.added, os.path.join(self.root, 'a/y')),
+            (watchfiles.Change.deleted, os.path.join(self.root, 'a-b')),
+            (watchfiles.Change.modified, os.path.join(self.root, 'b')),
+        ]
+        assert list(checkpoint.diff([self.root])) == []
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
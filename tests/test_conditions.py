@@ -0,0 +1,85 @@
+from yasmon.conditions import Condition, ConditionSyntaxError, ConditionError
+from yasmon.templates import AttributePlan
+
+import unittest
+
+
+class ConditionTest(unittest.TestCase):
+
+    def test_call(self):
+        """
+        Test Condition.__call__() for supported expressions.
+        """
+
+        attrs = {
+            'change': 'added',
+            'path': '/spool/tenant-42/report.CSV',
+            'size': '2097152',
+            'count': 3,
+        }
+        expressions = {
+            "size > 1 * MiB and path.lower().endswith('.csv')": True,
+            "size > 2 * MiB or change == 'deleted'": False,
+            "not size < 1 * KiB": True,
+            "change in ['added', 'moved'] and 'tenant' in path": True,
+            "change not in ('added',)": False,
+            "0 < count <= 3": True,
+            "count % 2 == 1 and -count < 0": True,
+            "int(size) // MiB == 2": True,
+            "len(path) > 10 and str(count) == '3'": True,
+            "glob(path, '*/tenant-*/*') and matches(path, r'-(\\d+)/')": True,
+            "matches(path, change)": False,
+            "float('1.5') > 1": True,
+        }
+        for expr, expected in expressions.items():
+            condition = Condition(expr)
+            assert condition(attrs) is expected, expr
+
+        assert Condition("size > MiB and path").names == {'size', 'path'}
+
+    def test_call_raise_exceptions(self):
+        """
+        Test Condition.__call__() raises ConditionError.
+        """
+
+        condition = Condition("size > 1 * MiB")
+        self.assertRaises(ConditionError, condition, {})
+        self.assertRaises(ConditionError, condition, {'size': 'large'})
+        self.assertRaises(ConditionError, Condition('1 / count'),
+                          {'count': 0})
+        self.assertRaises(ConditionError, Condition("[count] * TiB"),
+                          {'count': 1})
+        self.assertRaises(ConditionError, Condition("[path] * 99999999999"),
+                          {'path': 'a'})
+
+        # attributes of missing paths do not hold in comparisons
+        assert condition({'size': ''}) is False
+        assert Condition("not size > 1 * MiB")({'size': ''}) is True
+        assert Condition("size == ''")({'size': ''}) is True
+
+    def test_syntax_errors(self):
+        """
+        Test Condition() raises ConditionSyntaxError on unsupported
+        expressions.
+        """
+
+        for expr in ['size >', '__import__("os")', 'path.__class__',
+                     'path.format()', 'open(path)', 'lambda: 1',
+                     '[x for x in path]', 'size if path else 0',
+                     "matches(path, '(')", 'size is None', 'b"bytes"']:
+            self.assertRaises(ConditionSyntaxError, Condition, expr)
+
+    def test_templated_attributes(self):
+        """
+        Test Condition renders templated task attributes.
+        """
+
+        plan = AttributePlan({'target': '{dir}/{name}', 'dir': '/tmp',
+                              'loop': '{loop}'})
+        attrs = plan.bind({'name': 'a.csv'})
+        assert Condition("target == '/tmp/a.csv'")(attrs) is True
+        self.assertRaises(ConditionError, Condition("loop == ''"), attrs)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,197 @@
+from yasmon.events import Change, RenameDetector, SettleTracker
+
+import watchfiles
+import unittest
+import shutil
+import os
+
+
+class RenameDetectorTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(RenameDetectorTest, self).__init__(*args, **kwargs)
+        self.root = os.path.abspath('tests/assets/tmp/renames')
+
+    def setUp(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'a'))
+        os.makedirs(os.path.join(self.root, 'b'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def write(self, path, content):
+        with open(path, 'w') as fh:
+            fh.write(content)
+
+    def test_change(self):
+        """
+        Test Change values match watchfiles.Change.
+        """
+
+        assert Change.added == watchfiles.Change.added
+        assert Change.modified == watchfiles.Change.modified
+        assert Change.deleted == watchfiles.Change.deleted
+
+    def test_pair_inode(self):
+        """
+        Test RenameDetector.pair() pairs renames by inode.
+        """
+
+        detector = RenameDetector()
+        src = self.path('a', 'x')
+        dest = self.path('b', 'y')
+        other = self.path('b', 'x')
+        self.write(src, 'content')
+        self.write(other, 'other')
+        detector.pair({(watchfiles.Change.added, src)})
+
+        os.rename(src, dest)
+        unpaired, moves = detector.pair({
+            (watchfiles.Change.deleted, src),
+            (watchfiles.Change.added, dest),
+            (watchfiles.Change.added, other),
+        })
+        assert moves == [(src, dest)]
+        assert unpaired == [(Change.added, other)]
+
+    def test_pair_heuristics(self):
+        """
+        Test RenameDetector.pair() pairs paths by file name and size.
+        """
+
+        detector = RenameDetector()
+        src = self.path('a', 'x')
+        dest = self.path('b', 'x')
+        self.write(src, 'content')
+        detector.remember(src)
+        self.write(dest, 'content')
+        os.remove(src)
+
+        unpaired, moves = detector.pair({
+            (watchfiles.Change.deleted, src),
+            (watchfiles.Change.added, dest),
+        })
+        assert moves == [(src, dest)]
+        assert unpaired == []
+
+        # paths of unknown or different size are not paired
+        for known in [False, True]:
+            src = self.path('a', 'w')
+            dest = self.path('b', 'w')
+            self.write(src, 'other content')
+            if known:
+                detector.remember(src)
+            self.write(dest, 'content')
+            os.remove(src)
+            unpaired, moves = detector.pair({
+                (watchfiles.Change.deleted, src),
+                (watchfiles.Change.added, dest),
+            })
+            assert moves == []
+            assert sorted(unpaired) == [(Change.added, dest),
+                                        (Change.deleted, src)]
+
+        # different names are not paired
+        src = self.path('a', 'y')
+        dest = self.path('b', 'z')
+        self.write(dest, 'content')
+        unpaired, moves = detector.pair({
+            (watchfiles.Change.deleted, src),
+            (watchfiles.Change.added, dest),
+        })
+        assert moves == []
+        assert sorted(unpaired) == [(Change.added, dest),
+                                    (Change.deleted, src)]
+
+    def test_cache_bounded(self):
+        """
+        Test RenameDetector.remember() keeps the cache bounded.
+        """
+
+        detector = RenameDetector(max_entries=2)
+        for name in ['x', 'y', 'z']:
+            self.write(self.path('a', name), name)
+            detector.remember(self.path('a', name))
+        assert list(detector.cache) == [self.path('a', 'y'),
+                                        self.path('a', 'z')]
+
+
+class SettleTrackerTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(SettleTrackerTest, self).__init__(*args, **kwargs)
+        self.root = os.path.abspath('tests/assets/tmp/settle')
+
+    def setUp(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content, mode='w'):
+        path = os.path.join(self.root, name)
+        with open(path, mode) as fh:
+            fh.write(content)
+        return path
+
+    def test_due(self):
+        """
+        Test SettleTracker.due() reports files once their quiet period passed.
+        """
+
+        tracker = SettleTracker(quiet=10)
+        x = self.write('x', 'x')
+        y = self.write('y', 'y')
+        tracker.touch(x, 0, ['a'])
+        tracker.touch(y, 5, ['a'])
+        tracker.touch(x, 6, ['b'])
+        assert tracker.next_deadline() == 15
+        assert tracker.due(14) == []
+
+        # y settled, x restarted its quiet period at 6
+        assert tracker.due(15) == [(y, ['a'])]
+        assert tracker.next_deadline() == 16
+
+        # x changed without a tracked change
+        self.write('x', 'more', mode='a')
+        assert tracker.due(16) == []
+        assert tracker.next_deadline() == 26
+        assert tracker.due(26) == [(x, ['a', 'b'])]
+        assert tracker.next_deadline() is None
+
+    def test_forget(self):
+        """
+        Test SettleTracker drops forgotten and deleted files.
+        """
+
+        tracker = SettleTracker(quiet=1)
+        x = self.write('x', 'x')
+        y = self.write('y', 'y')
+        tracker.touch(x, 0)
+        tracker.touch(y, 0)
+        tracker.forget(x)
+        os.remove(y)
+        assert tracker.due(1) == []
+        assert tracker.files == {}
+        assert tracker.next_deadline() is None
+
+    def test_heap_bounded(self):
+        """
+        Test SettleTracker.touch() drops superseded heap entries.
+        """
+
+        tracker = SettleTracker(quiet=1)
+        x = self.write('x', 'x')
+        for now in range(1000):
+            tracker.touch(x, now)
+        assert len(tracker.heap) <= 66
+        assert tracker.due(1000) == [(x, [])]
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,130 @@
+from yasmon.fingerprints import Fingerprinter, Fingerprints
+
+import unittest
+import asyncio
+import hashlib
+import shutil
+import os
+
+
+class FingerprinterTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(FingerprinterTest, self).__init__(*args, **kwargs)
+        self.root = os.path.abspath('tests/assets/tmp/fingerprints')
+
+    def setUp(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+        return path
+
+    def test_construction(self):
+        """
+        Test Fingerprinter construction with invalid algorithms.
+        """
+
+        assert Fingerprinter('blake2b').algorithm == 'blake2b'
+        self.assertRaises(ValueError, Fingerprinter, 'INVALID')
+        self.assertRaises(ValueError, Fingerprinter, 'shake_128')
+
+    def test_check(self):
+        """
+        Test Fingerprinter.check() detects content changes.
+        """
+
+        fingerprinter = Fingerprinter()
+        fingerprints = Fingerprints(fingerprinter)
+        path = self.write('x', 'content')
+        digest = hashlib.sha256(b'content').hexdigest()
+        loop = asyncio.new_event_loop()
+
+        assert loop.run_until_complete(fingerprints.check(path)) == \
+            (True, digest)
+        assert len(fingerprinter.cache) == 1
+
+        # touch only
+        os.utime(path, ns=(0, 0))
+        assert loop.run_until_complete(fingerprints.check(path)) == \
+            (False, digest)
+        assert len(fingerprinter.cache) == 2
+
+        # identical content
+        self.write('x', 'content')
+        assert loop.run_until_complete(fingerprints.check(path)) == \
+            (False, digest)
+
+        # changed content
+        self.write('x', 'changed')
+        assert loop.run_until_complete(fingerprints.check(path)) == \
+            (True, hashlib.sha256(b'changed').hexdigest())
+
+        # missing file
+        missing = os.path.join(self.root, 'missing')
+        assert loop.run_until_complete(fingerprints.check(missing)) == \
+            (True, None)
+        fingerprinter.close()
+        loop.close()
+
+    def test_cache_bounded(self):
+        """
+        Test Fingerprinter caches are bounded LRU caches.
+        """
+
+        fingerprinter = Fingerprinter(max_entries=2)
+        fingerprints = Fingerprints(fingerprinter)
+        paths = [self.write(name, name) for name in ['x', 'y', 'z']]
+        loop = asyncio.new_event_loop()
+        for path in paths:
+            loop.run_until_complete(fingerprints.check(path))
+        fingerprinter.close()
+        loop.close()
+        assert len(fingerprinter.cache) == 2
+        assert list(fingerprints.digests) == paths[1:]
+
+    def test_shared(self):
+        """
+        Test Fingerprints sharing a Fingerprinter hash a file once and keep
+        their own last fingerprints.
+        """
+
+        fingerprinter = Fingerprinter()
+        first = Fingerprints(fingerprinter)
+        second = Fingerprints(fingerprinter)
+        path = self.write('x', 'content')
+        digest = hashlib.sha256(b'content').hexdigest()
+        loop = asyncio.new_event_loop()
+
+        async def checks():
+            return await asyncio.gather(first.check(path),
+                                        second.check(path))
+
+        assert loop.run_until_complete(checks()) == \
+            [(True, digest), (True, digest)]
+        assert len(fingerprinter.cache) == 1
+        assert fingerprinter.hashing == {}
+
+        first.forget(path)
+        assert loop.run_until_complete(first.check(path)) == (True, digest)
+        assert loop.run_until_complete(second.check(path)) == \
+            (False, digest)
+
+        # thread pool is started again after closing
+        fingerprinter.close()
+        assert fingerprinter.executor is None
+        self.write('x', 'changed')
+        assert loop.run_until_complete(second.check(path)) == \
+            (True, hashlib.sha256(b'changed').hexdigest())
+        fingerprinter.close()
+        loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
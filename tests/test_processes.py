@@ -0,0 +1,164 @@
+from yasmon.processes import Process, ProcessLimits
+from yasmon.processes import ResourceUsage, ResourceStats
+
+from unittest import mock
+import unittest
+import asyncio
+import sys
+
+
+def run_process(*args, **kwargs):
+    """
+    Run a process to completion.
+
+    :return: process and its stdout
+    """
+    async def run():
+        proc = await Process.create(*args, **kwargs)
+        stdout = await proc.stdout.read()
+        await proc.wait()
+        return proc, stdout
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+class ProcessTest(unittest.TestCase):
+
+    def test_create(self):
+        """
+        Test Process.create() collects the exit code and resource usage.
+        """
+
+        proc, stdout = run_process(
+            [sys.executable, '-c',
+             'print(sum(range(10 ** 7))); raise SystemExit(3)'])
+        assert stdout == b'49999995000000\n'
+        assert proc.returncode == 3
+        assert proc.popen.returncode == 3
+        assert proc.usage.count == 1
+        assert proc.usage.user + proc.usage.system > 0
+        assert proc.usage.maxrss > 0
+
+        proc, stdout = run_process('echo $0', shell=True)
+        assert stdout == b'/bin/sh\n'
+        assert proc.returncode == 0
+
+    def test_stdin_kill(self):
+        """
+        Test Process stdin and kill().
+        """
+
+        async def run():
+            proc = await Process.create(['cat'], stdin=True)
+            proc.stdin.write(b'line\n')
+            line = await proc.stdout.readline()
+            proc.kill()
+            return line, await proc.wait()
+
+        loop = asyncio.new_event_loop()
+        assert loop.run_until_complete(run()) == (b'line\n', -9)
+        loop.close()
+
+    def test_reap_error(self):
+        """
+        Test Process.wait() raises errors of reaping the process.
+        """
+
+        async def run():
+            with mock.patch('os.wait4', side_effect=ChildProcessError(10)):
+                proc = await Process.create(['true'])
+                with self.assertRaises(ChildProcessError):
+                    await asyncio.wait_for(proc.wait(), 5)
+            proc.popen.wait()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        # thread fallback without pidfds
+        with mock.patch('os.pidfd_open', side_effect=OSError):
+            loop.run_until_complete(run())
+        loop.close()
+
+
+class ProcessLimitsTest(unittest.TestCase):
+
+    def test_apply(self):
+        """
+        Test ProcessLimits applies priority and limits to the process
+        before the command is executed.
+        """
+
+        limits = ProcessLimits(nice=5, ionice='idle', affinity=[0],
+                               rlimits={'nofile': 256, 'cpu': 30})
+        proc, stdout = run_process(
+            'nice; ionice -p $$; taskset -cp $$; ulimit -n; ulimit -t; '
+            'echo $$', shell=True, limits=limits)
+        lines = stdout.decode().splitlines()
+        assert lines[0] == '5'
+        assert lines[1] == 'idle'
+        assert lines[2].endswith(': 0')
+        assert lines[3:5] == ['256', '30']
+        # the command replaces the trampoline
+        assert lines[5] == str(proc.pid)
+        assert proc.returncode == 0
+
+        proc, stdout = run_process(['nice'], limits=ProcessLimits(nice=3))
+        assert stdout == b'3\n'
+
+    def test_invalid(self):
+        """
+        Test ProcessLimits() raises ValueError on invalid values.
+        """
+
+        for kwargs in [{'nice': 'x'}, {'nice': 100}, {'ionice': 'low'},
+                       {'ionice': 'best-effort', 'ionice_level': 8},
+                       {'affinity': []}, {'affinity': [-1]},
+                       {'affinity': 0}, {'rlimits': {'stack': 1}},
+                       {'rlimits': {'cpu': -1}},
+                       {'rlimits': {'nofile': 2 ** 40}}]:
+            self.assertRaises(ValueError, ProcessLimits, **kwargs)
+
+        # settings failing to apply surface as OSError
+        async def run():
+            await Process.create(['sleep', '1'], limits=ProcessLimits(
+                affinity=[4096]))
+
+        loop = asyncio.new_event_loop()
+        self.assertRaises(OSError, loop.run_until_complete, run())
+
+        # so do commands failing to execute
+        async def run():
+            await Process.create(['DOES_NOT_EXIST'], limits=ProcessLimits(
+                nice=1))
+
+        self.assertRaises(FileNotFoundError, loop.run_until_complete, run())
+        loop.close()
+
+
+class ResourceStatsTest(unittest.TestCase):
+
+    def test_record(self):
+        """
+        Test ResourceStats aggregates usage per callback and per task.
+        """
+
+        stats = ResourceStats()
+        stats.record('a', 'x', 1, 0, ResourceUsage(1, 1.0, 0.5, 100, 1, 2))
+        stats.record('a', None, 2, 0, ResourceUsage(1, 2.0, 0.5, 50, 1, 2))
+        stats.record('b', 'x', 3, 1, ResourceUsage(1, 1.0, 1.0, 200, 0, 0))
+        assert stats.callbacks['a'] == ResourceUsage(2, 3.0, 1.0, 100, 2, 4)
+        assert stats.tasks == {'x': ResourceUsage(2, 2.0, 1.5, 200, 1, 2)}
+
+        merged = ResourceStats()
+        merged.merge(stats)
+        merged.merge(stats)
+        assert merged.as_dict()['callbacks']['b'] == {
+            'count': 2, 'user': 2.0, 'system': 2.0, 'maxrss': 200,
+            'inblock': 0, 'oublock': 0}
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
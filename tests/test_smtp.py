@@ -0,0 +1,520 @@
+import unittest
+from unittest import mock
+import email.message
+import tempfile
+import asyncio
+import ssl
+import os
+
+from yasmon.smtp import SMTPPool, MailOutbox
+from yasmon.callbacks import MailCallback, CallbackError
+from loguru import logger
+
+CERT = 'tests/assets/smtp_test.pem'
+
+
+class SMTPServer:
+    """
+    Minimal SMTP server accepting any login and mail.
+    """
+
+    def __init__(self, implicit_tls: bool = False):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(CERT)
+        self.implicit_tls = implicit_tls
+        self.connections = 0
+        self.logins = 0
+        self.messages: list[bytes] = []
+        self.rejects = 0
+        self.commands: list[str] = []
+        self.writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> int:
+        context = self.context if self.implicit_tls else None
+        self.server = await asyncio.start_server(
+            self.handle, '127.0.0.1', 0, ssl=context)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.drop()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop(self):
+        """
+        Close all connections without a goodbye.
+        """
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        self.connections += 1
+        self.writers.add(writer)
+        tls = self.implicit_tls
+
+        def reply(line: str):
+            writer.write(f'{line}\r\n'.encode())
+
+        reply('220 localhost ESMTP')
+        try:
+            while line := await reader.readline():
+                command = line.decode().strip()
+                verb = command.split(' ')[0].upper()
+                self.commands.append(verb)
+                match verb:
+                    case 'EHLO':
+                        reply('250-localhost')
+                        if not tls:
+                            reply('250-STARTTLS')
+                        reply('250 AUTH PLAIN LOGIN')
+                    case 'STARTTLS':
+                        reply('220 ready')
+                        await writer.drain()
+                        await writer.start_tls(self.context)
+                        tls = True
+                    case 'AUTH':
+                        self.logins += 1
+                        reply('235 authenticated')
+                    case 'DATA':
+                        reply('354 go ahead')
+                        data = b''
+                        while (line := await reader.readline()) != b'.\r\n':
+                            data += line
+                        if self.rejects > 0:
+                            self.rejects -= 1
+                            reply('451 try again later')
+                        else:
+                            self.messages.append(data)
+                            reply('250 queued')
+                    case 'QUIT':
+                        reply('221 bye')
+                        await writer.drain()
+                        break
+                    case _:
+                        reply('250 ok')
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+class SMTPPoolTest(unittest.TestCase):
+    def context(self) -> ssl.SSLContext:
+        return ssl.create_default_context(cafile=CERT)
+
+    def message(self, subject: str) -> email.message.EmailMessage:
+        message = email.message.EmailMessage()
+        message['Subject'] = subject
+        message['From'] = 'from@localhost'
+        message['To'] = 'to@localhost'
+        message.set_content('some message')
+        return message
+
+    def test_send_many(self):
+        """
+        Test that send_many() sends over one session and reports errors.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            server.rejects = 1
+            messages = [self.message(f'mail {n}') for n in range(4)]
+            errors = await loop.run_in_executor(None, pool.send_many,
+                                                messages)
+            assert errors[0].smtp_code == 451
+            assert errors[1:] == [None] * 3
+            assert len(server.messages) == 3
+            assert pool.connects == 2
+
+        self.run_scenario(scenario)
+
+        async def unreachable():
+            pool = SMTPPool('localhost', 1, 'login', 'password', 'starttls')
+            loop = asyncio.get_running_loop()
+            errors = await loop.run_in_executor(
+                None, pool.send_many, [self.message('a'), self.message('b')])
+            assert isinstance(errors[0], OSError)
+            assert errors[1] is errors[0]
+            assert pool.connects == 0
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(unreachable())
+        loop.close()
+
+    def run_scenario(self, scenario, implicit_tls: bool = False, **kwargs):
+        async def run():
+            server = SMTPServer(implicit_tls)
+            port = await server.start()
+            security = 'ssl' if implicit_tls else 'starttls'
+            pool = SMTPPool('localhost', port, 'login', 'password', security,
+                            context=self.context(), **kwargs)
+            try:
+                await scenario(server, pool)
+            finally:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, pool.clear)
+                await server.close()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_reuse(self):
+        """
+        Test that subsequent mails are sent over a single session.
+        """
+
+        for implicit_tls in [False, True]:
+            async def scenario(server, pool):
+                loop = asyncio.get_running_loop()
+                for n in range(3):
+                    await loop.run_in_executor(None, pool.send,
+                                               self.message(f'mail {n}'))
+                assert len(server.messages) == 3
+                assert b'Subject: mail 2' in server.messages[2]
+                assert server.connections == 1
+                assert server.logins == 1
+                assert pool.connects == 1
+                assert len(pool.sessions) == 1
+
+            self.run_scenario(scenario, implicit_tls)
+
+    def test_concurrent(self):
+        """
+        Test that concurrent mails open at most size sessions.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(None, pool.send,
+                                     self.message(f'mail {n}'))
+                for n in range(6)])
+            assert len(server.messages) == 6
+            assert 1 <= pool.connects <= 2
+            assert len(pool.sessions) == pool.connects
+
+        self.run_scenario(scenario, size=2)
+
+    def test_reconnect(self):
+        """
+        Test that a mail is resent over a new session if the server closed
+        the pooled session.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, pool.send, self.message('a'))
+            server.drop()
+            await asyncio.sleep(0.1)
+            await loop.run_in_executor(None, pool.send, self.message('b'))
+            assert len(server.messages) == 2
+            assert server.connections == 2
+            assert pool.connects == 2
+
+        self.run_scenario(scenario)
+
+    def test_keepalive(self):
+        """
+        Test that idle sessions are checked by NOOP before reuse and closed
+        after idle_timeout.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, pool.send, self.message('a'))
+            await asyncio.sleep(0.2)
+            await loop.run_in_executor(None, pool.send, self.message('b'))
+            assert 'NOOP' in server.commands
+            assert pool.connects == 1
+
+            server.drop()
+            await asyncio.sleep(0.2)
+            await loop.run_in_executor(None, pool.send, self.message('c'))
+            assert pool.connects == 2
+
+            await asyncio.sleep(0.5)
+            await loop.run_in_executor(None, pool.send, self.message('d'))
+            assert pool.connects == 3
+            assert len(server.messages) == 4
+
+        self.run_scenario(scenario, keepalive=0.1, idle_timeout=0.4)
+
+    def test_refresh(self):
+        """
+        Test that refresh() closes dead and expired sessions only.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, pool.send, self.message('a'))
+            await loop.run_in_executor(None, pool.refresh)
+            assert len(pool.sessions) == 1
+
+            await asyncio.sleep(0.2)
+            await loop.run_in_executor(None, pool.refresh)
+            assert len(pool.sessions) == 1
+            assert 'NOOP' in server.commands
+
+            server.drop()
+            await asyncio.sleep(0.2)
+            await loop.run_in_executor(None, pool.refresh)
+            assert len(pool.sessions) == 0
+
+            await loop.run_in_executor(None, pool.send, self.message('b'))
+            await asyncio.sleep(0.5)
+            await loop.run_in_executor(None, pool.refresh)
+            assert len(pool.sessions) == 0
+            assert server.commands[-1] == 'QUIT'
+
+        self.run_scenario(scenario, keepalive=0.1, idle_timeout=0.4)
+
+    def test_clear(self):
+        """
+        Test that clear() closes idle sessions.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, pool.send, self.message('a'))
+            await loop.run_in_executor(None, pool.clear)
+            assert pool.sessions == []
+            await asyncio.sleep(0.1)
+            assert server.commands[-1] == 'QUIT'
+            assert server.writers == set()
+
+        self.run_scenario(scenario)
+
+    def test_errors(self):
+        """
+        Test that errors of new sessions are raised.
+        """
+
+        async def scenario(server, pool):
+            loop = asyncio.get_running_loop()
+            with self.assertRaises(ssl.SSLCertVerificationError):
+                await loop.run_in_executor(None, pool.send,
+                                           self.message('a'))
+            assert pool.sessions == []
+
+        async def run():
+            server = SMTPServer()
+            port = await server.start()
+            pool = SMTPPool('localhost', port, 'login', 'password',
+                            'starttls')
+            try:
+                await scenario(server, pool)
+            finally:
+                await server.close()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_get(self):
+        """
+        Test that pools are shared per server and credentials.
+        """
+
+        pool = SMTPPool.get('host', 25, 'login', 'password', 'starttls')
+        assert SMTPPool.get('host', 25, 'login', 'password',
+                            'starttls') is pool
+        assert SMTPPool.get('host', 25, 'other', 'password',
+                            'starttls') is not pool
+        changed = SMTPPool.get('host', 25, 'login', 'changed', 'starttls')
+        assert changed is not pool
+        assert SMTPPool.get('host', 25, 'login', 'password',
+                            'starttls') is pool
+        assert pool.context is pool.context
+
+        for key in list(SMTPPool.pools):
+            if key[0] == 'host':
+                del SMTPPool.pools[key]
+
+
+class MailOutboxTest(unittest.TestCase):
+    def message(self, subject: str) -> email.message.EmailMessage:
+        return SMTPPoolTest.message(self, subject)
+
+    def run_scenario(self, scenario, port: int = 0, **kwargs):
+        async def run():
+            server = SMTPServer()
+            server_port = await server.start()
+            pool = SMTPPool('localhost', port or server_port, 'login',
+                            'password', 'starttls',
+                            context=ssl.create_default_context(cafile=CERT))
+            outbox = MailOutbox(pool, **kwargs)
+            try:
+                await scenario(server, outbox)
+            finally:
+                await server.close()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_batches(self):
+        """
+        Test that queued mails are sent in batches over pooled sessions.
+        """
+
+        async def scenario(server, outbox):
+            await outbox.start()
+            await outbox.start()
+            assert outbox.running
+            for n in range(20):
+                await outbox.put(self.message(f'mail {n}'))
+            await outbox.queue.join()
+            assert len(server.messages) == 20
+            assert outbox.sent == 20
+            assert server.connections <= 2
+            await outbox.stop()
+            assert outbox.running
+            await outbox.stop()
+            assert not outbox.running
+            assert outbox.pool.sessions == []
+
+        self.run_scenario(scenario, workers=2, batch=5)
+
+    def test_retry(self):
+        """
+        Test that failed mails are retried with backoff.
+        """
+
+        async def scenario(server, outbox):
+            await outbox.start()
+            server.rejects = 2
+            await outbox.put(self.message('mail'))
+            await asyncio.sleep(0.1)
+            assert server.messages == []
+            assert len(outbox.delayed) == 1
+            await asyncio.sleep(0.4)
+            assert len(server.messages) == 1
+            assert outbox.sent == 1
+            assert outbox.spooled == 0
+            await outbox.stop()
+
+        self.run_scenario(scenario, backoff=0.1)
+
+    def test_spool(self):
+        """
+        Test that mails failing all retries are spooled and queued again
+        once the outbox is started.
+        """
+
+        messages = []
+        handler = logger.add(messages.append, level='ERROR')
+        with tempfile.TemporaryDirectory() as spool:
+            async def unreachable(server, outbox):
+                await outbox.start(spool)
+                for n in range(3):
+                    await outbox.put(self.message(f'mail {n}'), spool,
+                                     'mail0')
+                await asyncio.sleep(0.3)
+                assert outbox.spooled == 3
+                assert any('in callback mail0 mail to to@localhost via'
+                           in message for message in messages)
+                await outbox.put(self.message('mail 3'), spool)
+                await outbox.put(self.message('lost'))
+                await outbox.stop()
+                assert outbox.spooled == 4
+
+            try:
+                self.run_scenario(unreachable, port=1, retries=1,
+                                  backoff=0.05)
+            finally:
+                logger.remove(handler)
+            assert len(os.listdir(spool)) == 4
+
+            async def reachable(server, outbox):
+                await outbox.start(spool)
+                await outbox.queue.join()
+                assert len(server.messages) == 4
+                assert b'Subject: mail 0' in server.messages[0]
+                assert os.listdir(spool) == []
+                await outbox.stop()
+
+            self.run_scenario(reachable)
+
+    def test_not_started(self):
+        """
+        Test that MailOutbox.put() raises CallbackError unless started.
+        """
+
+        async def scenario(server, outbox):
+            with self.assertRaises(CallbackError):
+                await outbox.put(self.message('mail'))
+
+        self.run_scenario(scenario)
+
+    def test_shared(self):
+        """
+        Test that outboxes are shared per pool.
+        """
+
+        pool = SMTPPool('host', 25, 'login', 'password', 'starttls')
+        other = SMTPPool('host', 25, 'other', 'password', 'starttls')
+        outbox = MailOutbox.get(pool)
+        assert MailOutbox.get(pool) is outbox
+        assert MailOutbox.get(other) is not outbox
+        del MailOutbox.outboxes[pool]
+        del MailOutbox.outboxes[other]
+
+
+class MailCallbackPoolTest(unittest.TestCase):
+    def test_outbox(self):
+        """
+        Test that started MailCallbacks queue mails in a shared outbox,
+        which is stopped with the last callback, and that other
+        MailCallbacks send directly.
+        """
+
+        async def run():
+            server = SMTPServer()
+            port = await server.start()
+            mails = [MailCallback(name, 'localhost', port, 'login',
+                                  'password', 'starttls', 'to@localhost',
+                                  'subject {n}', 'from@localhost',
+                                  'message', [], 0)
+                     for name in ['mail0', 'mail1']]
+            pool = mails[0].pool
+            outbox = mails[0].outbox
+            assert mails[1].pool is pool
+            assert mails[1].outbox is outbox
+            pool.ssl_context = ssl.create_default_context(cafile=CERT)
+            pool.keepalive = 0.1
+            task = mock.Mock()
+            task.name = 'task'
+            try:
+                await mails[0](task, {'n': 'direct'})
+                assert len(server.messages) == 1
+
+                for mail in mails:
+                    await mail.start()
+                for n in range(2):
+                    for mail in mails:
+                        await mail(task, {'n': str(n)})
+                await asyncio.sleep(0.35)
+                assert len(server.messages) == 5
+                assert outbox.sent == 4
+                assert server.connections == 1
+                assert server.commands.count('NOOP') >= 2
+
+                await mails[0].stop()
+                assert outbox.running
+                await mails[1].stop()
+                assert not outbox.running
+                assert pool.sessions == []
+            finally:
+                await server.close()
+                del MailOutbox.outboxes[pool]
+                del SMTPPool.pools[('localhost', port, 'login', 'password',
+                                    'starttls')]
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
@@ -1,13 +1,53 @@
 from yasmon.processor import YAMLProcessor
 from yasmon.tasks import WatchfilesTask, TaskSyntaxError
-from yasmon.tasks import TaskError, TaskRunner, TaskList
-from yasmon.callbacks import CallbackAttributeError
+from yasmon.tasks import TaskError, TaskRunner, TaskList, WatchManager
+from yasmon.tasks import CallbackDispatcher, PathFilter
+from yasmon.callbacks import CallbackAttributeError, ShellCallback
 from yasmon.callbacks import CallbackCircularAttributeError
+from yasmon.templates import Template
+from yasmon.conditions import Condition
+from yasmon.processes import ResourceUsage
+from yasmon.checkpoints import Checkpoint
 
+from loguru import logger
 import watchfiles
 import unittest
+import asyncio
 import time
 import subprocess
+import os
+import shutil
+import pathlib
+import threading
+import hashlib
+import socket
+
+
+class RecordingCallback:
+    """
+    Minimal callback recording its calls.
+    """
+
+    def __init__(self, name='recorder', delay=0, templates=(), when=None):
+        self.name = name
+        self.delay = delay
+        self.when = None if when is None else Condition(when)
+        self.calls = []
+        self.lifecycle = []
+        self._templates = [Template(template) for template in templates]
+
+    async def __call__(self, task, attrs):
+        await asyncio.sleep(self.delay)
+        self.calls.append(attrs)
+
+    def templates(self):
+        return self._templates
+
+    async def start(self):
+        self.lifecycle.append('start')
+
+    async def stop(self):
+        self.lifecycle.append('stop')
 
 
 class TaskRunnerTest(unittest.TestCase):
@@ -72,6 +112,48 @@ class TaskRunnerTest(unittest.TestCase):
 
         assert exited is True
 
+    def test_call_callback_lifecycle(self):
+        """
+        Test that TaskRunner.__call__() starts and stops shared callbacks
+        once.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/tmp/
+        """
+        callback = RecordingCallback()
+        tasks = [WatchfilesTask.from_yaml(name, data, [callback])
+                 for name in ['task0', 'task1']]
+        runner = TaskRunner(tasks, testenv=True)
+        runner.loop.run_until_complete(runner())
+        assert callback.lifecycle == ['start', 'stop']
+
+    def test_stats(self):
+        """
+        Test TaskRunner.stats() aggregates the resource usage of callbacks.
+        """
+
+        callbacks = [ShellCallback('a', cmd='true'),
+                     ShellCallback('b', cmd='true'), RecordingCallback()]
+        for callback in callbacks[:2]:
+            callback.stats.record(callback.name, 'task0', 1, 0,
+                                  ResourceUsage(1, 1.0, 0.5, 100, 1, 2))
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/tmp/
+        """
+        task = WatchfilesTask.from_yaml('task0', data, callbacks)
+        runner = TaskRunner([task], testenv=True)
+        runner.loop.run_until_complete(runner())
+        stats = runner.stats()
+        assert set(stats.callbacks) == {'a', 'b'}
+        assert stats.tasks['task0'] == ResourceUsage(2, 2.0, 1.0, 100, 2, 4)
+
     def test_call_propagate_exceptions(self):
         """
         Test that TaskRunner.__call__() propagates exceptions.
@@ -239,6 +321,7 @@ class WatchfilesTaskTest(unittest.TestCase):
         assert task.attrs == {}
         assert task.timeout == 30
         assert task.max_retry == 5
+        assert task.watcher == 'callback'
 
         # fully specified
         data = """
@@ -254,6 +337,7 @@ class WatchfilesTaskTest(unittest.TestCase):
             myattr2: value2
         timeout: 10
         max_retry: 7
+        watcher: task
         """
         task = WatchfilesTask.from_yaml("name", data, [])
         assert task.name == 'name'
@@ -272,6 +356,95 @@ class WatchfilesTaskTest(unittest.TestCase):
         }
         assert task.timeout == 10
         assert task.max_retry == 7
+        assert task.watcher == 'task'
+
+        # dispatch queue
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        dispatch:
+            workers: 3
+            queue_size: 10
+            overflow: drop_oldest
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.run().dispatcher.num_workers == 3
+        assert task.run().dispatcher.queue_size == 10
+        assert task.run().dispatcher.overflow == 'drop_oldest'
+
+        # debounce
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        debounce: 0.5
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.debounce == 0.5
+
+        # path filter
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        include:
+            - "*.csv"
+        exclude_regex:
+            - "/tmp/"
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert isinstance(task.watch_filter, PathFilter)
+        assert task.watch_filter.include is not None
+        assert task.watch_filter.exclude is not None
+
+        # recovery
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        recovery: watch
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.recovery == 'watch'
+
+        # checkpoint
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        checkpoint: tests/assets/tmp.idx
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.checkpoint.path == 'tests/assets/tmp.idx'
+
+        # settle
+        data = """
+        changes:
+            - settled
+        paths:
+            - tests/assets/config.yaml
+        settle: 2.5
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.run().settling.quiet == 2.5
+
+        # fingerprint
+        data = """
+        changes:
+            - modified
+        paths:
+            - tests/assets/config.yaml
+        fingerprint: blake2b
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        assert task.fingerprinter.algorithm == 'blake2b'
+        assert task.run().fingerprints.fingerprinter is task.fingerprinter
 
     def test_from_yaml_raise_TaskSyntaxError(self):
         """
@@ -491,6 +664,117 @@ class WatchfilesTaskTest(unittest.TestCase):
         """
         self.assertRaises(TaskSyntaxError, fun, "name", data, [])
 
+        # invalid watcher
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        watcher: INVALID
+        """
+        self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid dispatch
+        for dispatch in ['[]', '{workers: 0}', '{queue_size: -1}',
+                         '{overflow: INVALID}', '{INVALID: 1}']:
+            data = f"""
+            changes:
+                - added
+            paths:
+                - tests/assets/config.yaml
+            dispatch: {dispatch}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid debounce
+        for debounce in ['-1', 'INVALID', 'true']:
+            data = f"""
+            changes:
+                - added
+            paths:
+                - tests/assets/config.yaml
+            debounce: {debounce}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid settle
+        for settle in ['0', 'INVALID', 'true']:
+            data = f"""
+            changes:
+                - settled
+            paths:
+                - tests/assets/config.yaml
+            settle: {settle}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid fingerprint
+        for fingerprint in ['INVALID', 'shake_128', '[]']:
+            data = f"""
+            changes:
+                - modified
+            paths:
+                - tests/assets/config.yaml
+            fingerprint: {fingerprint}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid when
+        for when in ['"size >"', '"__import__(\'os\')"', '"path.__class__"',
+                     '[]']:
+            data = f"""
+            changes:
+                - added
+            paths:
+                - tests/assets/config.yaml
+            when: {when}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid recovery
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        recovery: INVALID
+        """
+        self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # recovery watch with global watcher
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        recovery: watch
+        watcher: global
+        """
+        self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # missing checkpoint directory
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        checkpoint: tests/assets/DOES_NOT_EXIST/task.idx
+        """
+        self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
+        # invalid path filters
+        for pattern in ['include: "*.csv"', 'exclude: [[]]',
+                        'include_regex: ["(unbalanced"]',
+                        'match: "(?P<x>.*)"', 'match: ["(?P<x"]']:
+            data = f"""
+            changes:
+                - added
+            paths:
+                - tests/assets/config.yaml
+            {pattern}
+            """
+            self.assertRaises(TaskSyntaxError, fun, "name", data, [])
+
     def test_call_testenv(self):
         """
         Test if WatchfilesTask.__call__() runs through.
@@ -528,37 +812,1035 @@ class WatchfilesTaskTest(unittest.TestCase):
             self.fail()
         self.stop_input_producer()
 
-    def test_call_raise_exceptions(self):
+    def test_process_changes_debounce(self):
         """
-        Test if WatchfilesTask.__call__() raises TaskError.
+        Test if WatchfilesTask.process_changes() coalesces changes.
         """
 
-        # TaskError on watched file deleted
-        test_yaml = """
-        callbacks:
-            callback0:
-                type: shell
-                command: exit 0;
-        tasks:
-            watchfilestask:
-                type: watchfiles
-                changes:
-                    - modified
-                paths:
-                    - tests/assets/tmp/watchfiles_test.sh.pid
-                callbacks:
-                    - callback0
-                max_retry: 2
-                timeout: 1
+        data = """
+        changes:
+            - modified
+        paths:
+            - tests/assets/config.yaml
+        debounce: 0.2
         """
-        self.start_input_producer()
-        self.proc.load_document(test_yaml)
-        callbacks = self.proc.get_callbacks()
-        tasks = self.proc.get_tasks(callbacks)
-        runner = TaskRunner(tasks)
-        fun = runner.loop.run_until_complete
-        self.assertRaises(TaskError, fun, runner())
-        self.stop_input_producer()
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        modified = watchfiles.Change.modified
+        added = watchfiles.Change.added
+
+        async def run():
+            for _ in range(3):
+                await task.process_changes({(modified, '/a'),
+                                            (added, '/a')}, [callback])
+                await asyncio.sleep(0.05)
+            await task.process_changes({(modified, '/b')}, [callback])
+            await asyncio.sleep(0.3)
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+        assert callback.calls == [
+            {'change': 'modified', 'path': '/a', 'count': 3},
+            {'change': 'modified', 'path': '/b', 'count': 1},
+        ]
+
+    def test_process_changes_debounce_error(self):
+        """
+        Test if WatchfilesTask.flush() errors are logged once the flush
+        finished and raised by the next batch of changes.
+        """
+
+        class FailingCallback(RecordingCallback):
+            async def __call__(self, task, attrs):
+                raise CallbackAttributeError('attr')
+
+        data = """
+        changes:
+            - modified
+        paths:
+            - tests/assets/config.yaml
+        debounce: 0.1
+        """
+        callback = FailingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        modified = watchfiles.Change.modified
+        messages = []
+        handler = logger.add(messages.append, level='ERROR')
+
+        async def run():
+            await task.process_changes({(modified, '/a')}, [callback])
+            await asyncio.sleep(0.2)
+            assert any('passing on debounced changes failed' in message
+                       for message in messages)
+            await task.process_changes({(modified, '/b')}, [callback])
+
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertRaises(CallbackAttributeError, loop.run_until_complete,
+                              run())
+        finally:
+            logger.remove(handler)
+            loop.run_until_complete(task.stop())
+            loop.close()
+
+    def test_runs(self):
+        """
+        Test if watch runs of different callbacks keep their own state.
+        """
+
+        data = """
+        changes:
+            - modified
+        paths:
+            - tests/assets/config.yaml
+        debounce: 0.2
+        dispatch:
+            workers: 1
+        """
+        callback0 = RecordingCallback('callback0')
+        callback1 = RecordingCallback('callback1')
+        task = WatchfilesTask.from_yaml("name", data, [callback0, callback1])
+        modified = watchfiles.Change.modified
+
+        async def run():
+            await task.process_changes({(modified, '/a')}, [callback0])
+            await task.process_changes({(modified, '/a')}, [callback1])
+            assert task.run([callback0]) is not task.run([callback1])
+            assert task.run([callback0]).pending
+            await task.stop([callback0])
+            assert list(task.runs) == [(callback1,)]
+            await asyncio.sleep(0.3)
+            await task.run([callback1]).dispatcher.queue.join()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.run_until_complete(task.stop())
+        loop.close()
+
+        assert callback0.calls == []
+        assert callback1.calls == [
+            {'change': 'modified', 'path': '/a', 'count': 1}]
+        assert task.runs == {}
+
+    def test_catch_up(self):
+        """
+        Test if WatchfilesTask.catch_up() passes on missed changes.
+        """
+
+        root = 'tests/assets/tmp/catch_up'
+        index = 'tests/assets/tmp/catch_up.idx'
+        shutil.rmtree(root, ignore_errors=True)
+        if os.path.exists(index):
+            os.remove(index)
+        os.makedirs(root)
+
+        data = f"""
+        changes:
+            - added
+            - modified
+        paths:
+            - {root}
+        checkpoint: {index}
+        exclude:
+            - "*.tmp"
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        task.abs_paths = {os.path.abspath(root)}
+
+        # index is persisted upon stop()
+        for name in ['a', 'b']:
+            with open(os.path.join(root, name), 'w') as fh:
+                fh.write(name)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(task.catch_up())
+        assert len(callback.calls) == 2
+        loop.run_until_complete(task.stop())
+        assert os.path.exists(index)
+
+        # changes while not running
+        callback.calls.clear()
+        with open(os.path.join(root, 'a'), 'w') as fh:
+            fh.write('modified')
+        for name in ['c', 'd.tmp']:
+            with open(os.path.join(root, name), 'w') as fh:
+                fh.write(name)
+        os.remove(os.path.join(root, 'b'))
+
+        loop.run_until_complete(task.catch_up())
+        loop.run_until_complete(task.catch_up())
+        loop.close()
+        calls = sorted((c['change'], c['path']) for c in callback.calls)
+        assert calls == [
+            ('added', os.path.abspath(os.path.join(root, 'c'))),
+            ('modified', os.path.abspath(os.path.join(root, 'a'))),
+        ]
+
+        shutil.rmtree(root, ignore_errors=True)
+        os.remove(index)
+
+    def test_stop_checkpoint_error(self):
+        """
+        Test if WatchfilesTask.stop() logs errors saving the checkpoint.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/
+        checkpoint: tests/assets/task.idx
+        """
+        task = WatchfilesTask.from_yaml("name", data, [RecordingCallback()])
+        task.checkpoint = Checkpoint('tests/assets/DOES_NOT_EXIST/task.idx')
+        task.abs_paths = {os.path.abspath('tests/assets/')}
+        task.run().caught_up = True
+        messages = []
+        handler = logger.add(messages.append, level='ERROR')
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(task.stop())
+        finally:
+            logger.remove(handler)
+            loop.close()
+
+        assert any('saving checkpoint' in message for message in messages)
+        assert task.runs == {}
+
+    def test_watch_checkpoint_error(self):
+        """
+        Test if WatchfilesTask.watch() logs checkpoint errors once and
+        keeps watching instead of catching up again.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        checkpoint: tests/assets/task.idx
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        task.checkpoint = Checkpoint('tests/assets/DOES_NOT_EXIST/task.idx')
+        messages = []
+        handler = logger.add(messages.append, level='ERROR')
+
+        async def run():
+            watching = asyncio.ensure_future(task.watch([callback]))
+            await asyncio.sleep(1)
+            assert not watching.done()
+            watching.cancel()
+            await asyncio.gather(watching, return_exceptions=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            logger.remove(handler)
+            loop.close()
+
+        assert len([message for message in messages
+                    if 'catching up from checkpoint' in message]) == 1
+        assert task.run([callback]).caught_up is False
+
+    def test_catching_up(self):
+        """
+        Test if WatchManager.catching_up() arms the watcher before the
+        catch-up and ends both upon errors.
+        """
+
+        order = []
+        cancelled = []
+
+        async def watching():
+            order.append('watching')
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append('watching')
+                raise
+
+        async def catching():
+            order.append('catching')
+            raise CallbackAttributeError('failed')
+
+        loop = asyncio.new_event_loop()
+        self.assertRaises(CallbackAttributeError, loop.run_until_complete,
+                          WatchManager.catching_up(watching(), catching()))
+        loop.close()
+
+        assert order == ['watching', 'catching']
+        assert cancelled == ['watching']
+
+    def test_process_changes_roots(self):
+        """
+        Test if WatchfilesTask.process_changes() drops changes of roots
+        not passing the filter.
+        """
+
+        data = """
+        changes:
+            - modified
+        paths:
+            - tests/assets/
+        include:
+            - "*.csv"
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        root = os.path.abspath('tests/assets')
+        task.watch_filter.roots = {root}
+        modified = watchfiles.Change.modified
+        changes = {(modified, root), (modified, f'{root}/a.csv')}
+        assert all(task.watch_filter(*change) for change in changes)
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(task.process_changes(changes, [callback]))
+        loop.close()
+
+        assert callback.calls == [
+            {'change': 'modified', 'path': f'{root}/a.csv'}]
+
+    def test_process_changes_moved(self):
+        """
+        Test if WatchfilesTask.process_changes() derives moved changes.
+        """
+
+        data = """
+        changes:
+            - moved
+            - deleted
+        paths:
+            - tests/assets/config.yaml
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        assert task.watch_filter(watchfiles.Change.added, '/a') is True
+
+        root = os.path.abspath('tests/assets/tmp/moved')
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(os.path.join(root, 'sub'))
+        src = os.path.join(root, 'sub', 'dest')
+        dest = os.path.join(root, 'dest')
+        with open(src, 'w') as fh:
+            fh.write('dest')
+        task.run([callback]).renames.remember(src)
+        os.rename(src, dest)
+        changes = {
+            (watchfiles.Change.deleted, src),
+            (watchfiles.Change.added, dest),
+            (watchfiles.Change.deleted, os.path.join(root, 'gone')),
+        }
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(task.process_changes(changes, [callback]))
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+        assert callback.calls == [
+            {'change': 'moved', 'path': dest,
+             'src_path': src, 'dest_path': dest},
+            {'change': 'deleted', 'path': os.path.join(root, 'gone')},
+        ]
+
+    def test_process_changes_settled(self):
+        """
+        Test if WatchfilesTask.process_changes() reports settled files once.
+        """
+
+        data = """
+        changes:
+            - settled
+        paths:
+            - tests/assets/config.yaml
+        settle: 0.2
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        assert task.watch_filter(watchfiles.Change.modified, '/a') is True
+
+        root = os.path.abspath('tests/assets/tmp/settled')
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        upload = os.path.join(root, 'upload')
+        gone = os.path.join(root, 'gone')
+        for path in [upload, gone]:
+            with open(path, 'w') as fh:
+                fh.write('0')
+
+        async def run():
+            await task.process_changes({(watchfiles.Change.added, upload),
+                                        (watchfiles.Change.added, gone)},
+                                       [callback])
+            os.remove(gone)
+            await task.process_changes({(watchfiles.Change.deleted, gone)},
+                                       [callback])
+            for i in range(3):
+                await asyncio.sleep(0.1)
+                with open(upload, 'a') as fh:
+                    fh.write(str(i))
+                await task.process_changes(
+                    {(watchfiles.Change.modified, upload)}, [callback])
+            assert callback.calls == []
+            await asyncio.sleep(0.4)
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+        assert callback.calls == [{'change': 'settled', 'path': upload}]
+        assert task.run([callback]).settler is None
+
+    def test_process_changes_fingerprint(self):
+        """
+        Test if WatchfilesTask.process_changes() drops no-op modifications.
+        """
+
+        data = """
+        changes:
+            - added
+            - modified
+            - deleted
+        paths:
+            - tests/assets/config.yaml
+        fingerprint: sha256
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+
+        root = os.path.abspath('tests/assets/tmp/fingerprint')
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        path = os.path.join(root, 'file')
+
+        def write(content):
+            with open(path, 'w') as fh:
+                fh.write(content)
+
+        async def run():
+            write('a')
+            await task.process_changes({(watchfiles.Change.added, path)},
+                                       [callback])
+            write('a')
+            await task.process_changes({(watchfiles.Change.modified, path)},
+                                       [callback])
+            write('b')
+            await task.process_changes({(watchfiles.Change.modified, path)},
+                                       [callback])
+            os.remove(path)
+            await task.process_changes({(watchfiles.Change.deleted, path)},
+                                       [callback])
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+        def digest(content):
+            return hashlib.sha256(content).hexdigest()
+
+        assert callback.calls == [
+            {'change': 'added', 'path': path, 'hash': digest(b'a')},
+            {'change': 'modified', 'path': path, 'hash': digest(b'b')},
+            {'change': 'deleted', 'path': path, 'hash': ''},
+        ]
+
+    def test_process_changes_fingerprint_shared(self):
+        """
+        Test if the watch runs of a task share fingerprinting, i.e. a file is
+        hashed once for all callbacks and no threads are left after stop.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        fingerprint: sha256
+        """
+        callbacks = [RecordingCallback() for _ in range(5)]
+        task = WatchfilesTask.from_yaml("name", data, callbacks)
+
+        root = os.path.abspath('tests/assets/tmp/fingerprint_shared')
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        path = os.path.join(root, 'file')
+        with open(path, 'w') as fh:
+            fh.write('a')
+
+        hashed = []
+        hash = task.fingerprinter.hash
+
+        def counting(path):
+            hashed.append(path)
+            return hash(path)
+
+        task.fingerprinter.hash = counting
+
+        async def run():
+            changes = {(watchfiles.Change.added, path)}
+            await asyncio.gather(*(task.process_changes(changes, [callback])
+                                   for callback in callbacks))
+            await task.stop()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+        digest = hashlib.sha256(b'a').hexdigest()
+        for callback in callbacks:
+            assert callback.calls == [
+                {'change': 'added', 'path': path, 'hash': digest}]
+        assert hashed == [path]
+        assert task.runs == {}
+        assert task.fingerprinter.executor is None
+
+        threads = [thread for thread in threading.enumerate()
+                   if thread.name.startswith('fingerprint')]
+        for thread in threads:
+            thread.join(1)
+        assert not any(thread.is_alive() for thread in threads)
+
+    def test_process_changes_match(self):
+        """
+        Test if WatchfilesTask.process_changes() passes on named groups.
+        """
+
+        data = r"""
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        match:
+            - /tenant-(?P<tenant>\d+)/job-(?P<job>\d+)\.done$
+        """
+        callback = RecordingCallback()
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        changes = {
+            (watchfiles.Change.added, '/spool/tenant-42/job-9911.done'),
+            (watchfiles.Change.added, '/spool/tenant-42/job-9911.tmp'),
+        }
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(task.process_changes(changes, [callback]))
+        loop.close()
+
+        assert callback.calls == [
+            {'change': 'added', 'path': '/spool/tenant-42/job-9911.done',
+             'tenant': '42', 'job': '9911'},
+        ]
+
+    def test_notify_when(self):
+        """
+        Test if WatchfilesTask.notify() evaluates task and callback conditions.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        when: path.endswith('.csv')
+        """
+        large = RecordingCallback('large', when='size > 1 * MiB')
+        small = RecordingCallback('small', when='size <= 1 * MiB')
+        task = WatchfilesTask.from_yaml("name", data, [large, small])
+        assert task.builtins.names == {'size'}
+
+        root = os.path.abspath('tests/assets/tmp/when')
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        for name, size in [('a.csv', 2 << 20), ('b.csv', 10), ('c.txt', 0)]:
+            with open(os.path.join(root, name), 'wb') as fh:
+                fh.truncate(size)
+
+        changes = {(watchfiles.Change.added, os.path.join(root, name))
+                   for name in ['a.csv', 'b.csv', 'c.txt', 'gone.csv']}
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(task.process_changes(changes, [large, small]))
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+        assert [c['path'] for c in large.calls] == [
+            os.path.join(root, 'a.csv')]
+        assert [c['path'] for c in small.calls] == [
+            os.path.join(root, 'b.csv')]
+
+    def test_bind_builtins(self):
+        """
+        Test if WatchfilesTask.bind() adds referenced built-in attributes.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        attrs:
+            info: "{basename} {size}"
+            size: 0
+        """
+        callback = RecordingCallback(templates=['{info} {hostname}'])
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        assert task.builtins.names == {'basename', 'size', 'hostname'}
+
+        path = os.path.abspath('tests/assets/config.yaml')
+        attrs = task.bind({'change': 'added', 'path': path})
+        assert attrs['basename'] == 'config.yaml'
+        assert attrs['hostname'] == socket.gethostname()
+        assert attrs['size'] == 0
+        assert 'mtime' not in attrs
+
+        # no built-in attributes referenced
+        callback = RecordingCallback(templates=['{path}'])
+        task = WatchfilesTask.from_yaml("name", data, [callback])
+        assert task.builtins is None
+        assert task.bind({'path': path}) == {'info': '{basename} {size}',
+                                             'size': 0, 'path': path}
+
+    def test_await_path(self):
+        """
+        Test if WatchfilesTask.await_path() returns once a path reappears.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        recovery: watch
+        timeout: 10
+        """
+        task = WatchfilesTask.from_yaml("name", data, [])
+        root = 'tests/assets/tmp/await_path'
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        target = os.path.join(root, 'a', 'b')
+
+        def create():
+            time.sleep(0.5)
+            os.makedirs(target)
+
+        thread = threading.Thread(target=create)
+        thread.start()
+        loop = asyncio.new_event_loop()
+        start = time.monotonic()
+        assert loop.run_until_complete(task.await_path(target)) is True
+        assert time.monotonic() - start < 5
+        thread.join()
+
+        # timeout
+        task.timeout = 1
+        missing = os.path.join(root, 'missing')
+        assert loop.run_until_complete(task.await_path(missing)) is False
+        loop.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    def test_call_shared_watcher(self):
+        """
+        Test if WatchfilesTask.__call__() fans out to all callbacks.
+        """
+
+        test_yaml = """
+        callbacks:
+            callback0:
+                type: shell
+                command: echo {path} >> tests/assets/tmp/shared_watcher0
+            callback1:
+                type: shell
+                command: echo {path} >> tests/assets/tmp/shared_watcher1
+        tasks:
+            watchfilestask:
+                type: watchfiles
+                changes:
+                    - modified
+                paths:
+                    - tests/assets/tmp/watchfiles_call_test
+                callbacks:
+                    - callback0
+                    - callback1
+                watcher: task
+        """
+        self.start_input_producer()
+        self.proc.load_document(test_yaml)
+        callbacks = self.proc.get_callbacks()
+        tasks = self.proc.get_tasks(callbacks)
+        runner = TaskRunner(tasks, testenv=True)
+        assert len(runner.tasks) == 2
+        runner.loop.run_until_complete(runner())
+        self.stop_input_producer()
+
+        with open('tests/assets/tmp/shared_watcher0') as fh:
+            lines0 = fh.readlines()
+        with open('tests/assets/tmp/shared_watcher1') as fh:
+            lines1 = fh.readlines()
+        assert len(lines0) > 0
+        assert lines0 == lines1
+
+    def test_call_raise_exceptions(self):
+        """
+        Test if WatchfilesTask.__call__() raises TaskError.
+        """
+
+        # TaskError on watched file deleted
+        test_yaml = """
+        callbacks:
+            callback0:
+                type: shell
+                command: exit 0;
+        tasks:
+            watchfilestask:
+                type: watchfiles
+                changes:
+                    - modified
+                paths:
+                    - tests/assets/tmp/watchfiles_test.sh.pid
+                callbacks:
+                    - callback0
+                max_retry: 2
+                timeout: 1
+        """
+        self.start_input_producer()
+        self.proc.load_document(test_yaml)
+        callbacks = self.proc.get_callbacks()
+        tasks = self.proc.get_tasks(callbacks)
+        runner = TaskRunner(tasks)
+        fun = runner.loop.run_until_complete
+        self.assertRaises(TaskError, fun, runner())
+        self.stop_input_producer()
+
+
+class PathFilterTest(unittest.TestCase):
+
+    def test_call(self):
+        """
+        Test PathFilter.__call__() for include/exclude patterns.
+        """
+
+        added = watchfiles.Change.added
+        deleted = watchfiles.Change.deleted
+
+        # changes and default ignores
+        flt = PathFilter([added])
+        assert flt(added, '/spool/a.csv') is True
+        assert flt(deleted, '/spool/a.csv') is False
+        assert flt(added, '/spool/.a.csv.swp') is False
+        assert flt(added, '/spool/.git/index') is False
+
+        # roots always pass, but are no events unless they pass the filter
+        flt.roots = {'/spool'}
+        assert flt(deleted, '/spool') is True
+        assert flt.passes(deleted, '/spool') is False
+
+        # globs and regular expressions
+        flt = PathFilter([added],
+                         include=['*.csv', '/spool/in/*'],
+                         exclude=['*.tmp.csv'],
+                         exclude_regex=[r'/tenant-\d+/skip/'])
+        assert flt(added, '/spool/a.csv') is True
+        assert flt(added, '/spool/in/data.bin') is True
+        assert flt(added, '/spool/a.txt') is False
+        assert flt(added, '/spool/a.tmp.csv') is False
+        assert flt(added, '/spool/tenant-42/skip/a.csv') is False
+
+        flt = PathFilter([added], include_regex=[r'job-\d+\.done$'])
+        assert flt(added, '/spool/job-9911.done') is True
+        assert flt(added, '/spool/job-x.done') is False
+
+    def test_captures(self):
+        """
+        Test PathFilter.captures() for named groups of match expressions.
+        """
+
+        added = watchfiles.Change.added
+        flt = PathFilter([added])
+        assert flt.captures('/spool/a') == {}
+
+        flt = PathFilter([added], match=[
+            r'/tenant-(?P<tenant>\d+)/job-(?P<job>\d+)(?P<tmp>\.tmp)?\.done$',
+            r'/shared/(?P<job>\d+)$',
+        ])
+        path = '/spool/tenant-42/job-9911.done'
+        assert flt(added, path) is True
+        assert flt.captures(path) == {'tenant': '42', 'job': '9911'}
+        assert flt.captures('/shared/7') == {'job': '7'}
+        assert flt(added, '/spool/tenant-42/job-x.done') is False
+        assert flt.captures('/spool/tenant-42/job-x.done') is None
+
+
+class CallbackDispatcherTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackDispatcherTest, self).__init__(*args, **kwargs)
+        data = """
+        changes:
+            - added
+        paths:
+            - tests/assets/config.yaml
+        """
+        self.task = WatchfilesTask.from_yaml("name", data, [])
+
+    def run_dispatcher(self, dispatcher, callback, num_calls):
+        async def run():
+            for k in range(num_calls):
+                await dispatcher.put(callback, {'k': k})
+            await dispatcher.queue.join()
+            dispatcher.stop()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run())
+        loop.close()
+
+    def test_put_overflow(self):
+        """
+        Test CallbackDispatcher.put() overflow policies.
+        """
+
+        # block
+        callback = RecordingCallback(delay=0.01)
+        dispatcher = CallbackDispatcher(self.task, 2, 1, 'block')
+        self.run_dispatcher(dispatcher, callback, 10)
+        assert sorted(c['k'] for c in callback.calls) == list(range(10))
+        assert dispatcher.dropped == 0
+
+        # drop_newest
+        callback = RecordingCallback(delay=0.01)
+        dispatcher = CallbackDispatcher(self.task, 1, 2, 'drop_newest')
+        self.run_dispatcher(dispatcher, callback, 10)
+        assert [c['k'] for c in callback.calls] == [0, 1]
+        assert dispatcher.dropped == 8
+
+        # drop_oldest
+        callback = RecordingCallback(delay=0.01)
+        dispatcher = CallbackDispatcher(self.task, 1, 2, 'drop_oldest')
+        self.run_dispatcher(dispatcher, callback, 10)
+        assert [c['k'] for c in callback.calls] == [8, 9]
+        assert dispatcher.dropped == 8
+
+    def test_put_raise_exceptions(self):
+        """
+        Test CallbackDispatcher.put() re-raises worker exceptions.
+        """
+
+        class FailingCallback(RecordingCallback):
+            async def __call__(self, task, attrs):
+                raise CallbackAttributeError('attr')
+
+        dispatcher = CallbackDispatcher(self.task)
+        failing = FailingCallback()
+        other = RecordingCallback()
+
+        async def run():
+            await dispatcher.put(failing, {})
+            await dispatcher.put(failing, {'k': 1})
+            await dispatcher.queue.join()
+            # the error of failing is kept and does not affect other
+            await dispatcher.put(other, {'k': 0})
+            await dispatcher.queue.join()
+            assert other.calls == [{'k': 0}]
+            await dispatcher.put(failing, {})
+
+        loop = asyncio.new_event_loop()
+        self.assertRaises(CallbackAttributeError, loop.run_until_complete,
+                          run())
+        assert dispatcher.errors == {}
+        dispatcher.stop()
+        loop.close()
+
+
+class WatchManagerTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(WatchManagerTest, self).__init__(*args, **kwargs)
+        self.proc = YAMLProcessor()
+        self.input_producer_script = 'tests/assets/watchfiles_test.sh'
+        self.input_producer = None
+
+    def start_input_producer(self):
+        self.input_producer = subprocess.Popen(self.input_producer_script,
+                                               stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE)
+
+        # wait a moment for input producer (just to be safe)
+        time.sleep(1)
+
+    def stop_input_producer(self):
+        if self.input_producer:
+            self.input_producer.kill()
+            self.input_producer.wait()
+            self.input_producer.communicate()
+            self.input_producer = None
+
+    def test_covering_paths(self):
+        """
+        Test WatchManager.covering_paths() for minimal covering roots.
+        """
+
+        paths = [
+            '/var/spool/a/b',
+            '/var/spool-x',
+            '/var/spool',
+            '/var/spool/a',
+            '/etc/passwd',
+            '/var/spool',
+        ]
+        roots = WatchManager.covering_paths(paths)
+        assert roots == ['/etc/passwd', '/var/spool', '/var/spool-x']
+        assert WatchManager.covering_paths(['/', '/var']) == ['/']
+
+    def test_route(self):
+        """
+        Test WatchManager.route() for routing changes to tasks.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - /
+        """
+        task0 = WatchfilesTask.from_yaml("task0", data, [])
+        task1 = WatchfilesTask.from_yaml("task1", data, [])
+        manager = WatchManager([task0, task1])
+        manager.index = {
+            '/var/spool': [task0],
+            '/var/spool/a': [task1],
+        }
+
+        added = watchfiles.Change.added
+        changes = {
+            (added, '/var/spool/a/file'),
+            (added, '/var/spool/b'),
+            (added, '/var/spool-x/c'),
+        }
+        routed = manager.route(changes)
+        assert routed[task0] == {
+            (added, '/var/spool/a/file'),
+            (added, '/var/spool/b'),
+        }
+        assert routed[task1] == {(added, '/var/spool/a/file')}
+
+    def test_build_index_retries(self):
+        """
+        Test if WatchManager.build_index() counts retries of a task once
+        per timeout and drops tasks running out of retries.
+        """
+
+        data = """
+        changes:
+            - added
+        paths:
+            - {path}
+        timeout: {timeout}
+        max_retry: 1
+        """
+        missing = WatchfilesTask.from_yaml(
+            "missing", data.format(path='tests/assets/tmp/DOES_NOT_EXIST',
+                                   timeout=1), [])
+        present = WatchfilesTask.from_yaml(
+            "present", data.format(path='tests/assets/', timeout=1), [])
+        manager = WatchManager([missing, present])
+
+        async def rebuild():
+            assert await manager.build_index() == [missing]
+            assert await manager.build_index() == [missing]
+            assert manager.retries['missing'] == 1
+            manager.due['missing'] = 0
+            assert await manager.build_index() == []
+            assert manager.tasks == [present]
+            assert list(manager.index) == [
+                str(pathlib.Path('tests/assets/').resolve())]
+
+            manager.register(missing)
+            manager.tasks.remove(present)
+            await manager.build_index()
+            manager.due['missing'] = 0
+            with self.assertRaises(TaskError):
+                await manager.build_index()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(rebuild())
+        loop.close()
+
+    def test_call_global_watcher(self):
+        """
+        Test if WatchManager.__call__() serves overlapping tasks.
+        """
+
+        test_yaml = """
+        callbacks:
+            callback0:
+                type: shell
+                command: echo {path} >> tests/assets/tmp/global_watcher0
+            callback1:
+                type: shell
+                command: echo {path} >> tests/assets/tmp/global_watcher1
+        tasks:
+            task0:
+                type: watchfiles
+                changes:
+                    - added
+                paths:
+                    - tests/assets/tmp/
+                callbacks:
+                    - callback0
+                watcher: global
+            task1:
+                type: watchfiles
+                changes:
+                    - modified
+                paths:
+                    - tests/assets/tmp/watchfiles_call_test
+                callbacks:
+                    - callback1
+                watcher: global
+        """
+        self.start_input_producer()
+        self.proc.load_document(test_yaml)
+        callbacks = self.proc.get_callbacks()
+        tasks = self.proc.get_tasks(callbacks)
+        runner = TaskRunner(tasks, testenv=True)
+        assert len(runner.tasks) == 2
+        runner.loop.run_until_complete(runner())
+        self.stop_input_producer()
+
+        with open('tests/assets/tmp/global_watcher1') as fh:
+            lines = fh.readlines()
+        assert len(lines) > 0
+
+    def test_call_raise_exceptions(self):
+        """
+        Test if WatchManager.__call__() raises TaskError.
+        """
+
+        test_yaml = """
+        callbacks:
+            callback0:
+                type: shell
+                command: exit 0;
+        tasks:
+            watchfilestask:
+                type: watchfiles
+                changes:
+                    - added
+                paths:
+                    - tests/assets/tmp/DOES_NOT_EXIST
+                callbacks:
+                    - callback0
+                max_retry: 1
+                timeout: 1
+                watcher: global
+        """
+        self.proc.load_document(test_yaml)
+        callbacks = self.proc.get_callbacks()
+        tasks = self.proc.get_tasks(callbacks)
+        runner = TaskRunner(tasks)
+        fun = runner.loop.run_until_complete
+        self.assertRaises(TaskError, fun, runner())
 
 
 class TaskListTest(unittest.TestCase):
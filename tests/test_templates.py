@@ -0,0 +1,197 @@
+from yasmon.templates import Template, AttributePlan, Attributes
+from yasmon.templates import TemplateCircularError, BuiltinAttributes
+from yasmon.callbacks import process_attributes, attribute_plan
+from yasmon.callbacks import CallbackAttributeError
+from yasmon.callbacks import CallbackCircularAttributeError
+from yasmon.callbacks import CallbackError
+
+import unittest
+from unittest import mock
+import os
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_parse(self):
+        """
+        Test Template parses fields once on creation.
+        """
+
+        template = Template('a {x} b {y!r:>5} {{literal}}')
+        assert template == 'a {x} b {y!r:>5} {{literal}}'
+        assert template.names == {'x', 'y'}
+        assert template.parts == ('a ', ('x', None, '', (), None), ' b ',
+                                  ('y', 'r', '>5', (), None), ' {literal}')
+
+        self.assertRaises(ValueError, Template, 'unbalanced {')
+        self.assertRaises(ValueError, Template, 'unbalanced }')
+        self.assertRaises(ValueError, Template, 'invalid {x!z}')
+
+    def test_filters(self):
+        """
+        Test Template filters.
+        """
+
+        plan = AttributePlan({})
+        attrs = plan.bind({
+            'path': '/data/tenant-42/report.csv',
+            'size': '1572864',
+            'mtime': '2024-05-01T12:30:00+00:00',
+            'epoch': 0,
+        })
+
+        def render(source):
+            return plan.render(Template(source), attrs)
+
+        assert render('{path|basename}') == 'report.csv'
+        assert render('{path|dirname|basename|upper}') == 'TENANT-42'
+        assert render('{size|human}') == '1.5 MiB'
+        assert render('{epoch|human}') == '0 B'
+        assert render('{mtime|strftime:%Y/%m/%d}') == '2024/05/01'
+        assert render('{path|re:tenant-(\\d+)}') == '42'
+        assert render('{path|re:(csv|txt)$}') == 'csv'
+        assert render('{path|re:[0-9]{2}}') == '42'
+        assert render('{path|re:missing}') == ''
+        assert render('{size|format:>10}') == '   1572864'
+
+        self.assertRaises(ValueError, Template, '{path|INVALID}')
+        self.assertRaises(ValueError, Template, '{path|re:(}')
+        self.assertRaises(ValueError, render, '{path|human}')
+
+    def test_filters_nested(self):
+        """
+        Test filters applied to templated attributes.
+        """
+
+        plan = AttributePlan({'file': '{dir}/{name}', 'dir': '/tmp'})
+        attrs = plan.bind({'name': 'a.txt'})
+        assert plan.render(Template('{file|basename}'), attrs) == 'a.txt'
+
+
+class AttributePlanTest(unittest.TestCase):
+
+    def test_render(self):
+        """
+        Test AttributePlan.render() expands nested attributes.
+        """
+
+        plan = AttributePlan({
+            'a': 'A{b}',
+            'b': 'B{c}',
+            'c': '{path}',
+            'n': 42,
+            'padded': '[{n:>4}]',
+        })
+        assert plan.resolved['a'] == ('AB', ('path', None, '', (), None))
+
+        attrs = plan.bind({'path': '/tmp/{x}'})
+        assert isinstance(attrs, Attributes)
+        assert attrs.plan is plan
+        assert plan.render(Template('{a} {padded} {n!r}'), attrs) == \
+            'AB/tmp/{x} [  42] 42'
+        assert len(plan.compiled) == 1
+
+        # undefined attribute
+        self.assertRaises(KeyError, plan.render, Template('{INVALID}'), attrs)
+
+    def test_bind_shadowed(self):
+        """
+        Test AttributePlan.bind() lets event attributes take precedence.
+        """
+
+        plan = AttributePlan({'a': 'A{b}', 'b': 'static'})
+        attrs = plan.bind({'b': 'event'})
+        assert attrs == {'a': 'A{b}', 'b': 'event'}
+        assert attrs.plan is not plan
+        assert attrs.plan.render(Template('{a}'), attrs) == 'Aevent'
+        assert plan.bind({'b': 'other'}).plan is attrs.plan
+
+    def test_circular(self):
+        """
+        Test AttributePlan detects circular attributes up front.
+        """
+
+        plan = AttributePlan({
+            'a': 'this {b} attribute',
+            'b': 'is {a} circular',
+            'c': 'depends on {a}',
+            'd': 'fine',
+        })
+        assert set(plan.errors) == {'a', 'b', 'c'}
+        assert plan.errors['a'].chain == ['a', 'b', 'a']
+
+        attrs = plan.bind({})
+        assert plan.render(Template('{d}'), attrs) == 'fine'
+        self.assertRaises(TemplateCircularError, plan.render,
+                          Template('{c}'), attrs)
+
+    def test_names(self):
+        """
+        Test AttributePlan.names() returns attributes looked up at render time.
+        """
+
+        plan = AttributePlan({'a': '{b:>3} {path}', 'b': '{size}',
+                              'c': '{c}'})
+        templates = [Template('{a}'), Template('{change}'), Template('{c}')]
+        assert plan.names(templates) == {'path', 'size', 'change'}
+
+
+class BuiltinAttributesTest(unittest.TestCase):
+
+    def test_call(self):
+        """
+        Test BuiltinAttributes computes referenced attributes only.
+        """
+
+        path = os.path.abspath('tests/assets/config.yaml')
+        builtins = BuiltinAttributes(['basename', 'dirname', 'path'])
+        assert builtins.names == {'basename', 'dirname'}
+        with mock.patch('os.stat') as mck:
+            attrs = builtins({'path': path, 'dirname': 'defined'})
+            mck.assert_not_called()
+        assert attrs == {'basename': 'config.yaml'}
+
+        builtins = BuiltinAttributes(BuiltinAttributes.available)
+        attrs = builtins({'path': path})
+        assert set(attrs) == BuiltinAttributes.available
+        assert attrs['size'] == str(os.path.getsize(path))
+        assert attrs['owner'] == BuiltinAttributes.user(os.getuid())
+
+        # missing path
+        attrs = builtins({'path': path + '.missing'})
+        assert attrs['size'] == attrs['mtime'] == attrs['owner'] == ''
+        assert attrs['basename'] == 'config.yaml.missing'
+
+
+class ProcessAttributesTest(unittest.TestCase):
+
+    def test_process_attributes(self):
+        """
+        Test process_attributes() with plain and bound attributes.
+        """
+
+        attrs = {'a': 'A{b}', 'b': 'B'}
+        assert process_attributes('{a}', attrs) == 'AB'
+        assert process_attributes('{a}', AttributePlan(attrs).bind({})) == \
+            'AB'
+
+        self.assertRaises(CallbackAttributeError, process_attributes,
+                          '{INVALID}', attrs)
+        self.assertRaises(CallbackAttributeError, process_attributes,
+                          'unbalanced {', attrs)
+        self.assertRaises(CallbackCircularAttributeError, process_attributes,
+                          '{a}', {'a': '{b}', 'b': '{a}'})
+        self.assertRaises(CallbackError, process_attributes,
+                          '{a|human}', attrs)
+
+        # plans of plain attributes are cached
+        attrs = {'a': 'A{b}', 'b': 'C', 'path': '/p'}
+        assert process_attributes('{a} {path}', attrs) == 'AC /p'
+        attrs = {'a': 'A{b}', 'b': 'D', 'path': '/q'}
+        hits = attribute_plan.cache_info().hits
+        assert process_attributes('{a} {path}', attrs) == 'AD /q'
+        assert attribute_plan.cache_info().hits == hits + 1
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -2,6 +2,13 @@ from . import processor
 from . import callbacks
 from . import tasks
 from . import loggers
+from . import checkpoints
+from . import events
+from . import fingerprints
+from . import templates
+from . import conditions
+from . import processes
+from . import smtp
 from . import cli
 
 __all__ = [
@@ -9,6 +16,13 @@ __all__ = [
     'callbacks',
     'tasks',
     'loggers',
+    'checkpoints',
+    'events',
+    'fingerprints',
+    'templates',
+    'conditions',
+    'processes',
+    'smtp',
     'cli',
 ]
 
@@ -1,53 +1,80 @@
 from loguru import logger
 from abc import ABC, abstractmethod
-from typing import Self, TYPE_CHECKING
+from typing import Self, Optional, Iterator, TYPE_CHECKING
 import asyncio
 import yaml
-import re
-import smtplib
+import json
+import tempfile
+import signal
+import shlex
+import os
 import email
-import ssl
 import mimetypes
 import pathlib
+import datetime
+import functools
+
+from .templates import Template, AttributePlan, Attributes
+from .templates import TemplateCircularError
+from .conditions import Condition, ConditionSyntaxError
+from .processes import Process, ProcessLimits, ResourceStats
+from .smtp import SMTPPool, MailOutbox
 
 if TYPE_CHECKING:
     from .tasks import AbstractTask
 
 
+@functools.lru_cache(maxsize=256)
+def attribute_plan(templated: tuple[tuple[str, str], ...]) -> AttributePlan:
+    """
+    :param templated: ``(name, value)`` pairs of templated attributes
+
+    :return: (cached) plan of ``templated``
+    """
+    return AttributePlan(dict(templated))
+
+
 def process_attributes(expr: str, attrs: dict[str, str]) -> str:
     """
     Performs attribute substitutions in `expr`.
 
-    This is also checking for circular dependencies (`max_depth = 42`).
+    Templates are rendered in a single pass. If ``attrs`` are bound to an
+    :class:`yasmon.templates.AttributePlan` (see
+    :func:`yasmon.tasks.AbstractTask.bind`), nested attributes were
+    already expanded and checked for circular dependencies when the plan
+    was built. Otherwise, the (cached) plan of the attributes of ``attrs``
+    with templated values is used, other attributes are looked up when
+    rendering.
 
-    :param expr: expression to process
+    :param expr: expression (preferably a
+                 :class:`yasmon.templates.Template`) to process
     :param attrs: attributes to substitute
 
     :raises CallbackCircularAttributeError: see documentation
     :raises CallbackAttributeError: see documentation
+    :raises CallbackError: if a template filter fails
 
     :return: processed expression
     :rtype: str
     """
-    max_depth = 42
-    regex = re.compile(r"\{[^{}]*\}")  # match attributes
-    search = regex.search(expr)
-
-    depth = 0
-    while search:
-        try:
-            expr = expr.format(**attrs)
-        except KeyError as e:
-            raise CallbackAttributeError(e)
-
-        if depth < max_depth:
-            depth += 1
-        else:
-            raise CallbackCircularAttributeError(expr)
-
-        search = regex.search(expr)
-
-    return expr
+    try:
+        template = expr if isinstance(expr, Template) else Template(expr)
+    except ValueError as err:
+        raise CallbackAttributeError(err)
+
+    plan = attrs.plan if isinstance(attrs, Attributes) else None
+    try:
+        if plan is None:
+            plan = attribute_plan(tuple(sorted(
+                (name, value) for name, value in attrs.items()
+                if isinstance(value, str) and '{' in value)))
+        return plan.render(template, attrs)
+    except KeyError as err:
+        raise CallbackAttributeError(err)
+    except TemplateCircularError as err:
+        raise CallbackCircularAttributeError(' -> '.join(err.chain))
+    except ValueError as err:
+        raise CallbackError(f"in template '{expr}' {err}")
 
 
 class CallbackNotImplementedError(Exception):
@@ -125,6 +152,8 @@ class AbstractCallback(ABC):
     def __init__(self):
         if not self.name:
             self.name = "Generic Callback"
+        if not getattr(self, 'when', None):
+            self.when = None
         logger.info(f'{self.name} ({self.__class__}) initialized')
 
     @abstractmethod
@@ -140,6 +169,27 @@ class AbstractCallback(ABC):
         logger.info(f'{self.name} ({self.__class__}) called by '
                     f'{task.name} ({task.__class__})')
 
+    async def start(self):
+        """
+        Coroutine called by :class:`yasmon.tasks.TaskRunner` before tasks
+        are started, e.g. to start long-lived resources.
+        """
+
+    async def stop(self):
+        """
+        Coroutine called by :class:`yasmon.tasks.TaskRunner` once tasks
+        stopped, releasing resources acquired by :func:`start`.
+        """
+
+    def templates(self) -> list[Template]:
+        """
+        Templates rendered by the callback, used by tasks to determine the
+        referenced attributes when the configuration is loaded.
+
+        :return: templates
+        """
+        return []
+
     @classmethod
     @abstractmethod
     def from_yaml(cls, name: str, data: str):
@@ -153,49 +203,722 @@ class AbstractCallback(ABC):
         """
         logger.debug(f'{name} defined form yaml \n{data}')
 
+    @staticmethod
+    def when_from_yaml(name: str, parsed: dict) -> Optional[Condition]:
+        """
+        Compile the optional ``when`` condition of a parsed YAML snippet.
+
+        :param name: unique identifier
+        :param parsed: parsed YAML snippet
+
+        :raises CallbackSyntaxError: on invalid conditions
+
+        :return: condition or ``None``
+        """
+        if 'when' not in parsed:
+            return None
+
+        if not isinstance(parsed['when'], str):
+            raise CallbackSyntaxError(
+                f"in callback '{name}' 'when' not a str")
+
+        try:
+            return Condition(parsed['when'])
+        except ConditionSyntaxError as err:
+            raise CallbackSyntaxError(
+                f"in callback '{name}' invalid 'when' ({err})")
+
+
+class OutputCapture:
+    """
+    Streaming capture of the output of a command.
+
+    Output is logged line by line while it is read from the pipe. At most
+    ``limit`` bytes are retained in memory. Once the output exceeds
+    ``limit``, it is spooled to a temporary file instead of being logged,
+    so a chatty command neither grows the memory of the service nor floods
+    the log.
+    """
+
+    #: size of chunks read from the pipe
+    chunk_size = 65536
+
+    def __init__(self, name: str, stream: str, level: str,
+                 limit: int) -> None:
+        """
+        :param name: name of the callback
+        :param stream: name of the captured stream (e.g. ``stdout``)
+        :param level: logging level of captured lines
+        :param limit: maximum number of retained bytes
+        """
+        self.name = name
+        self.stream = stream
+        self.level = level
+        self.limit = limit
+        self.retained = bytearray()
+        self.size = 0
+        self.spool: Optional[str] = None
+
+    def log(self, line: bytes):
+        """
+        Log a captured line.
+        """
+        logger.log(self.level, f'callback {self.name} {self.stream}: '
+                               f'{line.decode(errors="replace")}')
+
+    async def __call__(self, reader: asyncio.StreamReader) -> bytes:
+        """
+        Capture ``reader`` until EOF.
+
+        :return: retained output (the first ``limit`` bytes)
+        """
+        partial = b''
+        fh = None
+        try:
+            while chunk := await reader.read(self.chunk_size):
+                self.size += len(chunk)
+                if fh is None and self.size > self.limit:
+                    fh = tempfile.NamedTemporaryFile(
+                        prefix=f'yasmon-{self.stream}-', suffix='.log',
+                        delete=False)
+                    self.spool = fh.name
+                    fh.write(self.retained)
+                    self.retained += chunk[:self.limit - len(self.retained)]
+
+                if fh is not None:
+                    fh.write(chunk)
+                    continue
+
+                self.retained += chunk
+                *lines, partial = (partial + chunk).split(b'\n')
+                for line in lines:
+                    self.log(line)
+        finally:
+            if fh is not None:
+                fh.close()
+
+        if fh is not None:
+            logger.warning(f'callback {self.name} {self.stream} exceeded '
+                           f'{self.limit} bytes, {self.size} bytes spooled '
+                           f'to {self.spool}')
+        elif partial:
+            self.log(partial)
+        return bytes(self.retained)
+
+
+class CommandBatcher:
+    """
+    Batching of the calls of a :class:`ShellCallback` (``xargs``-style).
+
+    An item (by default the ``path``) of each call is collected for up to
+    ``size`` items or ``wait`` seconds. Items are collected in a separate
+    batch per rendered command and calling task, so commands referencing
+    attributes of the events are executed for the matching items only.
+    A batch is executed in the background with the items appended as
+    arguments (``argv``), split into as few commands as the ``ARG_MAX``
+    limit permits, or executed once with the items null-delimited on its
+    stdin (``stdin``). Batches are executed one at a time, in order.
+    """
+
+    #: maximum length of a single argument (``MAX_ARG_STRLEN`` on Linux),
+    #: limiting a batched shell command
+    max_arg = 131072
+
+    def __init__(self, callback: 'ShellCallback', size: int = 1000,
+                 wait: float = 1, input: str = 'argv',
+                 item: str = '{path}') -> None:
+        """
+        :param callback: callback executing batches
+        :param size: maximum number of items of a batch
+        :param wait: maximum number of seconds a batch is collected
+        :param input: pass items as arguments (``argv``) or on stdin
+                      (``stdin``)
+        :param item: template of an item
+
+        :raises ValueError: on invalid attribute fields in ``item``
+        """
+        self.callback = callback
+        self.size = size
+        self.wait = wait
+        self.input = input
+        self.item = Template(item)
+        self.batches: dict[tuple, list[str]] = {}
+        self.timers: dict[tuple, asyncio.Task] = {}
+        self.flushers: set[asyncio.Task] = set()
+        self.lock = asyncio.Lock()
+        self.error: Optional[Exception] = None
+
+    @staticmethod
+    def key(cmd: str | list[str], task: Optional[str]) -> tuple:
+        """
+        :return: key of the batch of ``cmd`` called by ``task``
+        """
+        return (tuple(cmd) if isinstance(cmd, list) else cmd, task)
+
+    async def put(self, cmd: str | list[str], item: str,
+                  task: Optional[str] = None):
+        """
+        Add ``item`` to the batch of ``cmd`` and ``task`` and execute the
+        batch in the background once it is full.
+
+        :param cmd: rendered command
+        :param item: rendered item
+        :param task: name of the calling task
+
+        :raises Exception: exception previously raised by a batch executed
+                           in the background
+        """
+        if self.error is not None:
+            err, self.error = self.error, None
+            raise err
+
+        key = self.key(cmd, task)
+        items = self.batches.setdefault(key, [])
+        items.append(item)
+
+        if len(items) >= self.size:
+            if (timer := self.timers.pop(key, None)) is not None:
+                timer.cancel()
+            del self.batches[key]
+            self.background(self.execute(key, items))
+        elif key not in self.timers:
+            self.timers[key] = self.background(self.expire(key))
+
+    def background(self, coro) -> asyncio.Task:
+        """
+        :return: task running ``coro``, awaited by :func:`stop`
+        """
+        flusher = asyncio.create_task(coro)
+        self.flushers.add(flusher)
+        flusher.add_done_callback(self.flushers.discard)
+        return flusher
+
+    async def expire(self, key: tuple):
+        """
+        Execute the batch of ``key`` after ``wait`` seconds.
+        """
+        await asyncio.sleep(self.wait)
+        self.timers.pop(key, None)
+        await self.execute(key, self.batches.pop(key, []))
+
+    async def execute(self, key: tuple, items: list[str]):
+        """
+        Execute a batch in the background, keeping the error (if any) to
+        be raised by the next :func:`put`.
+        """
+        try:
+            await self.flush(key, items)
+        except Exception as err:
+            self.error = err
+
+    async def flush(self, key: tuple, items: list[str]):
+        """
+        Execute a batch.
+
+        :param key: key of the batch (see :func:`key`)
+        :param items: items of the batch
+        """
+        if not items:
+            return
+
+        cmd, task = key
+        cmd = list(cmd) if isinstance(cmd, tuple) else cmd
+        async with self.lock:
+            logger.debug(f'callback {self.callback.name} executes a batch '
+                         f'of {len(items)} items')
+            if self.input == 'stdin':
+                data = b''.join(os.fsencode(item) + b'\0' for item in items)
+                await self.callback.run(cmd, data, task)
+                return
+
+            for chunk in self.chunks(cmd, items):
+                await self.callback.run(chunk, task=task)
+
+    async def stop(self):
+        """
+        Wait for batches executed in the background and execute the
+        current batches.
+        """
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers = {}
+        await asyncio.gather(*self.flushers, return_exceptions=True)
+        if self.error is not None:
+            err, self.error = self.error, None
+            logger.error(f'callback {self.callback.name} batch failed '
+                         f'({err})')
+        batches, self.batches = self.batches, {}
+        for key, items in batches.items():
+            await self.flush(key, items)
+
+    @staticmethod
+    def arg_max() -> int:
+        """
+        :return: number of bytes available for arguments of a command, i.e.
+                 ``ARG_MAX`` less the environment and some headroom
+        """
+        env = sum(len(os.fsencode(key)) + len(os.fsencode(value)) + 10
+                  for key, value in os.environ.items())
+        return os.sysconf('SC_ARG_MAX') - env - 2048
+
+    def chunks(self, cmd: str | list[str],
+               items: list[str]) -> Iterator[str | list[str]]:
+        """
+        Split ``items`` into commands within the argument limits.
+
+        :param cmd: rendered command (shell command or argument vector)
+        :param items: items of a batch
+
+        :return: commands with the items appended
+        """
+        if isinstance(cmd, list):
+            limit = self.arg_max()
+            # each argument takes its bytes, a terminator and a pointer
+            cost = sum(len(os.fsencode(arg)) + 9 for arg in cmd)
+            args = items
+        else:
+            limit = min(self.arg_max(), self.max_arg - 1)
+            cost = len(os.fsencode(cmd))
+            args = [shlex.quote(item) for item in items]
+
+        chunk: list[str] = []
+        size = cost
+        for arg in args:
+            arg_size = len(os.fsencode(arg)) + (9 if isinstance(cmd, list)
+                                                else 1)
+            if chunk and size + arg_size > limit:
+                yield self.join(cmd, chunk)
+                chunk, size = [], cost
+            chunk.append(arg)
+            size += arg_size
+        if chunk:
+            yield self.join(cmd, chunk)
+
+    @staticmethod
+    def join(cmd: str | list[str], args: list[str]) -> str | list[str]:
+        """
+        :return: ``cmd`` with ``args`` appended
+        """
+        if isinstance(cmd, list):
+            return cmd + args
+        return ' '.join([cmd, *args])
+
 
 class ShellCallback(AbstractCallback):
     """
     Callback implementing shell command execution.
+
+    The command is either a shell command (``cmd``), executed by
+    ``/bin/sh``, or an argument vector (``argv``), whose arguments are
+    rendered separately and executed directly without a shell. The latter
+    avoids spawning a shell for every call and quoting issues with
+    attributes containing spaces or shell metacharacters.
+
+    In ``coprocess`` mode, the command is started once as a long-lived
+    worker instead of once per call. Each call writes the attributes as a
+    single line of JSON to the standard input of the worker and waits for a
+    single line (acknowledgement or result) on its standard output. Calls
+    are serialized and a worker that exited is restarted on the next call.
+
+    At most ``max_concurrency`` commands of a callback run at once, further
+    calls wait in a queue. The numbers of ``queued`` and ``running`` calls
+    and of ``timeouts`` are kept as counters.
+
+    With ``batch``, calls are collected and the command is executed once
+    for many events (see :class:`CommandBatcher`).
     """
 
-    def __init__(self, name: str, cmd: str) -> None:
+    #: seconds a coprocess is given to exit after closing its stdin, and a
+    #: timed out command after ``SIGTERM``
+    grace = 5
+
+    def __init__(self, name: str, cmd: Optional[str] = None,
+                 when: Optional[Condition] = None,
+                 argv: Optional[list[str]] = None,
+                 coprocess: bool = False,
+                 fields: Optional[list[str]] = None,
+                 output_limit: int = 65536,
+                 max_concurrency: int = 0,
+                 timeout: Optional[float] = None,
+                 batch: Optional[dict] = None,
+                 limits: Optional[ProcessLimits] = None) -> None:
         """
         :param name: unique identifier
-        :param cmd: command to be executed
+        :param cmd: shell command to be executed
+        :param when: condition for calling the callback
+        :param argv: program and arguments to be executed without a shell
+                     (instead of ``cmd``)
+        :param coprocess: start the command once as a long-lived worker
+                          receiving events on stdin
+        :param fields: attributes sent to the coprocess (default: all
+                       attributes of an event)
+        :param output_limit: maximum number of bytes of stdout and stderr
+                             retained (and logged) per call, larger output
+                             is spooled to a temporary file
+        :param max_concurrency: maximum number of concurrently running
+                                commands (0 = unlimited)
+        :param timeout: seconds after which a command is terminated (or a
+                        coprocess restarted)
+        :param batch: keyword arguments of a :class:`CommandBatcher`
+                      batching calls
+        :param limits: scheduling priority and resource limits of commands
+
+        :raises ValueError: on invalid attribute fields in ``cmd`` or
+                            ``argv``, unless exactly one of ``cmd`` and
+                            ``argv`` is given, on attribute fields in the
+                            command of a coprocess, on ``fields``
+                            without ``coprocess`` and on ``batch`` with
+                            ``coprocess``
         """
+        if (cmd is None) == (argv is None):
+            raise ValueError('either cmd or argv required')
+        if argv is not None and not argv:
+            raise ValueError('empty argv')
+        if fields is not None and not coprocess:
+            raise ValueError('fields require coprocess')
+        if batch is not None and coprocess:
+            raise ValueError('batch and coprocess are exclusive')
+
         self.name = name
-        self.cmd = cmd
+        self.cmd = Template(cmd) if cmd is not None else None
+        self.argv = [Template(arg) for arg in argv] \
+            if argv is not None else None
+        self.when = when
+
+        self.coprocess = coprocess
+        if coprocess and any(template.names for template in
+                             (self.argv or [self.cmd])):
+            raise ValueError('coprocess command must not use attributes')
+        self.fields: dict[str, Template] = {
+            field: Template(f'{{{field}}}') for field in fields or []}
+        self.all_fields = fields is None
+        self.proc: Optional[Process] = None
+        self.drainer: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.output_limit = output_limit
+        self.timeout = timeout
+        self.slots: Optional[asyncio.Semaphore] = None
+        if max_concurrency:
+            self.slots = asyncio.Semaphore(max_concurrency)
+        self.queued = 0
+        self.running = 0
+        self.timeouts = 0
+        self.stats = ResourceStats()
+        self.limits = limits
+        self.batcher: Optional[CommandBatcher] = None
+        if batch is not None:
+            self.batcher = CommandBatcher(self, **batch)
         super().__init__()
 
     async def __call__(self, task: 'AbstractTask', attrs: dict[str, str]):
         await super().__call__(task, attrs)
 
+        if self.coprocess:
+            return await self.communicate(attrs)
+
         try:
-            cmd = process_attributes(self.cmd, attrs)
+            if self.argv is not None:
+                cmd = [process_attributes(arg, attrs) for arg in self.argv]
+            else:
+                cmd = process_attributes(self.cmd, attrs)
         except CallbackAttributeError:
             raise
         except CallbackCircularAttributeError:
             raise
 
-        proc = await asyncio.create_subprocess_shell(
-            cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
+        if self.batcher is not None:
+            item = process_attributes(self.batcher.item, attrs)
+            return await self.batcher.put(cmd, item, task.name)
 
-        stdout, stderr = await proc.communicate()
-        out = stdout.decode()
-        err = stderr.decode()
+        return await self.run(cmd, task=task.name)
 
-        if out:
-            logger.info(f'callback {self.name} stdout:\n {out}')
+    async def run(self, cmd: str | list[str], input: Optional[bytes] = None,
+                  task: Optional[str] = None) -> tuple[bytes, bytes]:
+        """
+        Execute a rendered command once fewer than ``max_concurrency``
+        commands are running.
+
+        :param cmd: shell command or argument vector
+        :param input: data written to stdin of the command
+        :param task: name of the task the resource usage is accounted to
+
+        :return: retained stdout and stderr
+        """
+        self.queued += 1
+        try:
+            if self.slots is not None:
+                await self.slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            return await self.execute(cmd, input, task)
+        finally:
+            self.running -= 1
+            if self.slots is not None:
+                self.slots.release()
+
+    async def execute(self, cmd: str | list[str],
+                      input: Optional[bytes] = None,
+                      task: Optional[str] = None) -> tuple[bytes, bytes]:
+        """
+        Execute a rendered command and capture its output. If ``timeout``
+        is set, the command runs in a new process group, which is
+        terminated if the command does not finish in time (see
+        :func:`kill`). If the call is cancelled, the command (and its
+        process group, if any) is killed and reaped. The resource usage of
+        the command is recorded in ``stats``.
+
+        :param cmd: shell command or argument vector
+        :param input: data written to stdin of the command (``/dev/null``
+                      otherwise)
+        :param task: name of the task the resource usage is accounted to
 
-        if err:
-            logger.error(f'callback {self.name} stderr:\n {err}')
+        :raises CallbackError: if the command cannot be executed
 
+        :return: retained stdout and stderr
+        """
+        shell = not isinstance(cmd, list)
+        session = self.timeout is not None
+        try:
+            proc = await Process.create(cmd, shell=shell,
+                                        stdin=input is not None,
+                                        start_new_session=session,
+                                        limits=self.limits)
+        except OSError as err:
+            raise CallbackError(
+                f"in callback '{self.name}' cannot execute "
+                f"'{cmd if shell else cmd[0]}' ({err})")
+
+        capture = asyncio.gather(
+            OutputCapture(self.name, 'stdout', 'INFO',
+                          self.output_limit)(proc.stdout),
+            OutputCapture(self.name, 'stderr', 'ERROR',
+                          self.output_limit)(proc.stderr),
+            proc.wait(),
+            self.feed(proc.stdin, input))
+        try:
+            stdout, stderr, *_ = await asyncio.wait_for(
+                asyncio.shield(capture), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f'callback {self.name} timed out after '
+                         f'{self.timeout}s')
+            await self.kill(proc)
+            stdout, stderr, *_ = await capture
+        except asyncio.CancelledError:
+            if session:
+                self.killpg(proc, signal.SIGKILL)
+            else:
+                proc.kill()
+            await proc.wait()
+            capture.cancel()
+            self.stats.record(self.name, task, proc.pid, proc.returncode,
+                              proc.usage)
+            raise
+
+        self.stats.record(self.name, task, proc.pid, proc.returncode,
+                          proc.usage)
         return stdout, stderr
 
+    @staticmethod
+    async def feed(stdin: Optional[asyncio.StreamWriter],
+                   input: Optional[bytes]):
+        """
+        Write ``input`` to the stdin of a command and close it.
+        """
+        if stdin is None:
+            return
+        try:
+            stdin.write(input)
+            await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the command does not read all of its input
+        finally:
+            stdin.close()
+
+    @staticmethod
+    def killpg(proc: Process, sig: signal.Signals):
+        """
+        Send ``sig`` to the process group of ``proc`` (if any left).
+        """
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def kill(self, proc: Process):
+        """
+        Send ``SIGTERM`` to the process group of ``proc`` and ``SIGKILL``
+        to what is left of it after ``grace`` seconds.
+        """
+        self.killpg(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.shield(proc.wait()), self.grace)
+        except asyncio.TimeoutError:
+            pass
+        self.killpg(proc, signal.SIGKILL)
+        await proc.wait()
+
+    def templates(self) -> list[Template]:
+        if self.coprocess:
+            return [] if self.all_fields else list(self.fields.values())
+        templates = list(self.argv) if self.argv is not None else [self.cmd]
+        if self.batcher is not None:
+            templates.append(self.batcher.item)
+        return templates
+
+    async def start(self):
+        if self.coprocess:
+            async with self.lock:
+                await self.spawn()
+
+    async def stop(self):
+        if self.batcher is not None:
+            await self.batcher.stop()
+        if self.coprocess:
+            async with self.lock:
+                await self.terminate(self.grace)
+
+    async def spawn(self) -> Process:
+        """
+        Start the coprocess unless it is running.
+
+        :raises CallbackError: if the coprocess cannot be started
+
+        :return: running coprocess
+        """
+        if self.proc is not None:
+            if self.proc.returncode is None:
+                return self.proc
+            logger.warning(f'callback {self.name} coprocess exited with '
+                           f'{self.proc.returncode}, restarting')
+            await self.terminate(0)
+
+        try:
+            if self.argv is not None:
+                self.proc = await Process.create(
+                    [process_attributes(arg, {}) for arg in self.argv],
+                    stdin=True, limits=self.limits)
+            else:
+                self.proc = await Process.create(
+                    process_attributes(self.cmd, {}), shell=True,
+                    stdin=True, limits=self.limits)
+        except OSError as err:
+            raise CallbackError(
+                f"in callback '{self.name}' cannot start coprocess ({err})")
+
+        self.drainer = asyncio.create_task(self.drain(self.proc.stderr))
+        logger.debug(f'callback {self.name} started coprocess '
+                     f'{self.proc.pid}')
+        return self.proc
+
+    async def drain(self, stderr: asyncio.StreamReader):
+        """
+        Log the stderr of the coprocess line by line.
+        """
+        while True:
+            try:
+                line = await stderr.readline()
+            except ValueError:
+                logger.warning(f'callback {self.name} coprocess stderr '
+                               f'line too long, skipped')
+                continue
+            if not line:
+                break
+            logger.error(f'callback {self.name} stderr: '
+                         f'{line.decode(errors="replace").rstrip()}')
+
+    async def terminate(self, grace: float):
+        """
+        Close the stdin of the coprocess and kill it unless it exits within
+        ``grace`` seconds. Remaining stderr is logged.
+        """
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+
+        if proc.returncode is None:
+            proc.stdin.close()
+            try:
+                await asyncio.wait_for(proc.wait(), grace)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        self.stats.record(self.name, None, proc.pid, proc.returncode,
+                          proc.usage)
+
+        if self.drainer is not None:
+            try:
+                await asyncio.wait_for(self.drainer, self.grace)
+            except asyncio.TimeoutError:
+                pass
+            self.drainer = None
+
+    @staticmethod
+    async def exchange(proc: Process,
+                       line: bytes) -> bytes:
+        """
+        Write ``line`` to the coprocess and read its response.
+        """
+        proc.stdin.write(line)
+        await proc.stdin.drain()
+        return await proc.stdout.readline()
+
+    def payload(self, attrs: dict[str, str]) -> dict[str, str]:
+        """
+        Render the attributes sent to the coprocess.
+
+        :raises CallbackAttributeError: see documentation
+        :raises CallbackCircularAttributeError: see documentation
+        """
+        if self.all_fields:
+            for field in attrs.keys() - self.fields.keys():
+                try:
+                    self.fields[field] = Template(f'{{{field}}}')
+                except ValueError:
+                    self.fields[field] = None
+        return {field: process_attributes(template, attrs)
+                if template is not None else attrs[field]
+                for field, template in self.fields.items()
+                if not self.all_fields or field in attrs}
+
+    async def communicate(self, attrs: dict[str, str]) -> tuple[bytes, bytes]:
+        """
+        Send ``attrs`` to the coprocess and read its response.
+
+        :raises CallbackError: if the coprocess exits before responding
+
+        :return: response and empty stderr (which is logged separately)
+        """
+        line = json.dumps(self.payload(attrs), default=str) + '\n'
+        async with self.lock:
+            proc = await self.spawn()
+            try:
+                response = await asyncio.wait_for(
+                    self.exchange(proc, line.encode()), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.error(f'callback {self.name} coprocess timed out '
+                             f'after {self.timeout}s, restarting')
+                await self.terminate(0)
+                return b'', b''
+            except (OSError, ValueError) as err:
+                response = f'{err}'.encode()
+
+            if not response.endswith(b'\n'):
+                await self.terminate(0)
+                raise CallbackError(
+                    f"in callback '{self.name}' coprocess failed "
+                    f"({response.decode(errors='replace') or 'exited'})")
+
+        out = response.decode().rstrip('\n')
+        if out:
+            logger.info(f'callback {self.name} stdout: {out}')
+
+        return response, b''
+
     @classmethod
     def from_yaml(cls, name: str, data: str) -> Self:
         """
@@ -204,6 +927,50 @@ class ShellCallback(AbstractCallback):
         .. code:: yaml
 
             command: ls -lah /path/to/some/dir/
+            when: change == 'added'
+            output_limit: 65536
+            max_concurrency: 4
+            timeout: 60
+            nice: 10
+            ionice: idle
+            affinity: [0, 1]
+            rlimits:
+                cpu: 60
+                as: 1073741824
+                nofile: 1024
+
+        or, executed once for many events,
+
+        .. code:: yaml
+
+            argv:
+                - gzip
+                - --
+            batch:
+                size: 1000
+                wait: 0.5
+                input: argv
+                item: "{path}"
+
+        or, executed without a shell,
+
+        .. code:: yaml
+
+            argv:
+                - ls
+                - -lah
+                - /path/to/some/dir/
+
+        or as a long-lived worker receiving events on stdin,
+
+        .. code:: yaml
+
+            argv:
+                - /usr/local/bin/worker
+            coprocess: true
+            fields:
+                - path
+                - change
 
         :param name: unique identifier
         :param data: YAML snippet
@@ -217,18 +984,118 @@ class ShellCallback(AbstractCallback):
         except yaml.YAMLError as err:
             raise CallbackSyntaxError(err)
 
-        if 'command' not in parsed:
+        if 'command' not in parsed and 'argv' not in parsed:
             raise CallbackSyntaxError(f"""\
             in callback {name} missig command
             """)
 
-        if not isinstance(parsed['command'], str):
+        if 'command' in parsed and 'argv' in parsed:
+            raise CallbackSyntaxError(f"""\
+            in callback {name} command and argv are exclusive
+            """)
+
+        cmd = parsed.get('command')
+        if 'command' in parsed and not isinstance(cmd, str):
             raise CallbackSyntaxError(f"""\
             in callback {name} not a string
             """)
 
-        cmd = parsed["command"]
-        return cls(name, cmd)
+        argv = parsed.get('argv')
+        if 'argv' in parsed and (
+                not isinstance(argv, list) or not argv or
+                not all(isinstance(arg, str) for arg in argv)):
+            raise CallbackSyntaxError(f"""\
+            in callback {name} argv not a non-empty list of strings
+            """)
+
+        coprocess = parsed.get('coprocess', False)
+        if not isinstance(coprocess, bool):
+            raise CallbackSyntaxError(f"""\
+            in callback {name} coprocess not a bool
+            """)
+
+        fields = parsed.get('fields')
+        if 'fields' in parsed and (
+                not isinstance(fields, list) or
+                not all(isinstance(field, str) for field in fields)):
+            raise CallbackSyntaxError(f"""\
+            in callback {name} fields not a list of strings
+            """)
+
+        output_limit = parsed.get('output_limit', 65536)
+        if not isinstance(output_limit, int) or \
+                isinstance(output_limit, bool) or output_limit <= 0:
+            raise CallbackSyntaxError(f"""\
+            in callback {name} output_limit not a positive int
+            """)
+
+        max_concurrency = parsed.get('max_concurrency', 0)
+        if not isinstance(max_concurrency, int) or \
+                isinstance(max_concurrency, bool) or max_concurrency < 0:
+            raise CallbackSyntaxError(f"""\
+            in callback {name} max_concurrency not a non-negative int
+            """)
+
+        timeout = parsed.get('timeout')
+        if 'timeout' in parsed and (
+                not isinstance(timeout, (int, float)) or
+                isinstance(timeout, bool) or timeout <= 0):
+            raise CallbackSyntaxError(f"""\
+            in callback {name} timeout not a positive number
+            """)
+
+        batch = parsed.get('batch')
+        if 'batch' in parsed:
+            if not isinstance(batch, dict):
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' batch must be a dictionary")
+
+            for key in batch:
+                if key not in ['size', 'wait', 'input', 'item']:
+                    raise CallbackSyntaxError(
+                        f"in callback '{name}' invalid batch key {key}")
+
+            size = batch.get('size', 1000)
+            if not isinstance(size, int) or isinstance(size, bool) or \
+                    size < 1:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' invalid batch size")
+
+            wait = batch.get('wait', 1)
+            if not isinstance(wait, (int, float)) or \
+                    isinstance(wait, bool) or wait <= 0:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' invalid batch wait")
+
+            if batch.get('input', 'argv') not in ['argv', 'stdin']:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' invalid batch input")
+
+            if not isinstance(batch.get('item', ''), str):
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' batch item not a str")
+
+        limits = None
+        keys = ['nice', 'ionice', 'ionice_level', 'affinity', 'rlimits']
+        if any(key in parsed for key in keys):
+            if not isinstance(parsed.get('rlimits', {}), dict):
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' rlimits must be a dictionary")
+            try:
+                limits = ProcessLimits(**{key: parsed[key] for key in keys
+                                          if key in parsed})
+            except ValueError as err:
+                raise CallbackSyntaxError(f"in callback '{name}' {err}")
+
+        when = cls.when_from_yaml(name, parsed)
+        try:
+            return cls(name, cmd, when, argv, coprocess, fields,
+                       output_limit, max_concurrency, timeout, batch,
+                       limits)
+        except ValueError as err:
+            raise CallbackSyntaxError(f"""\
+            in callback {name} invalid command ({err})
+            """)
 
 
 class LoggerCallback(AbstractCallback):
@@ -236,15 +1103,20 @@ class LoggerCallback(AbstractCallback):
     Callback implementing logger calls
     """
 
-    def __init__(self, name: str, level: str, message: str) -> None:
+    def __init__(self, name: str, level: str, message: str,
+                 when: Optional[Condition] = None) -> None:
         """
         :param name: unique identifier
         :param level: logging level
         :param message: message to pass to logger
+        :param when: condition for calling the callback
+
+        :raises ValueError: on invalid attribute fields in ``message``
         """
         self.name = name
         self.level = level
-        self.message = message
+        self.message = Template(message)
+        self.when = when
         super().__init__()
 
     async def __call__(self, task: 'AbstractTask',
@@ -261,6 +1133,9 @@ class LoggerCallback(AbstractCallback):
         method = getattr(logger, self.level)
         method(message)
 
+    def templates(self) -> list[Template]:
+        return [self.message]
+
     @classmethod
     def from_yaml(cls, name: str, data: str) -> Self:
         """
@@ -270,6 +1145,7 @@ class LoggerCallback(AbstractCallback):
 
             level: [error | info | debug | ... (see Loguru docs)]
             message: message
+            when: size > 1 * MiB
 
         :param name: unique identifier
         :param data: YAML snippet
@@ -315,19 +1191,189 @@ class LoggerCallback(AbstractCallback):
             """)
 
         message = parsed["message"]
-        return cls(name, level, message)
+        when = cls.when_from_yaml(name, parsed)
+        try:
+            return cls(name, level, message, when)
+        except ValueError as err:
+            raise CallbackSyntaxError(f"""\
+            in callback {name} invalid message ({err})
+            """)
+
+
+class MailDigest:
+    """
+    Digest of the calls of a :class:`MailCallback`.
+
+    The mails of calls are collected for up to ``size`` calls or ``wait``
+    seconds and sent as a single mail: a summary counting the calls per
+    task and per ``change`` attribute, followed by a section per call with
+    its subject and message. Sender and recipient are those of the first
+    call, attachments of all calls are attached once. A digest of a single
+    call is sent as is.
+    """
+
+    def __init__(self, callback: 'MailCallback', size: int = 100,
+                 wait: float = 60) -> None:
+        """
+        :param callback: callback sending digests
+        :param size: maximum number of calls of a digest
+        :param wait: maximum number of seconds a digest is collected
+        """
+        self.callback = callback
+        self.size = size
+        self.wait = wait
+        self.entries: list[tuple[datetime.datetime, str, Optional[str],
+                                 email.message.EmailMessage]] = []
+        self.timer: Optional[asyncio.Task] = None
+        self.flushers: set[asyncio.Task] = set()
+        self.error: Optional[Exception] = None
+
+    async def put(self, message: email.message.EmailMessage, task: str,
+                  change: Optional[str] = None):
+        """
+        Add the mail of a call to the current digest and send the digest
+        once it is full.
+
+        :param message: rendered mail of the call
+        :param task: name of the calling task
+        :param change: ``change`` attribute of the call (if any)
+
+        :raises Exception: exception previously raised by a digest sent in
+                           the background
+        """
+        if self.error is not None:
+            err, self.error = self.error, None
+            raise err
+
+        self.entries.append((datetime.datetime.now(), task, change,
+                             message))
+
+        if len(self.entries) >= self.size:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self.expire())
+            self.flushers.add(self.timer)
+            self.timer.add_done_callback(self.flushers.discard)
+
+    async def expire(self):
+        """
+        Send the current digest after ``wait`` seconds.
+        """
+        await asyncio.sleep(self.wait)
+        self.timer = None
+        try:
+            await self.flush()
+        except Exception as err:
+            self.error = err
+
+    async def flush(self):
+        """
+        Send the current digest.
+        """
+        entries, self.entries = self.entries, []
+        if not entries:
+            return
+
+        logger.debug(f'callback {self.callback.name} sends a digest of '
+                     f'{len(entries)} calls')
+        await self.callback.send(self.compose(entries))
+
+    async def stop(self):
+        """
+        Wait for digests sent in the background and send the current
+        digest.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        await asyncio.gather(*self.flushers, return_exceptions=True)
+        if self.error is not None:
+            err, self.error = self.error, None
+            logger.error(f'callback {self.callback.name} digest failed '
+                         f'({err})')
+        await self.flush()
+
+    @staticmethod
+    def counts(values: list[str]) -> str:
+        """
+        :return: occurrences of ``values`` (in order of appearance)
+        """
+        counts: dict[str, int] = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        return ', '.join(f'{value} {count}'
+                         for value, count in counts.items())
+
+    def compose(self, entries: list[tuple[datetime.datetime, str,
+                                          Optional[str],
+                                          email.message.EmailMessage]]
+                ) -> email.message.EmailMessage:
+        """
+        :return: digest mail of ``entries``
+        """
+        if len(entries) == 1:
+            return entries[0][3]
+
+        first = entries[0][3]
+        digest = email.message.EmailMessage()
+        digest['Subject'] = f'[{len(entries)} events] {first["Subject"]}'
+        digest['From'] = first['From']
+        digest['To'] = first['To']
+
+        fmt = '%Y-%m-%d %H:%M:%S'
+        lines = [f'{len(entries)} events from '
+                 f'{entries[0][0].strftime(fmt)} to '
+                 f'{entries[-1][0].strftime(fmt)}',
+                 f'tasks: {self.counts([entry[1] for entry in entries])}']
+        changes = [entry[2] for entry in entries if entry[2] is not None]
+        if changes:
+            lines.append(f'changes: {self.counts(changes)}')
+
+        attachments = []
+        for n, (time, task, _, message) in enumerate(entries, 1):
+            body = message.get_body(('plain',))
+            content = body.get_content().rstrip() if body else ''
+            lines += ['', f'[{n}/{len(entries)}] {time.strftime(fmt)} '
+                          f'{task}: {message["Subject"]}', content]
+            for part in message.iter_attachments():
+                attachment = (part.get_filename(),
+                              part.get_content_maintype(),
+                              part.get_content_subtype(),
+                              part.get_payload(decode=True))
+                if attachment not in attachments:
+                    attachments.append(attachment)
+
+        digest.set_content('\n'.join(lines) + '\n')
+        for filename, maintype, subtype, data in attachments:
+            digest.add_attachment(data, maintype=maintype, subtype=subtype,
+                                  filename=filename)
+        return digest
 
 
 class MailCallback(AbstractCallback):
     """
     Callback implementing sending simple notification mails with
     attachments.
+
+    Mails are sent over sessions pooled per ``(host, port, login)`` (see
+    :class:`yasmon.smtp.SMTPPool`). While the callback is started, mails
+    are queued in the shared :class:`yasmon.smtp.MailOutbox` of the pool,
+    which sends, retries and spools them in the background; otherwise
+    they are sent directly.
+
+    With a :class:`MailDigest` (``digest``), the mails of calls are
+    collected and sent as a single digest mail instead.
     """
 
     def __init__(self, name: str, host: str, port: int, login: str,
                  password: str, security: str, toaddr: str, subject: str,
                  fromaddr: str, message: str, attach: list[str],
-                 delay: int) -> None:
+                 delay: int, when: Optional[Condition] = None,
+                 spool: Optional[str] = None,
+                 digest: Optional[dict] = None) -> None:
         """
         :param name: unique callback identifier
         :param host: smtp host
@@ -339,6 +1385,14 @@ class MailCallback(AbstractCallback):
         :param subject: mail subject
         :param fromaddr: from address
         :param message: message
+        :param when: condition for calling the callback
+        :param spool: directory for mails which cannot be sent
+        :param digest: keyword arguments of a :class:`MailDigest` (replaces
+                       ``delay``)
+
+        :raises ValueError: on invalid attribute fields in ``toaddr``,
+                            ``subject``, ``fromaddr``, ``message`` or
+                            ``attach``
         """
         self.name = name
         self.host = host
@@ -346,43 +1400,31 @@ class MailCallback(AbstractCallback):
         self.login = login
         self.password = password
         self.security = security
-        self.toaddr = toaddr
-        self.subject = subject
-        self.fromaddr = fromaddr
-        self.message = message
-        self.attach = attach
+        self.toaddr = Template(toaddr)
+        self.subject = Template(subject)
+        self.fromaddr = Template(fromaddr)
+        self.message = Template(message)
+        self.attach = [Template(attachment) for attachment in attach]
         self.delay = delay
+        self.when = when
+        self.spool = spool
+        self.pool = SMTPPool.get(host, port, login, password, security)
+        self.outbox = MailOutbox.get(self.pool)
+        self.started = False
+        self.digest = MailDigest(self, **digest) if digest is not None \
+            else None
         super().__init__()
 
-    def send_message_starttls(self, message: email.message.EmailMessage):
-        """
-        Send message using STARTTLS.
-        """
-
-        context = ssl.create_default_context()
-        server = smtplib.SMTP(self.host, self.port)
-        try:
-            server.starttls(context=context)
-            server.login(self.login, self.password)
-            server.send_message(message)
-        except Exception:
-            raise
-        finally:
-            server.quit()
+    async def start(self):
+        await self.outbox.start(self.spool, self.name)
+        self.started = True
 
-    def send_message_ssl(self, message: email.message.EmailMessage):
-        """
-        Send message using SSL.
-        """
-
-        try:
-            server = smtplib.SMTP_SSL(self.host, self.port)
-            server.login(self.login, self.password)
-            server.send_message(message)
-        except Exception:
-            raise
-        finally:
-            server.quit()
+    async def stop(self):
+        if self.digest is not None:
+            await self.digest.stop()
+        if self.started:
+            self.started = False
+            await self.outbox.stop()
 
     def process_attachments(self, message: email.message.EmailMessage,
                             attrs: dict[str, str]) -> None:
@@ -426,7 +1468,7 @@ class MailCallback(AbstractCallback):
                        attrs: dict[str, str]) -> None:
         await super().__call__(task, attrs)
 
-        if self.delay > 0:
+        if self.delay > 0 and self.digest is None:
             logger.debug(f'{self.name} ({self.__class__}) '
                          f'delayed for {self.delay}')
             await asyncio.sleep(self.delay)
@@ -446,15 +1488,28 @@ class MailCallback(AbstractCallback):
         except CallbackCircularAttributeError:
             raise
 
+        if self.digest is not None:
+            await self.digest.put(message, task.name, attrs.get('change'))
+            return
+
+        await self.send(message)
+
+    async def send(self, message: email.message.EmailMessage):
+        """
+        Queue ``message`` in the outbox if the callback is started, send it
+        directly otherwise.
+
+        :raises CallbackError: if ``message`` cannot be sent directly
+        """
+        if self.started:
+            await self.outbox.put(message, self.spool, self.name)
+            logger.debug(f'{self.name} ({self.__class__}) '
+                         f'queued a mail')
+            return
+
         try:
             loop = asyncio.get_event_loop()
-            match self.security:
-                case 'starttls':
-                    await loop.run_in_executor(
-                        None, self.send_message_starttls, message)
-                case 'ssl':
-                    await loop.run_in_executor(
-                        None, self.send_message_ssl, message)
+            await loop.run_in_executor(None, self.pool.send, message)
             logger.debug(f'{self.name} ({self.__class__}) '
                          f'sent a mail')
         except Exception as err:
@@ -462,6 +1517,10 @@ class MailCallback(AbstractCallback):
                 f"in callback '{self.name}' exception "
                 f"'{err.__class__.__name__}' was raised, {err}")
 
+    def templates(self) -> list[Template]:
+        return [self.subject, self.fromaddr, self.toaddr, self.message,
+                *self.attach]
+
     @classmethod
     def from_yaml(cls, name: str, data: str) -> Self:
         """
@@ -482,6 +1541,17 @@ class MailCallback(AbstractCallback):
                 - patch/to/file1
                 - patch/to/file2
             delay: 42
+            when: path.endswith('.csv')
+            spool: /var/spool/yasmon
+
+        Instead of ``delay``, calls can be collected in a digest (see
+        :class:`MailDigest`):
+
+        .. code:: yaml
+
+            digest:
+                size: 100
+                wait: 60
 
         :param name: unique identifier
         :param data: YAML snippet
@@ -585,5 +1655,44 @@ class MailCallback(AbstractCallback):
                 f"in callback '{name}' invalid "
                 f"security '{security}' value")
 
-        return cls(name, host, port, login, password, security,
-                   toaddr, subject, fromaddr, message, attach, delay)
+        spool = parsed.get('spool')
+        if spool is not None and not isinstance(spool, str):
+            raise CallbackSyntaxError(
+                f"in callback '{name}' 'spool' not a str")
+
+        digest = parsed.get('digest')
+        if 'digest' in parsed:
+            if not isinstance(digest, dict):
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' digest must be a dictionary")
+
+            if 'delay' in parsed:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' 'delay' and 'digest' are "
+                    f"exclusive")
+
+            for key in digest:
+                if key not in ['size', 'wait']:
+                    raise CallbackSyntaxError(
+                        f"in callback '{name}' invalid digest key {key}")
+
+            size = digest.get('size', 100)
+            if not isinstance(size, int) or isinstance(size, bool) or \
+                    size < 1:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' invalid digest size")
+
+            wait = digest.get('wait', 60)
+            if not isinstance(wait, (int, float)) or \
+                    isinstance(wait, bool) or wait <= 0:
+                raise CallbackSyntaxError(
+                    f"in callback '{name}' invalid digest wait")
+
+        when = cls.when_from_yaml(name, parsed)
+        try:
+            return cls(name, host, port, login, password, security,
+                       toaddr, subject, fromaddr, message, attach, delay,
+                       when, spool, digest)
+        except ValueError as err:
+            raise CallbackSyntaxError(
+                f"in callback '{name}' invalid attribute field ({err})")
@@ -0,0 +1,170 @@
+from loguru import logger
+from typing import Iterator, Iterable
+import watchfiles
+import stat
+import os
+
+
+class Checkpoint:
+    """
+    Compact on-disk index of ``(path, mtime_ns, size)`` records of all
+    files in a set of watched trees.
+
+    Trees are walked depth first with entries sorted by name, so records
+    are always ordered by path components. This allows comparing a stored
+    index with a fresh walk by a streaming merge, keeping memory bounded
+    by the depth and width of the trees instead of the number of files.
+    """
+
+    header = b'yasmon-checkpoint 1\0'
+    chunk_size = 1 << 16
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: path of the index file
+        """
+        self.path = path
+
+    @staticmethod
+    def key(path: str) -> list[str]:
+        """
+        :return: sort key of ``path`` matching the walk order
+        """
+        return path.split(os.sep)
+
+    @staticmethod
+    def entries(path: str) -> list[os.DirEntry]:
+        """
+        :return: entries of directory ``path`` sorted by name
+        """
+        try:
+            with os.scandir(path) as it:
+                return sorted(it, key=lambda entry: entry.name)
+        except OSError as err:
+            logger.warning(f'checkpoint scan of {path} failed ({err})')
+            return []
+
+    @classmethod
+    def walk(cls, roots: list[str]) -> Iterator[tuple[str, int, int]]:
+        """
+        Walk ``roots`` and yield ``(path, mtime_ns, size)`` records of all
+        files in walk order. Symbolic links are not followed.
+
+        :param roots: non-overlapping absolute paths (files/directories)
+        """
+        for root in sorted(roots, key=cls.key):
+            try:
+                st = os.stat(root, follow_symlinks=False)
+            except OSError:
+                continue
+
+            if not stat.S_ISDIR(st.st_mode):
+                yield root, st.st_mtime_ns, st.st_size
+                continue
+
+            stack = [iter(cls.entries(root))]
+            while stack:
+                entry = next(stack[-1], None)
+                if entry is None:
+                    stack.pop()
+                    continue
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(iter(cls.entries(entry.path)))
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                yield entry.path, st.st_mtime_ns, st.st_size
+
+    def read(self) -> Iterator[tuple[str, int, int]]:
+        """
+        Read the stored index, yields nothing if there is none.
+        """
+        try:
+            fh = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+
+        with fh:
+            if fh.read(len(self.header)) != self.header:
+                logger.warning(f'checkpoint {self.path} is invalid '
+                               'and will be replaced')
+                return
+
+            buffer = b''
+            while chunk := fh.read(self.chunk_size):
+                *records, buffer = (buffer + chunk).split(b'\0')
+                for record in records:
+                    mtime_ns, size, path = record.split(b' ', 2)
+                    yield os.fsdecode(path), int(mtime_ns), int(size)
+
+    def write(self, records: Iterable[tuple[str, int, int]]) -> Iterator[
+            tuple[str, int, int]]:
+        """
+        Write ``records`` to the index while passing them through. The
+        index is only replaced once all records were written.
+        """
+        tmp = f'{self.path}.tmp'
+        done = False
+        try:
+            with open(tmp, 'wb') as fh:
+                fh.write(self.header)
+                for record in records:
+                    path, mtime_ns, size = record
+                    fh.write(b'%d %d ' % (mtime_ns, size) +
+                             os.fsencode(path) + b'\0')
+                    yield record
+            os.replace(tmp, self.path)
+            done = True
+        finally:
+            if not done and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def save(self, roots: list[str]):
+        """
+        Walk ``roots`` and replace the stored index.
+
+        :param roots: non-overlapping absolute paths (files/directories)
+        """
+        for _ in self.write(self.walk(roots)):
+            pass
+        logger.debug(f'checkpoint {self.path} saved')
+
+    def diff(self, roots: list[str]) -> Iterator[tuple[watchfiles.Change,
+                                                       str]]:
+        """
+        Compare the stored index with a fresh walk of ``roots`` and yield
+        the differences as changes. The stored index is replaced by the
+        fresh walk along the way.
+
+        :param roots: non-overlapping absolute paths (files/directories)
+        """
+        old = self.read()
+        new = self.write(self.walk(roots))
+        old_record = next(old, None)
+        new_record = next(new, None)
+
+        while old_record is not None or new_record is not None:
+            if old_record is None:
+                order = 1
+            elif new_record is None:
+                order = -1
+            else:
+                old_key = self.key(old_record[0])
+                new_key = self.key(new_record[0])
+                order = (old_key > new_key) - (old_key < new_key)
+
+            if order < 0:
+                yield watchfiles.Change.deleted, old_record[0]
+                old_record = next(old, None)
+            elif order > 0:
+                yield watchfiles.Change.added, new_record[0]
+                new_record = next(new, None)
+            else:
+                if old_record[1:] != new_record[1:]:
+                    yield watchfiles.Change.modified, new_record[0]
+                old_record = next(old, None)
+                new_record = next(new, None)
@@ -0,0 +1,298 @@
+from typing import Any, Callable, Mapping
+import operator
+import fnmatch
+import ast
+import re
+
+
+class ConditionSyntaxError(Exception):
+    """
+    Raised on invalid or unsupported condition expressions.
+    """
+
+    def __init__(self, message="condition syntax error"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ConditionError(Exception):
+    """
+    Raised when a condition cannot be evaluated for the given attributes.
+    """
+
+    def __init__(self, message="condition error"):
+        self.message = message
+        super().__init__(self.message)
+
+
+Evaluator = Callable[[Mapping[str, Any]], Any]
+
+
+def number(value: Any) -> Any:
+    """
+    :return: ``value`` converted to a number if it is a string
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def coerce(left: Any, right: Any) -> tuple[Any, Any]:
+    """
+    Convert a string operand to a number if the other operand is a number,
+    as attributes are usually strings (e.g. ``size``).
+    """
+    if isinstance(right, (int, float)) and not isinstance(right, bool):
+        left = number(left)
+    if isinstance(left, (int, float)) and not isinstance(left, bool):
+        right = number(right)
+    return left, right
+
+
+def multiply(left: Any, right: Any, limit: int = 1 << 16) -> Any:
+    """
+    Multiply ``left`` and ``right``.
+
+    :raises ValueError: if a repeated string or list would exceed ``limit``
+                        items
+    """
+    for seq, count in ((left, right), (right, left)):
+        if (isinstance(seq, (str, list)) and isinstance(count, int) and
+                len(seq) * count > limit):
+            raise ValueError(f'repeated sequence exceeds {limit} items')
+    return left * right
+
+
+def lookup(attrs: Mapping[str, Any], name: str) -> Any:
+    """
+    :return: value of attribute ``name``, templated task attributes are
+             rendered (see :class:`yasmon.templates.AttributePlan`)
+
+    :raises KeyError: if ``name`` is not defined
+    """
+    plan = getattr(attrs, 'plan', None)
+    if plan is not None and name in plan.templates:
+        if name in plan.errors:
+            raise ConditionError(plan.errors[name].message)
+        return plan.join(plan.resolved[name], attrs)
+    return attrs[name]
+
+
+class Condition:
+    """
+    Condition over event attributes, e.g.
+    ``size > 1 * MiB and path.endswith('.csv')``.
+
+    The expression is a small subset of Python expressions, parsed and
+    compiled into nested closures once, so evaluating a condition neither
+    parses nor calls :func:`eval`. Supported are
+
+    * attribute names, string and number literals, ``True``, ``False``,
+      ``None`` and the constants ``KiB``, ``MiB``, ``GiB`` and ``TiB``
+    * ``and``, ``or``, ``not``, comparisons (including ``in`` and
+      ``not in``) and arithmetic operators
+    * lists and tuples (e.g. ``change in ['added', 'moved']``)
+    * the functions ``int``, ``float``, ``str``, ``len``,
+      ``glob(value, pattern)`` and ``matches(value, regex)``
+    * the string methods ``startswith``, ``endswith``, ``lower``,
+      ``upper`` and ``strip``
+
+    Strings compared with or combined with numbers are converted to
+    numbers. Comparisons of empty strings (e.g. ``size`` of a deleted
+    file) with numbers do not hold. Repeating strings and lists is limited
+    to 65536 items.
+    """
+
+    constants = {'KiB': 1 << 10, 'MiB': 1 << 20, 'GiB': 1 << 30,
+                 'TiB': 1 << 40}
+
+    functions: dict[str, Callable] = {
+        'int': lambda value: int(number(value)),
+        'float': float,
+        'str': str,
+        'len': len,
+        'glob': lambda value, pattern: fnmatch.fnmatch(str(value), pattern),
+        'matches': lambda value, regex: bool(re.search(regex, str(value))),
+    }
+
+    methods = frozenset({'startswith', 'endswith', 'lower', 'upper',
+                         'strip'})
+
+    operators: dict[type, Callable] = {
+        ast.Add: operator.add, ast.Sub: operator.sub,
+        ast.Mult: multiply, ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+        ast.Eq: operator.eq, ast.NotEq: operator.ne,
+        ast.Lt: operator.lt, ast.LtE: operator.le,
+        ast.Gt: operator.gt, ast.GtE: operator.ge,
+        ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b,
+    }
+
+    # membership tests compare strings with strings, no coercion
+    uncoerced = frozenset({ast.In, ast.NotIn})
+
+    def __init__(self, expr: str) -> None:
+        """
+        :param expr: condition expression
+
+        :raises ConditionSyntaxError: on invalid or unsupported expressions
+        """
+        self.expr = expr
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as err:
+            raise ConditionSyntaxError(f'invalid condition {expr} '
+                                       f'({err.msg})')
+
+        self.names: set[str] = set()
+        self.evaluate = self.compile(tree.body)
+
+    def __call__(self, attrs: Mapping[str, Any]) -> bool:
+        """
+        Evaluate the condition.
+
+        :param attrs: attributes of an event
+
+        :raises ConditionError: on undefined attributes or invalid values
+
+        :return: ``True`` if the condition holds
+        """
+        try:
+            return bool(self.evaluate(attrs))
+        except KeyError as err:
+            raise ConditionError(f'undefined attribute {err} in condition '
+                                 f'{self.expr}')
+        except (TypeError, ValueError, ArithmeticError, MemoryError) as err:
+            raise ConditionError(f'condition {self.expr} failed ({err})')
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        """
+        Compile an expression node into a closure evaluating it.
+
+        :raises ConditionSyntaxError: on unsupported expressions
+        """
+        match node:
+            case ast.Constant(value=value) if (
+                    value is None or
+                    isinstance(value, (bool, int, float, str))):
+                return lambda attrs: value
+
+            case ast.Name(id=name) if name in self.constants:
+                value = self.constants[name]
+                return lambda attrs: value
+
+            case ast.Name(id=name):
+                self.names.add(name)
+                return lambda attrs: lookup(attrs, name)
+
+            case ast.BoolOp(op=ast.And(), values=values):
+                operands = [self.compile(value) for value in values]
+                return lambda attrs: all(f(attrs) for f in operands)
+
+            case ast.BoolOp(op=ast.Or(), values=values):
+                operands = [self.compile(value) for value in values]
+                return lambda attrs: any(f(attrs) for f in operands)
+
+            case ast.UnaryOp(op=ast.Not(), operand=operand):
+                f = self.compile(operand)
+                return lambda attrs: not f(attrs)
+
+            case ast.UnaryOp(op=ast.USub(), operand=operand):
+                f = self.compile(operand)
+                return lambda attrs: -number(f(attrs))
+
+            case ast.BinOp(left=left, op=op, right=right) if (
+                    type(op) in self.operators):
+                return self.binary(self.operators[type(op)],
+                                   self.compile(left), self.compile(right))
+
+            case ast.Compare(left=left, ops=ops, comparators=comparators):
+                if not all(type(op) in self.operators for op in ops):
+                    raise ConditionSyntaxError(
+                        f'unsupported comparison {ast.unparse(node)}')
+                return self.compare(
+                    self.compile(left),
+                    [(self.operators[type(op)], type(op) in self.uncoerced)
+                     for op in ops],
+                    [self.compile(c) for c in comparators])
+
+            case ast.List(elts=elts) | ast.Tuple(elts=elts):
+                items = [self.compile(elt) for elt in elts]
+                return lambda attrs: [f(attrs) for f in items]
+
+            case ast.Call(func=ast.Name(id=name), args=args,
+                          keywords=[]) if name in self.functions:
+                return self.call(name, args)
+
+            case ast.Call(func=ast.Attribute(value=value, attr=method),
+                          args=args, keywords=[]) if method in self.methods:
+                obj = self.compile(value)
+                arguments = [self.compile(arg) for arg in args]
+                return lambda attrs: getattr(str(obj(attrs)), method)(
+                    *(f(attrs) for f in arguments))
+
+        raise ConditionSyntaxError(f'unsupported expression '
+                                   f'{ast.unparse(node)} in condition '
+                                   f'{self.expr}')
+
+    def call(self, name: str, args: list[ast.expr]) -> Evaluator:
+        """
+        Compile a call of function ``name``. Literal regular expressions
+        of ``matches`` are compiled once.
+        """
+        if name == 'matches' and len(args) == 2:
+            match args[1]:
+                case ast.Constant(value=str(regex)):
+                    try:
+                        pattern = re.compile(regex)
+                    except re.error as err:
+                        raise ConditionSyntaxError(
+                            f'invalid regex {regex} ({err})')
+                    value = self.compile(args[0])
+                    return lambda attrs: pattern.search(
+                        str(value(attrs))) is not None
+
+        function = self.functions[name]
+        arguments = [self.compile(arg) for arg in args]
+        return lambda attrs: function(*(f(attrs) for f in arguments))
+
+    @staticmethod
+    def binary(op: Callable, left: Evaluator,
+               right: Evaluator) -> Evaluator:
+        """
+        Compile a binary operation with operand coercion.
+        """
+        return lambda attrs: op(*coerce(left(attrs), right(attrs)))
+
+    @staticmethod
+    def compare(left: Evaluator, ops: list[tuple[Callable, bool]],
+                comparators: list[Evaluator]) -> Evaluator:
+        """
+        Compile a (chained) comparison with operand coercion. Empty strings
+        (attributes of missing paths) compared with numbers do not hold.
+
+        :param ops: operators and whether to skip coercion
+        """
+        def holds(op, uncoerced, a, b):
+            if uncoerced:
+                return op(a, b)
+            try:
+                return op(*coerce(a, b))
+            except ValueError:
+                if isinstance(a, str) and not a or \
+                        isinstance(b, str) and not b:
+                    return False
+                raise
+
+        def evaluate(attrs):
+            a = left(attrs)
+            for (op, uncoerced), comparator in zip(ops, comparators):
+                b = comparator(attrs)
+                if not holds(op, uncoerced, a, b):
+                    return False
+                a = b
+            return True
+        return evaluate
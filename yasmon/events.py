@@ -0,0 +1,224 @@
+from enum import IntEnum
+from collections import OrderedDict
+from typing import Optional, Hashable, Iterable
+import watchfiles
+import heapq
+import os
+
+
+class Change(IntEnum):
+    """
+    Changes reported by :class:`yasmon.tasks.WatchfilesTask`.
+
+    The first three values match :class:`watchfiles.Change`, further
+    values are derived from these by the task.
+    """
+
+    added = 1
+    modified = 2
+    deleted = 3
+    moved = 4
+    settled = 5
+
+
+class RenameDetector:
+    """
+    Pairs ``deleted`` and ``added`` changes within a batch into ``moved``
+    changes.
+
+    A pair is detected if the deleted path had the same device and inode
+    as the added path, or if both have the same file name and the same
+    size. Deleted paths of unknown size are only paired by inode, since
+    unrelated files often share a name.
+    Inodes and sizes are taken from a bounded LRU cache of recently seen
+    paths.
+    """
+
+    def __init__(self, max_entries: int = 65536) -> None:
+        """
+        :param max_entries: maximum number of cached paths
+        """
+        self.max_entries = max_entries
+        self.cache: OrderedDict[str, tuple[int, int, int]] = OrderedDict()
+
+    def remember(self, path: str) -> Optional[tuple[int, int, int]]:
+        """
+        Cache ``(dev, inode, size)`` of ``path``.
+
+        :return: cached entry or ``None`` if ``path`` does not exist
+        """
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            self.cache.pop(path, None)
+            return None
+
+        entry = (st.st_dev, st.st_ino, st.st_size)
+        self.cache[path] = entry
+        self.cache.move_to_end(path)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def match(src: str, known: Optional[tuple[int, int, int]],
+              added: dict[str, Optional[tuple[int, int, int]]]
+              ) -> Optional[str]:
+        """
+        Find the added path matching the deleted path ``src``.
+
+        :param src: deleted path
+        :param known: cached ``(dev, inode, size)`` of ``src`` (if any)
+        :param added: added paths with their ``(dev, inode, size)``
+
+        :return: matching added path or ``None``
+        """
+        if known is None:
+            return None
+
+        for dest, entry in added.items():
+            if entry is not None and entry[:2] == known[:2]:
+                return dest
+
+        name = os.path.basename(src)
+        for dest, entry in added.items():
+            if entry is None or os.path.basename(dest) != name:
+                continue
+            if known[2] == entry[2]:
+                return dest
+
+        return None
+
+    def pair(self, changes: set[tuple[watchfiles.Change, str]]
+             ) -> tuple[list[tuple[Change, str]], list[tuple[str, str]]]:
+        """
+        Pair deleted and added paths in ``changes``.
+
+        :param changes: batch of ``(change, path)`` tuples
+
+        :return: unpaired changes and ``(src_path, dest_path)`` pairs
+        """
+        deleted = sorted(path for (change, path) in changes
+                         if change == Change.deleted)
+        added = {path: self.remember(path) for (change, path)
+                 in sorted(changes) if change == Change.added}
+
+        moves = []
+        for src in deleted:
+            dest = self.match(src, self.cache.pop(src, None), added)
+            if dest is not None:
+                del added[dest]
+                moves.append((src, dest))
+
+        paired = {path for move in moves for path in move}
+        unpaired = [(Change(change), path) for (change, path) in changes
+                    if path not in paired or change == Change.modified]
+        for (change, path) in unpaired:
+            if change == Change.modified:
+                self.remember(path)
+        return unpaired, moves
+
+
+class SettleTracker:
+    """
+    Tracks files being written and reports them as ``settled`` once their
+    size and modification time did not change for ``quiet`` seconds.
+
+    Deadlines of all tracked files are kept in a single timer heap, so a
+    single coroutine can wait for the next due file. Entries superseded by
+    a later change of the same file are skipped lazily.
+    """
+
+    def __init__(self, quiet: float) -> None:
+        """
+        :param quiet: quiet period (seconds)
+        """
+        self.quiet = quiet
+        self.heap: list[tuple[float, str]] = []
+        self.files: dict[str, list] = {}
+
+    @staticmethod
+    def stat(path: str) -> Optional[tuple[int, int]]:
+        """
+        :return: ``(size, mtime_ns)`` of ``path`` or ``None`` if ``path``
+                 does not exist
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def touch(self, path: str, now: float, owners: Iterable[Hashable] = ()):
+        """
+        Track a change of ``path`` and restart its quiet period.
+
+        :param path: changed path
+        :param now: current (monotonic) time
+        :param owners: interested parties, passed on once ``path`` settled
+        """
+        deadline = now + self.quiet
+        entry = self.files.setdefault(path, [deadline, None, {}])
+        entry[0] = deadline
+        entry[1] = self.stat(path)
+        entry[2].update(dict.fromkeys(owners))
+        heapq.heappush(self.heap, (deadline, path))
+
+        # drop superseded entries if they dominate the heap
+        if len(self.heap) > 2 * len(self.files) + 64:
+            self.heap = [(item[0], key) for key, item in self.files.items()]
+            heapq.heapify(self.heap)
+
+    def forget(self, path: str):
+        """
+        Stop tracking ``path`` (e.g. because it was deleted).
+        """
+        self.files.pop(path, None)
+
+    def clear(self):
+        """
+        Stop tracking all files.
+        """
+        self.files.clear()
+        self.heap.clear()
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        :return: deadline of the next due file or ``None`` if no files
+                 are tracked
+        """
+        while self.heap:
+            deadline, path = self.heap[0]
+            entry = self.files.get(path)
+            if entry is not None and entry[0] == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def due(self, now: float) -> list[tuple[str, list[Hashable]]]:
+        """
+        Pop all files whose quiet period has passed. Files that changed
+        since their last tracked change start a new quiet period, files
+        that do not exist anymore are dropped.
+
+        :param now: current (monotonic) time
+
+        :return: settled paths with their owners
+        """
+        settled = []
+        while (deadline := self.next_deadline()) is not None:
+            if deadline > now:
+                break
+
+            _, path = heapq.heappop(self.heap)
+            entry = self.files[path]
+            current = self.stat(path)
+            if current is None:
+                del self.files[path]
+            elif current != entry[1]:
+                entry[0], entry[1] = now + self.quiet, current
+                heapq.heappush(self.heap, (entry[0], path))
+            else:
+                del self.files[path]
+                settled.append((path, list(entry[2])))
+        return settled
@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import hashlib
+import os
+
+
+class Fingerprinter:
+    """
+    Content fingerprints of watched files for suppressing modifications
+    that did not change the content (e.g. ``touch`` or rewriting identical
+    content).
+
+    Files are hashed in chunks by a thread pool. Digests are cached by
+    ``(dev, inode, mtime_ns, size)`` in a bounded LRU cache, so unchanged
+    files (e.g. renamed ones) are not hashed again, and concurrent requests
+    for the same file share a single hashing job. A fingerprinter is shared
+    by all watches of a task, each comparing digests with its own
+    :class:`Fingerprints`.
+    """
+
+    def __init__(self, algorithm: str = 'sha256', workers: int = 4,
+                 max_entries: int = 65536) -> None:
+        """
+        :param algorithm: :mod:`hashlib` algorithm
+        :param workers: number of hashing threads
+        :param max_entries: maximum number of cached digests
+
+        :raises ValueError: if ``algorithm`` is not available or has a
+                            variable digest size
+        """
+        if hashlib.new(algorithm).digest_size == 0:
+            raise ValueError(f'variable digest size of {algorithm}')
+        self.algorithm = algorithm
+        self.workers = workers
+        self.max_entries = max_entries
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.cache: OrderedDict[tuple[int, int, int, int], str] = \
+            OrderedDict()
+        self.hashing: dict[tuple[int, int, int, int], asyncio.Future] = {}
+
+    @staticmethod
+    def key(st: os.stat_result) -> tuple[int, int, int, int]:
+        """
+        :return: cache key of a stat result
+        """
+        return st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size
+
+    def hash(self, path: str) -> tuple[str, tuple[int, int, int, int]]:
+        """
+        Hash the content of ``path`` (called in the thread pool).
+
+        :return: digest and cache key of the hashed file
+        """
+        with open(path, 'rb') as fh:
+            digest = hashlib.file_digest(fh, self.algorithm).hexdigest()
+            return digest, self.key(os.fstat(fh.fileno()))
+
+    @staticmethod
+    def remember(cache: OrderedDict, key, value, max_entries: int):
+        """
+        Store ``value`` in the LRU ``cache`` bounded by ``max_entries``.
+        """
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > max_entries:
+            cache.popitem(last=False)
+
+    async def compute(self, path: str,
+                      key: tuple[int, int, int, int]) -> str:
+        """
+        Hash ``path`` in the thread pool (started if needed) and cache the
+        digest under ``key``.
+
+        :return: digest of ``path``
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='fingerprint')
+        loop = asyncio.get_running_loop()
+        digest, hashed = await loop.run_in_executor(self.executor,
+                                                    self.hash, path)
+        # the file changed while hashing, do not cache
+        if hashed == key:
+            self.remember(self.cache, key, digest, self.max_entries)
+        return digest
+
+    async def digest(self, path: str) -> Optional[str]:
+        """
+        :param path: path of a file
+
+        :return: digest of ``path`` or ``None`` if it could not be read
+        """
+        try:
+            key = self.key(os.stat(path))
+        except OSError:
+            return None
+
+        digest = self.cache.get(key)
+        if digest is not None:
+            self.cache.move_to_end(key)
+            return digest
+
+        if (hashing := self.hashing.get(key)) is None:
+            hashing = asyncio.ensure_future(self.compute(path, key))
+            self.hashing[key] = hashing
+            hashing.add_done_callback(lambda _: self.hashing.pop(key, None))
+        try:
+            return await asyncio.shield(hashing)
+        except OSError:
+            return None
+
+    def close(self):
+        """
+        Shut down the thread pool (started again upon the next
+        :func:`digest`).
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class Fingerprints:
+    """
+    Last fingerprint of each path seen by one watch, kept in a bounded LRU
+    cache to decide whether the content changed. Digests are computed by a
+    (shared) :class:`Fingerprinter`.
+    """
+
+    def __init__(self, fingerprinter: Fingerprinter) -> None:
+        """
+        :param fingerprinter: fingerprinter computing the digests
+        """
+        self.fingerprinter = fingerprinter
+        self.digests: OrderedDict[str, str] = OrderedDict()
+
+    async def check(self, path: str) -> tuple[bool, Optional[str]]:
+        """
+        Fingerprint ``path`` and compare it with its last fingerprint.
+
+        :param path: path of a file
+
+        :return: whether the content changed and its digest, which is
+                 ``None`` if ``path`` could not be read
+        """
+        digest = await self.fingerprinter.digest(path)
+        if digest is None:
+            self.forget(path)
+            return True, None
+
+        changed = self.digests.get(path) != digest
+        self.fingerprinter.remember(self.digests, path, digest,
+                                    self.fingerprinter.max_entries)
+        return changed, digest
+
+    def forget(self, path: str):
+        """
+        Forget the last fingerprint of ``path`` (e.g. if it was deleted).
+        """
+        self.digests.pop(path, None)
+
+    def close(self):
+        """
+        Forget all fingerprints.
+        """
+        self.digests.clear()
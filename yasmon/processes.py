@@ -0,0 +1,462 @@
+from loguru import logger
+from typing import Optional, Any
+import subprocess
+import platform
+import resource
+import asyncio
+import signal
+import json
+import sys
+import os
+
+
+class ResourceUsage:
+    """
+    Resource usage of subprocesses, as reported by ``wait4``.
+    """
+
+    def __init__(self, count: int = 0, user: float = 0, system: float = 0,
+                 maxrss: int = 0, inblock: int = 0, oublock: int = 0):
+        """
+        :param count: number of processes
+        :param user: user CPU time in seconds
+        :param system: system CPU time in seconds
+        :param maxrss: maximum resident set size of a process in KiB
+        :param inblock: number of blocks read
+        :param oublock: number of blocks written
+        """
+        self.count = count
+        self.user = user
+        self.system = system
+        self.maxrss = maxrss
+        self.inblock = inblock
+        self.oublock = oublock
+
+    @classmethod
+    def from_rusage(cls, rusage: Any) -> 'ResourceUsage':
+        """
+        :param rusage: :class:`resource.struct_rusage` of a process
+        """
+        return cls(1, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss,
+                   rusage.ru_inblock, rusage.ru_oublock)
+
+    def __iadd__(self, other: 'ResourceUsage') -> 'ResourceUsage':
+        self.count += other.count
+        self.user += other.user
+        self.system += other.system
+        self.maxrss = max(self.maxrss, other.maxrss)
+        self.inblock += other.inblock
+        self.oublock += other.oublock
+        return self
+
+    def __add__(self, other: 'ResourceUsage') -> 'ResourceUsage':
+        usage = ResourceUsage()
+        usage += self
+        usage += other
+        return usage
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ResourceUsage):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def as_dict(self) -> dict[str, float]:
+        """
+        :return: usage as a dictionary
+        """
+        return {'count': self.count, 'user': self.user,
+                'system': self.system, 'maxrss': self.maxrss,
+                'inblock': self.inblock, 'oublock': self.oublock}
+
+    def __str__(self) -> str:
+        return (f'{self.count} processes, user {self.user:.3f}s, '
+                f'system {self.system:.3f}s, max rss {self.maxrss} KiB, '
+                f'blocks in {self.inblock} out {self.oublock}')
+
+
+class ProcessLimits:
+    """
+    Scheduling priority and resource limits of a process, applied in the
+    child before the command is executed, so anything the command starts
+    inherits them.
+
+    Applying them as ``preexec_fn`` of :class:`subprocess.Popen` is not
+    safe in a process running threads. The command is therefore started by
+    a small Python trampoline applying the settings and executing the
+    command in its place (see :func:`command`). Errors of the trampoline,
+    including executing the command, are reported on a status pipe.
+    """
+
+    #: I/O scheduling classes of ``ioprio_set``
+    ioprio_classes = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+    #: ``ioprio_set`` syscall numbers by machine
+    ioprio_syscalls = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'arm64': 30, 'riscv64': 30,
+                       'armv7l': 314, 'ppc64': 273, 'ppc64le': 273,
+                       's390x': 282}
+
+    #: applies the settings passed as JSON in ``argv[1]`` and executes
+    #: ``argv[2:]``, or writes the error to the status file descriptor
+    trampoline = '''
+import json, os, resource, sys
+settings = json.loads(sys.argv[1])
+status = settings['status']
+try:
+    if settings['nice'] is not None:
+        niceness = os.getpriority(os.PRIO_PROCESS, 0) + settings['nice']
+        os.setpriority(os.PRIO_PROCESS, 0, max(-20, min(19, niceness)))
+    if settings['ioprio'] is not None:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        # IOPRIO_WHO_PROCESS
+        if libc.syscall(settings['syscall'], 1, 0, settings['ioprio']) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    if settings['affinity'] is not None:
+        os.sched_setaffinity(0, settings['affinity'])
+    for limit, value in settings['limits']:
+        resource.setrlimit(limit, (value, value))
+    os.set_inheritable(status, False)
+    try:
+        os.execvp(sys.argv[2], sys.argv[2:])
+    except OSError as err:
+        err.filename = sys.argv[2]
+        raise
+except OSError as err:
+    os.write(status, json.dumps([err.errno, err.strerror,
+                                 err.filename]).encode())
+    os._exit(127)
+'''
+
+    #: supported resource limits
+    rlimits = {'cpu': resource.RLIMIT_CPU, 'as': resource.RLIMIT_AS,
+               'nofile': resource.RLIMIT_NOFILE,
+               'fsize': resource.RLIMIT_FSIZE,
+               'nproc': resource.RLIMIT_NPROC,
+               'core': resource.RLIMIT_CORE}
+
+    def __init__(self, nice: Optional[int] = None,
+                 ionice: Optional[str] = None, ionice_level: int = 4,
+                 affinity: Optional[list[int]] = None,
+                 rlimits: Optional[dict[str, int]] = None) -> None:
+        """
+        :param nice: niceness increment (see ``nice -n``)
+        :param ionice: I/O scheduling class, ``realtime``, ``best-effort``
+                       or ``idle``
+        :param ionice_level: I/O priority within ``realtime`` and
+                             ``best-effort`` (0 highest, 7 lowest)
+        :param affinity: CPUs the process may run on
+        :param rlimits: limits by resource (``cpu`` seconds, ``as``
+                        address space bytes, ``nofile`` open files,
+                        ``fsize`` file size bytes, ``nproc`` processes,
+                        ``core`` core file size bytes)
+
+        :raises ValueError: on invalid values, limits exceeding the hard
+                            limits of the service or if ``ionice`` is not
+                            supported on this machine
+        """
+        if nice is not None and (not isinstance(nice, int) or
+                                 isinstance(nice, bool) or
+                                 not -40 <= nice <= 40):
+            raise ValueError(f'invalid nice {nice}')
+        self.nice = nice
+
+        self.ioprio = None
+        self.syscall = None
+        if ionice is not None:
+            if ionice not in self.ioprio_classes:
+                raise ValueError(f'invalid ionice class {ionice}')
+            if not isinstance(ionice_level, int) or \
+                    isinstance(ionice_level, bool) or \
+                    not 0 <= ionice_level <= 7:
+                raise ValueError(f'invalid ionice level {ionice_level}')
+            self.syscall = self.ioprio_syscalls.get(platform.machine())
+            if self.syscall is None:
+                raise ValueError(f'ionice not supported on '
+                                 f'{platform.machine()}')
+            level = 0 if ionice == 'idle' else ionice_level
+            self.ioprio = self.ioprio_classes[ionice] << 13 | level
+
+        if affinity is not None and (
+                not isinstance(affinity, list) or not affinity or
+                not all(isinstance(cpu, int) and not isinstance(cpu, bool)
+                        and cpu >= 0 for cpu in affinity)):
+            raise ValueError(f'invalid affinity {affinity}')
+        self.affinity = affinity
+
+        self.limits: list[tuple[int, int]] = []
+        for name, value in (rlimits or {}).items():
+            if name not in self.rlimits:
+                raise ValueError(f'invalid rlimit {name}')
+            if not isinstance(value, int) or isinstance(value, bool) or \
+                    value < 0:
+                raise ValueError(f'invalid rlimit {name} {value}')
+            _, hard = resource.getrlimit(self.rlimits[name])
+            if hard != resource.RLIM_INFINITY and value > hard:
+                raise ValueError(f'rlimit {name} {value} exceeds hard '
+                                 f'limit {hard}')
+            self.limits.append((self.rlimits[name], value))
+
+    def command(self, args: str | list[str], shell: bool,
+                status: int) -> list[str]:
+        """
+        :param args: shell command or argument vector
+        :param shell: execute ``args`` by ``/bin/sh``
+        :param status: file descriptor the trampoline reports errors on
+
+        :return: argument vector executing ``args`` with priority and
+                 limits applied
+        """
+        if shell:
+            args = ['/bin/sh', '-c', args]
+        settings = {'status': status, 'nice': self.nice,
+                    'ioprio': self.ioprio, 'syscall': self.syscall,
+                    'affinity': self.affinity, 'limits': self.limits}
+        return [sys.executable, '-I', '-S', '-c', self.trampoline,
+                json.dumps(settings), *args]
+
+
+class Process:
+    """
+    Subprocess with asyncio streams, reaped by ``wait4`` to collect its
+    resource usage.
+
+    :mod:`asyncio` subprocesses are reaped by the child watcher, which
+    discards the resource usage. Processes are therefore started by
+    :class:`subprocess.Popen` and reaped once their pidfd becomes readable
+    (or by a thread blocking in ``wait4`` if pidfds are not supported).
+
+    Use :func:`create` to start a process.
+    """
+
+    def __init__(self, popen: subprocess.Popen) -> None:
+        """
+        :param popen: started process
+        """
+        self.popen = popen
+        self.pid = popen.pid
+        self.returncode: Optional[int] = None
+        self.usage: Optional[ResourceUsage] = None
+        self.stdin: Optional[asyncio.StreamWriter] = None
+        self.stdout: Optional[asyncio.StreamReader] = None
+        self.stderr: Optional[asyncio.StreamReader] = None
+        self.exited: asyncio.Future = \
+            asyncio.get_running_loop().create_future()
+
+    @classmethod
+    async def create(cls, args: str | list[str], shell: bool = False,
+                     stdin: bool = False,
+                     limits: Optional[ProcessLimits] = None,
+                     **kwargs) -> 'Process':
+        """
+        Start a process with piped stdout and stderr.
+
+        :param args: shell command or argument vector
+        :param shell: execute ``args`` by ``/bin/sh``
+        :param stdin: pipe stdin (``/dev/null`` otherwise)
+        :param limits: priority and limits applied to the process before
+                       the command is executed
+        :param kwargs: further arguments of :class:`subprocess.Popen`
+
+        :raises OSError: if the process cannot be started or ``limits``
+                         cannot be applied
+
+        :return: started process
+        """
+        loop = asyncio.get_running_loop()
+        status = None
+        if limits is not None:
+            status = os.pipe()
+            args = limits.command(args, shell, status[1])
+            shell = False
+            kwargs['pass_fds'] = (*kwargs.get('pass_fds', ()), status[1])
+        popen = None
+        try:
+            popen = subprocess.Popen(
+                args, shell=shell,
+                stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+        except subprocess.SubprocessError as err:
+            raise OSError(str(err))
+        finally:
+            if status is not None:
+                os.close(status[1])
+                if popen is None:
+                    os.close(status[0])
+
+        if status is not None:
+            # EOF once the command was executed (or the trampoline exited)
+            error = await loop.run_in_executor(None, cls.drain, status[0])
+            if error:
+                await loop.run_in_executor(None, popen.wait)
+                for pipe in (popen.stdin, popen.stdout, popen.stderr):
+                    if pipe is not None:
+                        pipe.close()
+                raise OSError(*json.loads(error))
+
+        proc = cls(popen)
+        proc.reap()
+
+        proc.stdout = await cls.reader(loop, popen.stdout)
+        proc.stderr = await cls.reader(loop, popen.stderr)
+        if stdin:
+            transport, protocol = await loop.connect_write_pipe(
+                lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()),
+                popen.stdin)
+            proc.stdin = asyncio.StreamWriter(transport, protocol, None,
+                                              loop)
+        return proc
+
+    @staticmethod
+    def drain(fd: int) -> bytes:
+        """
+        Read ``fd`` until EOF and close it (called in a thread).
+
+        :return: read data
+        """
+        data = b''
+        try:
+            while chunk := os.read(fd, 4096):
+                data += chunk
+        finally:
+            os.close(fd)
+        return data
+
+    @staticmethod
+    async def reader(loop: asyncio.AbstractEventLoop,
+                     pipe) -> asyncio.StreamReader:
+        """
+        :return: stream reading ``pipe``
+        """
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        return reader
+
+    def reap(self):
+        """
+        Reap the process once it exited. If reaping fails (e.g. because
+        the process was reaped elsewhere), :func:`wait` raises the error.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except (AttributeError, OSError):
+            future = loop.run_in_executor(None, os.wait4, self.pid, 0)
+            future.add_done_callback(self.reaped)
+            return
+
+        def readable():
+            try:
+                self.exit(*os.wait4(self.pid, 0)[1:])
+            except Exception as err:
+                self.fail(err)
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+        loop.add_reader(pidfd, readable)
+
+    def reaped(self, future: asyncio.Future):
+        """
+        Record the result of ``wait4`` executed in a thread.
+        """
+        if future.cancelled():
+            self.exited.cancel()
+            return
+        try:
+            self.exit(*future.result()[1:])
+        except Exception as err:
+            self.fail(err)
+
+    def fail(self, err: Exception):
+        """
+        Fail :func:`wait` with ``err`` if the process cannot be reaped.
+        """
+        logger.error(f'process {self.pid} cannot be reaped ({err})')
+        if not self.exited.done():
+            self.exited.set_exception(err)
+
+    def exit(self, status: int, rusage: Any):
+        """
+        Record the exit status and resource usage of the reaped process.
+        """
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self.popen.returncode = self.returncode
+        self.usage = ResourceUsage.from_rusage(rusage)
+        if not self.exited.done():
+            self.exited.set_result(self.returncode)
+
+    async def wait(self) -> int:
+        """
+        Wait for the process to exit.
+
+        :return: exit code (negative signal number if killed by a signal)
+        """
+        return await asyncio.shield(self.exited)
+
+    def send_signal(self, sig: signal.Signals):
+        """
+        Send ``sig`` to the process unless it exited.
+        """
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def kill(self):
+        """
+        Kill the process.
+        """
+        self.send_signal(signal.SIGKILL)
+
+
+class ResourceStats:
+    """
+    Resource usage aggregated per callback and per task.
+    """
+
+    def __init__(self) -> None:
+        self.callbacks: dict[str, ResourceUsage] = {}
+        self.tasks: dict[str, ResourceUsage] = {}
+
+    def record(self, callback: str, task: Optional[str], pid: int,
+               returncode: int, usage: ResourceUsage):
+        """
+        Record and log the resource usage of a reaped process.
+
+        :param callback: name of the callback starting the process
+        :param task: name of the task calling the callback (if any)
+        :param pid: process id
+        :param returncode: exit code of the process
+        :param usage: resource usage of the process
+        """
+        logger.debug(f'callback {callback} process {pid} exited with '
+                     f'{returncode} ({usage})')
+        self.callbacks.setdefault(callback, ResourceUsage())
+        self.callbacks[callback] += usage
+        if task is not None:
+            self.tasks.setdefault(task, ResourceUsage())
+            self.tasks[task] += usage
+
+    def merge(self, other: 'ResourceStats'):
+        """
+        Add the usage recorded by ``other``.
+        """
+        for mine, theirs in [(self.callbacks, other.callbacks),
+                             (self.tasks, other.tasks)]:
+            for name, usage in theirs.items():
+                mine.setdefault(name, ResourceUsage())
+                mine[name] += usage
+
+    def as_dict(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        :return: usage per callback and per task as a dictionary
+        """
+        return {
+            'callbacks': {name: usage.as_dict()
+                          for name, usage in self.callbacks.items()},
+            'tasks': {name: usage.as_dict()
+                      for name, usage in self.tasks.items()},
+        }
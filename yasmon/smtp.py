@@ -0,0 +1,581 @@
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from typing import Optional
+from . import callbacks
+import email.message
+import email.policy
+import itertools
+import threading
+import asyncio
+import smtplib
+import time
+import ssl
+import os
+
+
+class SMTPPool:
+    """
+    Pool of authenticated SMTP sessions to a server.
+
+    Sessions are kept open after sending a mail and reused, so the TLS
+    handshake and login are not repeated for every mail. A session idle
+    for ``keepalive`` seconds is checked with ``NOOP`` before it is reused
+    (and by :func:`refresh`), a session idle for ``idle_timeout`` seconds
+    is closed. If a reused session fails, e.g. because the server closed
+    it, the mail is sent over a new session. The SSL context is created
+    once per pool.
+
+    Sessions are blocking (:mod:`smtplib`), :func:`send` is meant to be
+    called from executor threads. Pools are shared per server and
+    credentials (see :func:`get`).
+    """
+
+    pools: dict[tuple[str, int, str, str, str], 'SMTPPool'] = {}
+
+    def __init__(self, host: str, port: int, login: str, password: str,
+                 security: str, size: int = 4, keepalive: float = 60,
+                 idle_timeout: float = 240, timeout: float = 60,
+                 context: Optional[ssl.SSLContext] = None) -> None:
+        """
+        :param host: smtp host
+        :param port: smtp port
+        :param login: login name
+        :param password: password
+        :param security: ``starttls`` or ``ssl``
+        :param size: maximum number of open sessions
+        :param keepalive: seconds after which an idle session is checked
+        :param idle_timeout: seconds after which an idle session is closed
+        :param timeout: socket timeout in seconds
+        :param context: SSL context (default:
+                        :func:`ssl.create_default_context`)
+        """
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.security = security
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = context
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        # idle sessions and the time they were last used, most recent last
+        self.sessions: list[tuple[smtplib.SMTP, float]] = []
+        self.connects = 0
+
+    @classmethod
+    def get(cls, host: str, port: int, login: str, password: str,
+            security: str) -> 'SMTPPool':
+        """
+        :return: pool of ``(host, port, login, password, security)``,
+                 created if needed
+
+        Pools are keyed on the credentials as well, so a callback with a
+        changed password gets a pool of its own instead of replacing a
+        pool other callbacks (and their outbox) still use.
+        """
+        key = (host, port, login, password, security)
+        if key not in cls.pools:
+            cls.pools[key] = cls(host, port, login, password, security)
+        return cls.pools[key]
+
+    @property
+    def context(self) -> ssl.SSLContext:
+        """
+        SSL context of the pool (created once).
+        """
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    def connect(self) -> smtplib.SMTP:
+        """
+        Open and authenticate a new session.
+        """
+        if self.security == 'ssl':
+            server = smtplib.SMTP_SSL(self.host, self.port,
+                                      timeout=self.timeout,
+                                      context=self.context)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        try:
+            if self.security == 'starttls':
+                server.starttls(context=self.context)
+            server.login(self.login, self.password)
+        except Exception:
+            self.close(server)
+            raise
+
+        self.connects += 1
+        logger.debug(f'smtp session to {self.host}:{self.port} as '
+                     f'{self.login} opened')
+        return server
+
+    @staticmethod
+    def close(server: smtplib.SMTP):
+        """
+        Close a session, politely if possible.
+        """
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @staticmethod
+    def alive(server: smtplib.SMTP) -> bool:
+        """
+        :return: whether the session answers ``NOOP``
+        """
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def stale(err: Exception) -> bool:
+        """
+        :return: whether ``err`` indicates a closed session
+        """
+        if isinstance(err, smtplib.SMTPResponseException):
+            return err.smtp_code == 421
+        return isinstance(err, (smtplib.SMTPServerDisconnected, OSError))
+
+    def acquire(self) -> tuple[smtplib.SMTP, bool]:
+        """
+        :return: an idle (checked if necessary) or a new session, and
+                 whether it was idle
+        """
+        while True:
+            with self.lock:
+                if not self.sessions:
+                    break
+                server, used = self.sessions.pop()
+
+            idle = time.monotonic() - used
+            if idle >= self.idle_timeout:
+                self.close(server)
+            elif idle >= self.keepalive and not self.alive(server):
+                server.close()
+            else:
+                return server, True
+
+        return self.connect(), False
+
+    def release(self, server: smtplib.SMTP):
+        """
+        Return a session to the pool.
+        """
+        with self.lock:
+            self.sessions.append((server, time.monotonic()))
+
+    def deliver(self, server: Optional[smtplib.SMTP],
+                message: email.message.EmailMessage) -> smtplib.SMTP:
+        """
+        Send ``message`` over ``server`` (a pooled or new session if
+        ``None``), over a new session if a reused session is stale.
+
+        :return: session to send further mails over
+        """
+        reused = True
+        if server is None:
+            server, reused = self.acquire()
+        try:
+            server.send_message(message)
+        except Exception as err:
+            server.close()
+            if not reused or not self.stale(err):
+                raise
+            logger.debug(f'smtp session to {self.host}:{self.port} '
+                         f'closed ({err}), reconnecting')
+            server = self.connect()
+            try:
+                server.send_message(message)
+            except Exception:
+                server.close()
+                raise
+        return server
+
+    def send_many(self, messages: list[email.message.EmailMessage]
+                  ) -> list[Optional[Exception]]:
+        """
+        Send ``messages`` over a single pooled session (as long as it does
+        not fail). If the server cannot be reached, remaining messages are
+        not attempted and fail with the same error.
+
+        :return: error of each message, ``None`` if it was sent
+        """
+        errors: list[Optional[Exception]] = [None] * len(messages)
+        server = None
+        with self.slots:
+            for n, message in enumerate(messages):
+                try:
+                    server = self.deliver(server, message)
+                except Exception as err:
+                    server = None
+                    errors[n] = err
+                    if self.stale(err):
+                        errors[n:] = [err] * (len(messages) - n)
+                        break
+            if server is not None:
+                self.release(server)
+        return errors
+
+    def send(self, message: email.message.EmailMessage):
+        """
+        Send ``message`` over a pooled session.
+        """
+        error, = self.send_many([message])
+        if error is not None:
+            raise error
+
+    def refresh(self):
+        """
+        Check sessions idle for ``keepalive`` seconds with ``NOOP`` and
+        close failing sessions and sessions idle for ``idle_timeout``
+        seconds.
+        """
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+
+        kept = []
+        now = time.monotonic()
+        for server, used in sessions:
+            if now - used >= self.idle_timeout:
+                self.close(server)
+            elif now - used >= self.keepalive and not self.alive(server):
+                server.close()
+            else:
+                kept.append((server, used))
+
+        with self.lock:
+            self.sessions = kept + self.sessions
+
+    def clear(self):
+        """
+        Close all idle sessions.
+        """
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for server, _ in sessions:
+            self.close(server)
+
+
+class OutboxItem:
+    """
+    Mail queued in a :class:`MailOutbox`.
+    """
+
+    def __init__(self, message: email.message.EmailMessage,
+                 spool: Optional[str] = None,
+                 path: Optional[str] = None,
+                 callback: Optional[str] = None) -> None:
+        """
+        :param message: mail
+        :param spool: spool directory of the mail (if any)
+        :param path: spool file of the mail, if it was loaded from the spool
+        :param callback: name of the callback queueing the mail (if any)
+        """
+        self.message = message
+        self.spool = spool
+        self.path = path
+        self.callback = callback
+        self.attempts = 0
+
+    def __str__(self) -> str:
+        prefix = '' if self.callback is None else \
+            f'in callback {self.callback} '
+        return f'{prefix}mail to {self.message["To"]}'
+
+
+class MailOutbox:
+    """
+    Queue of mails to a server, drained by sender workers.
+
+    Each worker takes up to ``batch`` queued mails at once and sends them
+    over a single session of the :class:`SMTPPool` of the server in a
+    thread of its own executor, so bursts of mails neither block the
+    event loop nor occupy the default executor. Mails which cannot be
+    sent are retried ``retries`` times with exponential backoff and
+    finally written to their spool directory (if any). Spooled mails are
+    queued again when the outbox is started.
+
+    Outboxes are shared per pool (see :func:`get`) and run while at least
+    one user (see :func:`start` and :func:`stop`) is registered; the
+    idle sessions of the pool are refreshed meanwhile.
+    """
+
+    outboxes: dict[SMTPPool, 'MailOutbox'] = {}
+
+    #: seconds to wait for queued mails to be sent when stopped
+    grace = 10
+
+    #: suffixes of spool file names
+    counter = itertools.count()
+
+    def __init__(self, pool: SMTPPool, workers: int = 2, size: int = 1000,
+                 batch: int = 50, retries: int = 5,
+                 backoff: float = 1) -> None:
+        """
+        :param pool: session pool of the server
+        :param workers: number of sender workers
+        :param size: maximum number of queued mails
+        :param batch: maximum number of mails sent at once by a worker
+        :param retries: number of retries of a failed mail
+        :param backoff: seconds before the first retry, doubled for every
+                        further retry
+        """
+        self.pool = pool
+        self.workers = workers
+        self.size = size
+        self.batch = batch
+        self.retries = retries
+        self.backoff = backoff
+        self.users = 0
+        self.spools: set[str] = set()
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: list[asyncio.Task] = []
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.inflight: list[OutboxItem] = []
+        self.delayed: dict[OutboxItem, asyncio.TimerHandle] = {}
+        self.sent = 0
+        self.spooled = 0
+
+    @classmethod
+    def get(cls, pool: SMTPPool) -> 'MailOutbox':
+        """
+        :return: outbox of ``pool``, created if needed
+        """
+        if pool not in cls.outboxes:
+            cls.outboxes[pool] = cls(pool)
+        return cls.outboxes[pool]
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the outbox is started.
+        """
+        return self.queue is not None
+
+    async def start(self, spool: Optional[str] = None,
+                    callback: Optional[str] = None):
+        """
+        Register a user, start the outbox if it is not running and queue
+        the mails in ``spool``.
+
+        :param spool: spool directory of the user
+        :param callback: name of the user
+        """
+        self.users += 1
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.size)
+            self.executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix='yasmon-smtp')
+            self.tasks = [asyncio.create_task(self.work())
+                          for _ in range(self.workers)]
+            self.tasks.append(asyncio.create_task(self.keepalive()))
+
+        if spool is not None and spool not in self.spools:
+            self.spools.add(spool)
+            await self.load(spool, callback)
+
+    async def stop(self):
+        """
+        Unregister a user and stop the outbox if it was the last one.
+        Mails not sent within ``grace`` seconds are spooled.
+        """
+        self.users -= 1
+        if self.users > 0 or self.queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self.queue.join(), self.grace)
+        except asyncio.TimeoutError:
+            logger.warning(f'outbox of {self.pool.host}:{self.pool.port} '
+                           f'not empty after {self.grace}s')
+
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        items = self.inflight + list(self.delayed)
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        for handle in self.delayed.values():
+            handle.cancel()
+        for item in items:
+            self.save(item)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.pool.clear)
+        self.executor.shutdown(wait=False)
+        self.queue = None
+        self.executor = None
+        self.tasks = []
+        self.inflight = []
+        self.delayed = {}
+        self.spools = set()
+
+    def started(self) -> asyncio.Queue:
+        """
+        :raises CallbackError: if the outbox is not started
+
+        :return: queue of the outbox
+        """
+        if self.queue is None:
+            raise callbacks.CallbackError(
+                f'outbox of {self.pool.host}:{self.pool.port} not started')
+        return self.queue
+
+    async def put(self, message: email.message.EmailMessage,
+                  spool: Optional[str] = None,
+                  callback: Optional[str] = None):
+        """
+        Queue ``message``, waiting while the queue is full.
+
+        :param message: mail
+        :param spool: spool directory of the mail
+        :param callback: name of the callback queueing the mail
+
+        :raises CallbackError: if the outbox is not started
+        """
+        await self.started().put(OutboxItem(message, spool,
+                                            callback=callback))
+
+    async def work(self):
+        """
+        Send queued mails.
+
+        :raises CallbackError: if the outbox is not started
+        """
+        queue = self.started()
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await queue.get()]
+            while len(items) < self.batch and not queue.empty():
+                items.append(queue.get_nowait())
+
+            self.inflight += items
+            try:
+                errors = await loop.run_in_executor(
+                    self.executor, self.pool.send_many,
+                    [item.message for item in items])
+                for item, error in zip(items, errors):
+                    self.inflight.remove(item)
+                    if error is None:
+                        self.done(item)
+                    else:
+                        self.fail(item, error)
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+    async def keepalive(self):
+        """
+        Periodically check idle sessions of the pool.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.pool.keepalive)
+            await loop.run_in_executor(self.executor, self.pool.refresh)
+
+    def done(self, item: OutboxItem):
+        """
+        Account a sent mail and remove its spool file.
+        """
+        self.sent += 1
+        logger.debug(f'{item} sent via {self.pool.host}:{self.pool.port}')
+        if item.path is not None:
+            try:
+                os.unlink(item.path)
+            except OSError as err:
+                logger.warning(f'cannot remove spooled mail {item.path} '
+                               f'({err})')
+
+    def fail(self, item: OutboxItem, error: Exception):
+        """
+        Retry a failed mail after a delay or spool it. Mails failing all
+        retries are logged as errors, as their callbacks returned when
+        the mails were queued.
+        """
+        item.attempts += 1
+        if item.attempts > self.retries:
+            logger.error(f'{item} via {self.pool.host}:{self.pool.port} '
+                         f'failed {item.attempts} times ({error})')
+            self.save(item)
+            return
+
+        delay = self.backoff * 2 ** (item.attempts - 1)
+        logger.warning(f'{item} via {self.pool.host}:{self.pool.port} '
+                       f'failed ({error}), retrying in {delay}s')
+        loop = asyncio.get_running_loop()
+        self.delayed[item] = loop.call_later(delay, self.retry, item)
+
+    def retry(self, item: OutboxItem):
+        """
+        Queue a delayed mail again (spool it if the queue is full or the
+        outbox is not started).
+        """
+        del self.delayed[item]
+        try:
+            self.started().put_nowait(item)
+        except (asyncio.QueueFull, callbacks.CallbackError):
+            self.save(item)
+
+    def save(self, item: OutboxItem):
+        """
+        Write a mail to its spool directory, unless it is already spooled.
+        Mails without a spool directory are lost.
+        """
+        if item.path is not None:
+            return
+        if item.spool is None:
+            logger.error(f'{item} lost (no spool)')
+            return
+
+        path = os.path.join(item.spool,
+                            f'{time.time_ns()}-{os.getpid()}-'
+                            f'{next(self.counter)}.eml')
+        try:
+            os.makedirs(item.spool, exist_ok=True)
+            with open(f'{path}.tmp', 'wb') as fh:
+                fh.write(item.message.as_bytes())
+            os.replace(f'{path}.tmp', path)
+        except OSError as err:
+            logger.error(f'{item} lost, cannot spool {path} ({err})')
+            return
+        item.path = path
+        self.spooled += 1
+        logger.warning(f'{item} spooled to {path}')
+
+    async def load(self, spool: str, callback: Optional[str] = None):
+        """
+        Queue the mails spooled in ``spool``.
+
+        :param spool: spool directory
+        :param callback: name of the callback spooling to ``spool``
+
+        :raises CallbackError: if the outbox is not started
+        """
+        queue = self.started()
+        try:
+            names = sorted(name for name in os.listdir(spool)
+                           if name.endswith('.eml'))
+        except FileNotFoundError:
+            return
+        except OSError as err:
+            logger.error(f'cannot read spool {spool} ({err})')
+            return
+
+        for name in names:
+            path = os.path.join(spool, name)
+            try:
+                with open(path, 'rb') as fh:
+                    message = email.message_from_binary_file(
+                        fh, policy=email.policy.default)
+            except OSError as err:
+                logger.error(f'cannot read spooled mail {path} ({err})')
+                continue
+            logger.info(f'queueing spooled mail {path}')
+            await queue.put(OutboxItem(message, spool, path, callback))
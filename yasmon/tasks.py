@@ -1,15 +1,28 @@
 from yasmon.callbacks import AbstractCallback
 from yasmon.callbacks import CallbackAttributeError
 from yasmon.callbacks import CallbackCircularAttributeError
+from yasmon.checkpoints import Checkpoint
+from yasmon.events import Change, RenameDetector, SettleTracker
+from yasmon.fingerprints import Fingerprinter, Fingerprints
+from yasmon.templates import AttributePlan, Attributes, BuiltinAttributes
+from yasmon.templates import Template
+from yasmon.conditions import Condition, ConditionSyntaxError, ConditionError
+from yasmon.processes import ResourceStats
 
 from loguru import logger
 from abc import ABC, abstractmethod
-from typing import Self, Optional
+from typing import Self, Optional, Iterator, Awaitable
 import watchfiles
 import asyncio
 import signal
 import yaml
 import pathlib
+import os
+import re
+import fnmatch
+import random
+import itertools
+import hashlib
 
 
 class TaskSyntaxError(Exception):
@@ -48,15 +61,70 @@ class AbstractTask(ABC):
             self.name = "Generic Task"
         if not self.attrs:
             self.attrs = {}
+        if not getattr(self, 'watcher', None):
+            self.watcher = 'callback'
+        if not getattr(self, 'when', None):
+            self.when = None
+        self.plan = AttributePlan(self.attrs)
+        for err in self.plan.errors.values():
+            logger.warning(f'in task {self.name} {err.message}')
+        self.builtins = None
+        templates = [template for callback in self.callbacks
+                     for template in callback.templates()]
+        conditions = [self.when] + [callback.when
+                                    for callback in self.callbacks]
+        templates += [Template(f'{{{name}}}') for condition in conditions
+                      if condition is not None for name in condition.names]
+        builtins = BuiltinAttributes(self.plan.names(templates))
+        if builtins.names:
+            self.builtins = builtins
+            logger.debug(f'in task {self.name} built-in attributes '
+                         f'{", ".join(sorted(builtins.names))} referenced')
         logger.info(f'{self.name} ({self.__class__}) initialized')
 
     @abstractmethod
-    async def __call__(self, callback: AbstractCallback):
+    async def __call__(self, callback: Optional[AbstractCallback] = None):
         """
         Coroutine called by :class:`TaskRunner`.
+
+        :param callback: callback to schedule, if ``None`` the task is
+                         scheduled with all of its callbacks at once
+        """
+        if callback is None:
+            names = ', '.join(c.name for c in self.callbacks)
+            logger.info(f'{self.name} ({self.__class__}) scheduled with '
+                        f'shared watcher for callbacks {names}')
+        else:
+            logger.info(f'{self.name} ({self.__class__}) scheduled with '
+                        f'{callback.name} ({callback.__class__})')
+
+    def bind(self, attrs: dict[str, str]) -> Attributes:
+        """
+        Bind the attributes of an event to the resolved plan of the task
+        attributes, so callbacks render their templates in a single pass.
+        Built-in attributes referenced by the callbacks are added (see
+        :class:`yasmon.templates.BuiltinAttributes`).
+
+        :param attrs: attributes of an event
+
+        :return: task attributes updated by ``attrs``
+        """
+        if self.builtins is not None:
+            attrs = self.builtins(self.attrs | attrs) | attrs
+        return self.plan.bind(attrs)
+
+    def evaluate(self, condition: Condition, attrs: dict[str, str]) -> bool:
+        """
+        Evaluate ``condition`` for ``attrs``. Conditions that cannot be
+        evaluated (e.g. because of an undefined attribute) do not hold.
+
+        :return: ``True`` if ``condition`` holds
         """
-        logger.info(f'{self.name} ({self.__class__}) scheduled with '
-                    f'{callback.name} ({callback.__class__})')
+        try:
+            return condition(attrs)
+        except ConditionError as err:
+            logger.warning(f'in task {self.name} {err}')
+            return False
 
     @classmethod
     @abstractmethod
@@ -95,41 +163,389 @@ class TaskError(Exception):
         super().__init__(self.message)
 
 
+class TaskPathDeletedError(Exception):
+    """
+    Raised by the watcher of a task if a watched path was deleted.
+    """
+
+    def __init__(self, path, message="path {path} deleted"):
+        self.message = message.format(path=path)
+        super().__init__(self.message)
+
+
+class PathFilter(watchfiles.DefaultFilter):
+    """
+    Watch filter dropping irrelevant changes before they are yielded by
+    :func:`watchfiles.awatch`.
+
+    Globs containing a path separator are matched against the full path,
+    other globs against the file name. Regular expressions are searched
+    in the full path. If any ``include`` pattern is given, a path must
+    match at least one of them. Paths matching an ``exclude`` pattern are
+    dropped. If any ``match`` regular expression is given, a path must
+    match at least one of them as well, and named groups of the first
+    matching expression can be captured by :func:`captures`. Changes not
+    required to derive ``changes`` are dropped as
+    well, except for changes of ``roots``, which are required to detect
+    deleted roots. Whether such a change is an event of the task is
+    decided by :func:`passes`.
+    """
+
+    def __init__(self, changes: list[Change],
+                 include: Optional[list[str]] = None,
+                 exclude: Optional[list[str]] = None,
+                 include_regex: Optional[list[str]] = None,
+                 exclude_regex: Optional[list[str]] = None,
+                 match: Optional[list[str]] = None) -> None:
+        """
+        :param changes: changes to pass
+        :param include: globs of paths to include
+        :param exclude: globs of paths to exclude
+        :param include_regex: regular expressions of paths to include
+        :param exclude_regex: regular expressions of paths to exclude
+        :param match: regular expressions with named groups of paths to
+                      include
+
+        :raises re.error: on invalid regular expressions
+        """
+        super().__init__()
+        required = set(changes)
+        if Change.moved in required:
+            required |= {Change.added, Change.deleted}
+        if Change.settled in required:
+            required |= {Change.added, Change.modified, Change.deleted}
+        self.changes = frozenset(required)
+        self.roots: set[str] = set()
+        self.include = self.compile(include or [], include_regex or [])
+        self.exclude = self.compile(exclude or [], exclude_regex or [])
+        self.match = [re.compile(regex) for regex in match or []]
+
+    @staticmethod
+    def compile(globs: list[str], regexes: list[str]
+                ) -> Optional[tuple[list[re.Pattern], list[re.Pattern]]]:
+        """
+        Compile ``globs`` and ``regexes`` into patterns matched against
+        file names and patterns searched in full paths.
+        """
+        if not globs and not regexes:
+            return None
+
+        names = [re.compile(fnmatch.translate(glob))
+                 for glob in globs if os.sep not in glob]
+        paths = [re.compile('^' + fnmatch.translate(glob))
+                 for glob in globs if os.sep in glob]
+        paths += [re.compile(regex) for regex in regexes]
+        return names, paths
+
+    @staticmethod
+    def matches(patterns: tuple[list[re.Pattern], list[re.Pattern]],
+                path: str) -> bool:
+        names, paths = patterns
+        if names:
+            name = os.path.basename(path)
+            if any(pattern.match(name) for pattern in names):
+                return True
+        return any(pattern.search(path) for pattern in paths)
+
+    def __call__(self, change: watchfiles.Change, path: str) -> bool:
+        return path in self.roots or self.passes(change, path)
+
+    def passes(self, change: watchfiles.Change, path: str) -> bool:
+        """
+        :return: whether ``change`` of ``path`` passes the filter, not
+                 considering ``roots``
+        """
+        if change not in self.changes:
+            return False
+        if self.exclude is not None and self.matches(self.exclude, path):
+            return False
+        if self.include is not None and not self.matches(self.include, path):
+            return False
+        if self.match and not any(p.search(path) for p in self.match):
+            return False
+        return super().__call__(change, path)
+
+    def captures(self, path: str) -> Optional[dict[str, str]]:
+        """
+        :return: named groups of the first ``match`` expression matching
+                 ``path`` (empty without ``match`` expressions) or ``None``
+                 if no expression matches
+        """
+        if not self.match:
+            return {}
+        for pattern in self.match:
+            if (found := pattern.search(path)) is not None:
+                return {name: value for name, value
+                        in found.groupdict().items() if value is not None}
+        return None
+
+
+class CallbackDispatcher:
+    """
+    Per-task queue decoupling event intake from callback execution.
+
+    Calls are queued by :func:`put` and executed by a fixed number of
+    workers. If the queue is full, ``overflow`` decides whether intake
+    blocks (``block``) or whether the oldest (``drop_oldest``) or newest
+    (``drop_newest``) call is dropped.
+
+    Exceptions raised by a call are logged and the first one per callback
+    is raised by the next :func:`put` for the same callback.
+    """
+
+    def __init__(self, task: 'WatchfilesTask', workers: int = 1,
+                 queue_size: int = 0, overflow: str = 'block') -> None:
+        """
+        :param task: task dispatching calls
+        :param workers: number of concurrent workers
+        :param queue_size: maximum number of queued calls (0 = unbounded)
+        :param overflow: ``block``, ``drop_oldest`` or ``drop_newest``
+        """
+        self.task = task
+        self.num_workers = workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: list[asyncio.Task] = []
+        self.errors: dict[AbstractCallback, Exception] = {}
+        self.dropped = 0
+
+    def start(self):
+        """
+        Start workers (if not already running).
+        """
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [asyncio.create_task(self.worker())
+                        for _ in range(self.num_workers)]
+
+    def stop(self):
+        """
+        Cancel workers and discard queued calls.
+        """
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+        self.queue = None
+
+    async def put(self, callback: AbstractCallback, attrs: dict[str, str]):
+        """
+        Queue a call of ``callback`` with ``attrs``.
+
+        :raises Exception: exception previously raised by a call of
+                           ``callback``
+        """
+        if callback in self.errors:
+            raise self.errors.pop(callback)
+
+        self.start()
+        item = (callback, attrs)
+        match self.overflow:
+            case 'block':
+                await self.queue.put(item)
+            case 'drop_newest':
+                if self.queue.full():
+                    self.drop(callback)
+                    return
+                self.queue.put_nowait(item)
+            case 'drop_oldest':
+                while self.queue.full():
+                    dropped, _ = self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.drop(dropped)
+                self.queue.put_nowait(item)
+
+    def drop(self, callback: AbstractCallback):
+        self.dropped += 1
+        logger.warning(f'in task {self.task.name} dispatch queue full, '
+                       f'dropped call of {callback.name} '
+                       f'({self.dropped} dropped)')
+
+    async def worker(self):
+        while True:
+            callback, attrs = await self.queue.get()
+            try:
+                await self.task.dispatch(callback, attrs)
+            except Exception as err:
+                logger.error(f'in task {self.task.name} callback '
+                             f'{callback.name} failed ({err})')
+                self.errors.setdefault(callback, err)
+            finally:
+                self.queue.task_done()
+
+
+class WatchRun:
+    """
+    State of watching the paths of a task for a set of callbacks.
+
+    With ``watcher: callback`` a task is watched once per callback. Each
+    watch keeps its own dispatch queue, debounced and settling changes,
+    fingerprints and rename detection, so a watch ending (e.g. because its
+    callback failed) does not affect the watches of other callbacks. File
+    digests and the hashing threads are shared by the task (see
+    :class:`yasmon.fingerprints.Fingerprinter`).
+    """
+
+    def __init__(self, task: 'WatchfilesTask',
+                 callbacks: list[AbstractCallback]) -> None:
+        """
+        :param task: watched task
+        :param callbacks: callbacks to call upon changes
+        """
+        self.callbacks = callbacks
+        self.dispatcher = None
+        if task.dispatch_options is not None:
+            self.dispatcher = CallbackDispatcher(task,
+                                                 **task.dispatch_options)
+        self.pending: dict[tuple[str, str], list] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.renames = None
+        if Change.moved in task.changes:
+            self.renames = RenameDetector()
+        self.settling = None
+        self.settler: Optional[asyncio.Task] = None
+        if Change.settled in task.changes:
+            self.settling = SettleTracker(task.quiet)
+        self.fingerprints = None
+        if task.fingerprinter is not None:
+            self.fingerprints = Fingerprints(task.fingerprinter)
+        self.caught_up = False
+
+    def stop(self):
+        """
+        Stop background dispatching and discard pending and settling
+        changes as well as fingerprints.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        self.pending.clear()
+        if self.settler is not None:
+            self.settler.cancel()
+            self.settler = None
+        if self.settling is not None:
+            self.settling.clear()
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+
+
 class WatchfilesTask(AbstractTask):
-    def __init__(self, name: str, changes: list[watchfiles.Change],
+    def __init__(self, name: str, changes: list[Change],
                  callbacks: list[AbstractCallback], paths: list[str],
                  timeout: int, max_retry: int,
-                 attrs: Optional[dict[str, str]] = None) -> None:
+                 attrs: Optional[dict[str, str]] = None,
+                 watcher: str = 'callback',
+                 dispatch: Optional[dict] = None,
+                 debounce: float = 0,
+                 include: Optional[list[str]] = None,
+                 exclude: Optional[list[str]] = None,
+                 include_regex: Optional[list[str]] = None,
+                 exclude_regex: Optional[list[str]] = None,
+                 recovery: str = 'poll',
+                 checkpoint: Optional[str] = None,
+                 settle: float = 5,
+                 fingerprint: Optional[str] = None,
+                 match: Optional[list[str]] = None,
+                 when: Optional[Condition] = None) -> None:
         """
         :param name: unique identifier
         :param changes: list of watchfiles events
         :param callbacks: assigned callbacks
         :param paths: paths to watch (files/directories)
         :param attrs: (static) attributes
+        :param watcher: ``callback`` for one watcher per callback,
+                        ``task`` for one watcher shared by all callbacks or
+                        ``global`` for the process-wide watcher
+        :param dispatch: keyword arguments of :class:`CallbackDispatcher`,
+                         if ``None`` callbacks are called inline
+        :param debounce: window (seconds) for coalescing repeated changes,
+                         0 disables coalescing
+        :param include: globs of paths to include
+        :param exclude: globs of paths to exclude
+        :param include_regex: regular expressions of paths to include
+        :param exclude_regex: regular expressions of paths to exclude
+        :param recovery: ``poll`` to retry missing paths after ``timeout``
+                         or ``watch`` to watch for missing paths to reappear
+        :param checkpoint: path of a :class:`yasmon.checkpoints.Checkpoint`
+                           index for catching up on changes after restarts
+        :param settle: quiet period (seconds) after which a written file
+                       is reported as ``settled``
+        :param fingerprint: :mod:`hashlib` algorithm for suppressing
+                            modifications that did not change the content,
+                            if ``None`` all modifications are passed on
+        :param match: regular expressions of paths to include, named groups
+                      are passed on as attributes
+        :param when: condition for calling the callbacks
         """
         self.name = name
         self.changes = changes
         self.callbacks = callbacks
         self.paths = paths
-        self.abs_paths = []  # resolved upon self.__call__()
+        self.abs_paths: set[str] = set()  # resolved upon self.__call__()
         self.attrs = {} if attrs is None else attrs
         self.max_retry = max_retry
         self.timeout = timeout
+        self.recovery = recovery
+        self.watcher = watcher
+        self.when = when
+        self.dispatch_options = dispatch
+        self.debounce = debounce
+        self.watch_filter = PathFilter(changes, include, exclude,
+                                       include_regex, exclude_regex, match)
+        self.quiet = settle
+        self.fingerprinter = None
+        if fingerprint is not None:
+            self.fingerprinter = Fingerprinter(fingerprint)
+        self.checkpoint = None
+        if checkpoint is not None:
+            self.checkpoint = Checkpoint(checkpoint)
+        self.runs: dict[tuple[AbstractCallback, ...], WatchRun] = {}
         super().__init__()
 
-    async def __call__(self, callback):
+    async def __call__(self, callback: Optional[AbstractCallback] = None):
         await super().__call__(callback)
+        callbacks = self.callbacks if callback is None else [callback]
+        self.run(callbacks)
+        try:
+            await self.watch(callbacks)
+        finally:
+            await self.stop(callbacks)
+
+    def run(self, callbacks: Optional[list[AbstractCallback]] = None
+            ) -> WatchRun:
+        """
+        :param callbacks: callbacks of the run (all callbacks if ``None``)
+
+        :return: watch run of ``callbacks``, created if needed
+        """
+        callbacks = self.callbacks if callbacks is None else callbacks
+        key = tuple(callbacks)
+        if key not in self.runs:
+            self.runs[key] = WatchRun(self, list(callbacks))
+        return self.runs[key]
+
+    async def watch(self, callbacks: list[AbstractCallback]):
+        """
+        Watch ``paths`` for ``callbacks`` and retry on missing paths.
+
+        :param callbacks: callbacks to call upon changes
+        """
+        names = ', '.join(c.name for c in callbacks)
         retry = 0
         max_retry = 'inf' if self.max_retry == -1 else self.max_retry
 
         while True:
             try:
+                abs_paths = set()
                 for path in self.paths:
                     if not pathlib.Path.exists(pathlib.Path(path)):
                         raise FileNotFoundError(path)
                     else:
                         abs_path = pathlib.Path(path).resolve()
-                        self.abs_paths.append(str(abs_path))
+                        abs_paths.add(str(abs_path))
             except FileNotFoundError as path:
                 if retry == self.max_retry and self.max_retry > -1:
                     logger.error(f'in task {self.name}'
@@ -141,44 +557,440 @@ class WatchfilesTask(AbstractTask):
                     retry += 1
                     logger.warning(f'in task {self.name}'
                                    f' path {path} does not exist (anymore)'
-                                   f'... retrying callback {callback.name}'
+                                   f'... retrying callbacks {names}'
                                    f' after {self.timeout} sec timeout '
                                    f' ({retry}/{max_retry} retries)')
-                    await asyncio.sleep(self.timeout)
+                    if self.recovery == 'watch':
+                        await self.await_path(str(path))
+                    else:
+                        await asyncio.sleep(self.timeout)
                     continue
 
+            self.abs_paths = abs_paths
+            self.watch_filter.roots = abs_paths
+
             # run awatch loop if all paths exist
             try:
-                await self.awatch_loop(callback)
-            except FileNotFoundError:
+                await WatchManager.catching_up(self.awatch_loop(callbacks),
+                                               self.catch_up(callbacks))
+            except TaskPathDeletedError:
                 continue
             finally:
                 retry = 0
 
-    async def awatch_loop(self, callback):
-        async for changes in watchfiles.awatch(*self.paths):
-            for (change, path) in changes:
-                if change in self.changes:
-                    match change:
-                        case watchfiles.Change.added:
-                            chng = 'added'
-                        case watchfiles.Change.modified:
-                            chng = 'modified'
-                        case watchfiles.Change.deleted:
-                            chng = 'deleted'
-                    try:
-                        call_attrs = {'change': chng, 'path': path}
-                        await callback(self, self.attrs | call_attrs)
-                    except CallbackAttributeError as err:
-                        logger.error(f'in task {self.name} callback {callback.name} raised {err}') # noqa
-                        raise err
-                    except CallbackCircularAttributeError as err:
-                        logger.error(f'in task {self.name} callback {callback.name} raised {err}') # noqa
-                        raise err
+    async def catch_up(self,
+                       callbacks: Optional[list[AbstractCallback]] = None,
+                       batch_size: int = 1000):
+        """
+        Catch up on changes missed while not running, once per run.
 
-                if (change == watchfiles.Change.deleted and
-                        path in self.abs_paths):
-                    raise FileNotFoundError
+        The watched trees are compared with the ``checkpoint`` index in a
+        thread, and differences are passed on to ``callbacks`` (all
+        callbacks if ``None``) as synthetic changes in batches of
+        ``batch_size``. An interrupted catch-up is started over by the
+        next call. If the checkpoint cannot be read or written, an error is
+        logged and changes are passed on as they are watched only.
+        """
+        run = self.run(callbacks)
+        if self.checkpoint is None or run.caught_up:
+            return
+
+        loop = asyncio.get_running_loop()
+        roots = WatchManager.covering_paths(list(self.abs_paths))
+        changes = self.checkpoint.diff(roots)
+
+        def next_batch():
+            return set(itertools.islice(changes, batch_size))
+
+        total = 0
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, next_batch)
+            except OSError as err:
+                logger.error(f'in task {self.name} catching up from '
+                             f'checkpoint {self.checkpoint.path} failed '
+                             f'({err})')
+                return
+            if not batch:
+                break
+            batch = {(change, path) for (change, path) in batch
+                     if self.watch_filter(change, path)}
+            total += len(batch)
+            await self.process_changes(batch, run.callbacks)
+
+        run.caught_up = True
+        logger.info(f'in task {self.name} caught up on {total} changes '
+                    f'from checkpoint {self.checkpoint.path}')
+
+    async def await_path(self, path: str) -> bool:
+        """
+        Wait up to ``timeout`` seconds for a missing ``path`` to reappear.
+
+        The nearest existing parent directory of ``path`` is watched (not
+        recursively) and the watch is re-armed closer to ``path`` as soon
+        as a directory on the way appears. If the parent cannot be watched,
+        this falls back to sleeping with exponential backoff and jitter.
+
+        :param path: missing path
+
+        :return: ``True`` if ``path`` exists (again)
+        """
+        target = pathlib.Path(path).absolute()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        backoff = 0
+
+        while not target.exists():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+
+            parent = self.nearest_parent(target)
+            stop_event = asyncio.Event()
+            timer = loop.call_later(remaining, stop_event.set)
+            try:
+                await self.await_parent(parent, target, stop_event)
+            except OSError as err:
+                delay = random.uniform(0, min(2 ** backoff, self.timeout))
+                backoff += 1
+                logger.debug(f'in task {self.name} watching {parent} '
+                             f'failed ({err}), retrying in {delay:.2f} sec')
+                await asyncio.sleep(min(delay, remaining))
+            finally:
+                timer.cancel()
+
+        return target.exists()
+
+    @staticmethod
+    def nearest_parent(path: pathlib.Path) -> pathlib.Path:
+        """
+        :return: nearest existing parent directory of ``path``
+        """
+        return next(parent for parent in path.parents if parent.is_dir())
+
+    async def await_parent(self, parent: pathlib.Path, target: pathlib.Path,
+                           stop_event: asyncio.Event):
+        """
+        Watch ``parent`` until ``target`` exists, the nearest existing
+        parent of ``target`` changes or ``stop_event`` is set. ``target``
+        is checked again once the watch is armed, so changes while arming
+        are not missed.
+        """
+        def arrived() -> bool:
+            return target.exists() or self.nearest_parent(target) != parent
+
+        async def recheck():
+            if arrived():
+                stop_event.set()
+
+        # tasks start in order of creation, i.e. once awatch() armed the
+        # watch and waits for changes in a thread
+        checker = asyncio.create_task(recheck())
+        try:
+            async for _ in watchfiles.awatch(parent, watch_filter=None,
+                                             stop_event=stop_event,
+                                             recursive=False):
+                if arrived():
+                    return
+        finally:
+            checker.cancel()
+
+    async def awatch_loop(self, callbacks: list[AbstractCallback]):
+        """
+        Watch ``paths`` with a single watcher and pass every change on to
+        all of ``callbacks``.
+
+        :param callbacks: callbacks to call upon changes
+
+        :raises TaskPathDeletedError: if a watched path was deleted (or
+                                      vanished before it was watched)
+        """
+        try:
+            async for changes in watchfiles.awatch(
+                    *self.paths, watch_filter=self.watch_filter):
+                await self.process_changes(changes, callbacks)
+
+                for (change, path) in changes:
+                    if (change == watchfiles.Change.deleted and
+                            path in self.abs_paths):
+                        raise TaskPathDeletedError(path)
+        except FileNotFoundError as err:
+            raise TaskPathDeletedError(err.filename) from err
+
+    async def process_changes(self, changes: set[tuple[watchfiles.Change,
+                                                       str]],
+                              callbacks: list[AbstractCallback]):
+        """
+        Pass a batch of changes on to ``callbacks``.
+
+        If ``debounce`` is set, repeated changes of a path are coalesced
+        and passed on once the debounce window has passed. If ``settled``
+        changes are requested, written files are tracked until they settle.
+        If ``fingerprint`` is set, modifications that did not change the
+        content are dropped.
+
+        :param changes: batch of ``(change, path)`` tuples
+        :param callbacks: callbacks to call upon changes
+        """
+        run = self.run(callbacks)
+        if run.flusher is not None and run.flusher.done():
+            flusher, run.flusher = run.flusher, None
+            flusher.result()
+        if run.settler is not None and run.settler.done():
+            settler, run.settler = run.settler, None
+            settler.result()
+
+        if run.settling is not None:
+            self.track(changes, run)
+
+        events = self.events(changes, run)
+        if run.fingerprints is not None:
+            events = await self.fingerprint(list(events), run)
+
+        for (change, path, extra) in events:
+            if self.debounce:
+                self.coalesce(change.name, path, extra, run)
+                continue
+
+            call_attrs = {'change': change.name, 'path': path} | extra
+            await self.notify(run, self.bind(call_attrs))
+
+    def events(self, changes: set[tuple[watchfiles.Change, str]],
+               run: WatchRun
+               ) -> Iterator[tuple[Change, str, dict[str, str]]]:
+        """
+        Derive the requested events from a batch of changes.
+
+        :param changes: batch of ``(change, path)`` tuples
+        :param run: watch run of the changes
+
+        :return: ``(change, path, attrs)`` tuples, where ``attrs`` are
+                 additional attributes of the event (e.g. named groups of
+                 ``match`` expressions)
+        """
+        captures = self.watch_filter.captures
+        roots = self.watch_filter.roots
+        changes = {(change, path) for (change, path) in changes
+                   if path not in roots or
+                   self.watch_filter.passes(change, path)}
+        if run.renames is not None:
+            changes, moves = run.renames.pair(changes)
+            for (src, dest) in moves:
+                if (extra := captures(dest)) is not None:
+                    yield Change.moved, dest, extra | {'src_path': src,
+                                                       'dest_path': dest}
+
+        for (change, path) in changes:
+            if change not in self.changes:
+                continue
+            if (extra := captures(path)) is not None:
+                yield Change(change), path, extra
+
+    async def fingerprint(self, events: list[tuple[Change, str,
+                                                   dict[str, str]]],
+                          run: WatchRun
+                          ) -> list[tuple[Change, str, dict[str, str]]]:
+        """
+        Fingerprint the paths of ``events`` concurrently, drop modifications
+        that did not change the content and add the ``hash`` attribute
+        (empty if a path could not be read).
+
+        :param events: ``(change, path, attrs)`` tuples
+        :param run: watch run of the events
+
+        :return: remaining ``(change, path, attrs)`` tuples
+        """
+        fingerprints = run.fingerprints
+
+        async def check(change, path, extra):
+            if change == Change.deleted:
+                fingerprints.forget(path)
+                return change, path, extra | {'hash': ''}
+            if change == Change.moved:
+                fingerprints.forget(extra['src_path'])
+
+            changed, digest = await fingerprints.check(path)
+            if change == Change.modified and not changed:
+                logger.debug(f'in task {self.name} content of {path} '
+                             'unchanged, modification dropped')
+                return None
+            return change, path, extra | {'hash': digest or ''}
+
+        checked = await asyncio.gather(*(check(*event) for event in events))
+        return [event for event in checked if event is not None]
+
+    def coalesce(self, change: str, path: str, extra: dict[str, str],
+                 run: WatchRun):
+        """
+        Count a change of ``path`` within the debounce window and make sure
+        the pending changes of ``run`` are flushed.
+        """
+        key = (change, path)
+        if key in run.pending:
+            run.pending[key][0] += 1
+            run.pending[key][2] = extra
+        else:
+            loop = asyncio.get_running_loop()
+            run.pending[key] = [1, loop.time() + self.debounce, extra]
+
+        if run.flusher is None:
+            run.flusher = asyncio.create_task(self.flush(run))
+            run.flusher.add_done_callback(self.flushed)
+
+    async def flush(self, run: WatchRun):
+        """
+        Pass coalesced changes of ``run`` on once their debounce window has
+        passed. Pending changes are kept in order of arrival, so the first
+        one is always due first.
+        """
+        loop = asyncio.get_running_loop()
+        while run.pending:
+            key, (count, deadline, extra) = next(iter(run.pending.items()))
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            del run.pending[key]
+            change, path = key
+            call_attrs = {'change': change, 'path': path, 'count': count}
+            call_attrs |= extra
+            await self.notify(run, self.bind(call_attrs))
+
+        run.flusher = None
+
+    def flushed(self, flusher: asyncio.Task):
+        """
+        Log the exception of a failed :func:`flush` as soon as it finished.
+        It is raised again by the next batch of changes (if any).
+        """
+        if not flusher.cancelled() and (err := flusher.exception()):
+            logger.error(f'in task {self.name} passing on debounced changes '
+                         f'failed ({err.__class__.__name__}: {err})')
+
+    def track(self, changes: set[tuple[watchfiles.Change, str]],
+              run: WatchRun):
+        """
+        Restart the quiet period of added or modified paths, stop tracking
+        deleted paths and make sure settled paths of ``run`` are passed on.
+        """
+        now = asyncio.get_running_loop().time()
+        for (change, path) in changes:
+            if change == Change.deleted:
+                run.settling.forget(path)
+            elif change in (Change.added, Change.modified):
+                run.settling.touch(path, now, run.callbacks)
+
+        if run.settler is None and run.settling.files:
+            run.settler = asyncio.create_task(self.settle(run))
+
+    async def settle(self, run: WatchRun):
+        """
+        Pass ``settled`` changes of ``run`` on once the quiet period of
+        tracked paths has passed, sleeping until the next deadline in the
+        timer heap.
+        """
+        loop = asyncio.get_running_loop()
+        while (deadline := run.settling.next_deadline()) is not None:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            for (path, _) in run.settling.due(loop.time()):
+                if (extra := self.watch_filter.captures(path)) is None:
+                    continue
+                call_attrs = {'change': Change.settled.name, 'path': path}
+                call_attrs |= extra
+                if run.fingerprints is not None:
+                    _, digest = await run.fingerprints.check(path)
+                    call_attrs['hash'] = digest or ''
+                await self.notify(run, self.bind(call_attrs))
+
+        run.settler = None
+
+    async def notify(self, run: WatchRun, attrs: dict[str, str]):
+        """
+        Call (or queue calls of) the callbacks of ``run`` with ``attrs``.
+
+        Calls are skipped if the ``when`` condition of the task or of a
+        callback does not hold, before any callback coroutine is created.
+        If queueing a call raises the exception of an earlier call, the
+        calls of the other callbacks are queued before it is raised.
+
+        :param run: watch run of the callbacks to call
+        :param attrs: attributes passed to the callbacks
+        """
+        if self.when is not None and not self.evaluate(self.when, attrs):
+            return
+        callbacks = [callback for callback in run.callbacks
+                     if callback.when is None or
+                     self.evaluate(callback.when, attrs)]
+        if not callbacks:
+            return
+
+        if run.dispatcher is not None:
+            error = None
+            for callback in callbacks:
+                try:
+                    await run.dispatcher.put(callback, attrs)
+                except Exception as err:
+                    error = error or err
+            if error is not None:
+                raise error
+        elif len(callbacks) == 1:
+            await self.dispatch(callbacks[0], attrs)
+        else:
+            await asyncio.gather(
+                *(self.dispatch(callback, attrs)
+                  for callback in callbacks))
+
+    async def stop(self,
+                   callbacks: Optional[list[AbstractCallback]] = None):
+        """
+        Stop the watch run of ``callbacks`` (all runs if ``None``, see
+        :func:`WatchRun.stop`) and save the ``checkpoint`` index (if any)
+        in a thread once the run caught up on it. Saving errors are logged.
+        Once no run is left, the fingerprinting threads are shut down.
+        """
+        keys = list(self.runs) if callbacks is None else [tuple(callbacks)]
+        caught_up = False
+        for key in keys:
+            if (run := self.runs.pop(key, None)) is None:
+                continue
+            run.stop()
+            caught_up = caught_up or run.caught_up
+
+        if not self.runs and self.fingerprinter is not None:
+            self.fingerprinter.close()
+
+        if not caught_up:
+            return
+
+        loop = asyncio.get_running_loop()
+        roots = WatchManager.covering_paths(list(self.abs_paths))
+        try:
+            await loop.run_in_executor(None, self.checkpoint.save, roots)
+        except Exception as err:
+            logger.error(f'in task {self.name} saving checkpoint '
+                         f'{self.checkpoint.path} failed ({err})')
+
+    async def dispatch(self, callback: AbstractCallback,
+                       attrs: dict[str, str]):
+        """
+        Call ``callback`` with ``attrs`` and log attribute errors.
+
+        :param callback: callback to call
+        :param attrs: attributes passed to the callback
+        """
+        try:
+            await callback(self, attrs)
+        except CallbackAttributeError as err:
+            logger.error(f'in task {self.name} callback {callback.name} raised {err}') # noqa
+            raise err
+        except CallbackCircularAttributeError as err:
+            logger.error(f'in task {self.name} callback {callback.name} raised {err}') # noqa
+            raise err
 
     @classmethod
     def from_yaml(cls, name: str, data: str,
@@ -199,8 +1011,74 @@ class WatchfilesTask(AbstractTask):
                 myattr: value
             timeout: 10
             max_retry: 3
+            watcher: task
+            dispatch:
+                workers: 4
+                queue_size: 100
+                overflow: block
+            debounce: 0.5
+            include:
+                - "*.csv"
+            exclude:
+                - "*.tmp"
+            include_regex:
+                - "/spool/tenant-[0-9]+/"
+            exclude_regex:
+                - '/\\.cache/'
+            match:
+                - '/tenant-(?P<tenant>[0-9]+)/job-(?P<job>[0-9]+)\\.done$'
+            recovery: watch
+            checkpoint: /var/lib/yasmon/task.idx
+            settle: 10
+            fingerprint: sha256
+            when: size > 1 * MiB and path.endswith('.csv')
+
+        Possible changes are ``added``, ``modified``, ``deleted``,
+        ``moved`` and ``settled``. A ``moved`` change is derived from a
+        ``deleted`` and an ``added`` change of the same file within a batch
+        (see :class:`yasmon.events.RenameDetector`) and provides attributes
+        ``src_path`` and ``dest_path``. A ``settled`` change is reported
+        once per written file, after its size and modification time did
+        not change for ``settle`` seconds (default 5, see
+        :class:`yasmon.events.SettleTracker`).
+        Possible watchers are ``callback`` (default, one watcher per
+        callback), ``task`` (one watcher shared by all callbacks) and
+        ``global`` (one watcher shared by all tasks, see
+        :class:`WatchManager`).
+
+        With ``dispatch``, callbacks are queued and executed by ``workers``
+        concurrent workers (see :class:`CallbackDispatcher`). Possible
+        overflow policies are ``block`` (default), ``drop_oldest`` and
+        ``drop_newest``. A ``queue_size`` of 0 (default) means unbounded.
 
-        Possible changes are ``added``, ``modified`` and ``deleted``.
+        With ``debounce`` (seconds), repeated ``(change, path)`` pairs
+        within the window are coalesced into a single call. The number of
+        coalesced changes is available as attribute ``count``.
+
+        Paths can be filtered by ``include`` and ``exclude`` globs and
+        ``include_regex`` and ``exclude_regex`` regular expressions (see
+        :class:`PathFilter`). Paths not matching any ``match`` regular
+        expression are dropped as well, named groups of the first matching
+        expression are passed on as attributes.
+
+        Possible recoveries of missing paths are ``poll`` (default, retry
+        after ``timeout`` seconds) and ``watch`` (watch the nearest
+        existing parent and retry as soon as the path reappears, at the
+        latest after ``timeout`` seconds, not supported by the ``global``
+        watcher).
+
+        With ``checkpoint``, the task catches up on changes missed while
+        yasmon was not running (see :func:`catch_up`).
+
+        With ``when``, callbacks are only called if the condition over the
+        attributes of an event holds (see
+        :class:`yasmon.conditions.Condition`). Callbacks can define their
+        own ``when`` conditions as well.
+
+        With ``fingerprint`` (a :mod:`hashlib` algorithm), ``modified``
+        changes are only passed on if the content of the file changed (see
+        :class:`yasmon.fingerprints.Fingerprinter`). The digest is available
+        as attribute ``hash``.
 
         :param name: unique identifier
         :param data: YAML snippet
@@ -263,7 +1141,7 @@ class WatchfilesTask(AbstractTask):
                 raise TaskSyntaxError(f"in task {name}: "
                                       "attrs must be a dictionary")
 
-        imp_changes = ['added', 'modified', 'deleted']
+        imp_changes = ['added', 'modified', 'deleted', 'moved', 'settled']
         for change in yamldata['changes']:
             if change not in imp_changes:
                 raise TaskSyntaxError(f"in task {name}: "
@@ -273,12 +1151,363 @@ class WatchfilesTask(AbstractTask):
             raise TaskSyntaxError(f"in task {name}: "
                                   "changes must be a list")
 
-        changes = [getattr(watchfiles.Change, change)
+        recovery = yamldata.get('recovery', 'poll')
+        if recovery not in ['poll', 'watch']:
+            raise TaskSyntaxError(f"in task {name}: "
+                                  f"invalid recovery {recovery}")
+
+        checkpoint = yamldata.get('checkpoint')
+        if checkpoint is not None and not isinstance(checkpoint, str):
+            raise TaskSyntaxError(f"in task {name}: "
+                                  "checkpoint must be a string")
+        if checkpoint is not None and not os.path.isdir(
+                os.path.dirname(os.path.abspath(checkpoint))):
+            raise TaskSyntaxError(f"in task {name}: directory of checkpoint "
+                                  f"{checkpoint} does not exist")
+
+        watcher = yamldata.get('watcher', 'callback')
+        if watcher not in ['callback', 'task', 'global']:
+            raise TaskSyntaxError(f"in task {name}: "
+                                  f"invalid watcher {watcher}")
+
+        if watcher == 'global' and recovery == 'watch':
+            raise TaskSyntaxError(f"in task {name}: "
+                                  "recovery watch requires watcher "
+                                  "callback or task")
+
+        patterns = {}
+        for key in ['include', 'exclude', 'include_regex', 'exclude_regex',
+                    'match']:
+            if key not in yamldata:
+                continue
+
+            if not isinstance(yamldata[key], list):
+                raise TaskSyntaxError(f"in task {name}: "
+                                      f"{key} must be a list")
+
+            for pattern in yamldata[key]:
+                if not isinstance(pattern, str):
+                    raise TaskSyntaxError(f"in task {name}: "
+                                          f"{key} must be strings")
+
+            patterns[key] = yamldata[key]
+
+        debounce = yamldata.get('debounce', 0)
+        if (not isinstance(debounce, (int, float)) or
+                isinstance(debounce, bool) or debounce < 0):
+            raise TaskSyntaxError(f"in task {name}: invalid debounce")
+
+        settle = yamldata.get('settle', 5)
+        if (not isinstance(settle, (int, float)) or
+                isinstance(settle, bool) or settle <= 0):
+            raise TaskSyntaxError(f"in task {name}: invalid settle")
+
+        when = yamldata.get('when')
+        if when is not None:
+            if not isinstance(when, str):
+                raise TaskSyntaxError(f"in task {name}: "
+                                      "when must be a string")
+            try:
+                when = Condition(when)
+            except ConditionSyntaxError as err:
+                raise TaskSyntaxError(f"in task {name}: invalid when ({err})")
+
+        fingerprint = yamldata.get('fingerprint')
+        if fingerprint is not None:
+            if not isinstance(fingerprint, str):
+                raise TaskSyntaxError(f"in task {name}: "
+                                      "fingerprint must be a string")
+            if (fingerprint not in hashlib.algorithms_available or
+                    hashlib.new(fingerprint).digest_size == 0):
+                raise TaskSyntaxError(f"in task {name}: "
+                                      f"invalid fingerprint {fingerprint}")
+
+        dispatch = yamldata.get('dispatch')
+        if dispatch is not None:
+            if not isinstance(dispatch, dict):
+                raise TaskSyntaxError(f"in task {name}: "
+                                      "dispatch must be a dictionary")
+
+            for key in dispatch:
+                if key not in ['workers', 'queue_size', 'overflow']:
+                    raise TaskSyntaxError(f"in task {name}: "
+                                          f"invalid dispatch key {key}")
+
+            workers = dispatch.get('workers', 1)
+            if not isinstance(workers, int) or workers < 1:
+                raise TaskSyntaxError(f"in task {name}: "
+                                      "invalid dispatch workers")
+
+            queue_size = dispatch.get('queue_size', 0)
+            if not isinstance(queue_size, int) or queue_size < 0:
+                raise TaskSyntaxError(f"in task {name}: "
+                                      "invalid dispatch queue_size")
+
+            overflow = dispatch.get('overflow', 'block')
+            if overflow not in ['block', 'drop_oldest', 'drop_newest']:
+                raise TaskSyntaxError(f"in task {name}: "
+                                      f"invalid dispatch overflow {overflow}")
+
+        changes = [getattr(Change, change)
                    for change in yamldata['changes']]
 
         paths = yamldata["paths"]
         attrs = yamldata['attrs'] if 'attrs' in yamldata else None
-        return cls(name, changes, callbacks, paths, timeout, max_retry, attrs)
+        try:
+            return cls(name, changes, callbacks, paths, timeout, max_retry,
+                       attrs, watcher, dispatch, debounce,
+                       recovery=recovery, checkpoint=checkpoint,
+                       settle=settle, fingerprint=fingerprint, when=when,
+                       **patterns)
+        except re.error as err:
+            raise TaskSyntaxError(f"in task {name}: "
+                                  f"invalid regex {err.pattern} ({err})")
+
+
+class WatchManager:
+    """
+    Process-wide watcher multiplexing the paths of many tasks.
+
+    All paths of the registered tasks are collapsed into the smallest set
+    of covering roots, which are watched by a single watcher. Each change
+    is routed back to the interested tasks through an index of watched
+    paths, so routing costs one lookup per path component regardless of
+    the number of tasks.
+
+    Acts as a functor and is scheduled by :class:`TaskRunner` for tasks
+    with ``watcher: global``.
+    """
+
+    def __init__(self, tasks: Optional[list[WatchfilesTask]] = None):
+        """
+        :param tasks: tasks to register
+        """
+        self.tasks: list[WatchfilesTask] = []
+        self.index: dict[str, list[WatchfilesTask]] = {}
+        self.roots: list[str] = []
+        self.retries: dict[str, int] = {}
+        # loop time of the next retry of tasks with missing paths
+        self.due: dict[str, float] = {}
+        for task in tasks or []:
+            self.register(task)
+
+    def register(self, task: WatchfilesTask):
+        """
+        Register a task with the watcher.
+
+        :param task: task to register
+        """
+        self.tasks.append(task)
+        self.retries[task.name] = 0
+        logger.info(f'{task.name} ({task.__class__}) registered with '
+                    f'global watcher')
+
+    @staticmethod
+    def covering_paths(paths: list[str]) -> list[str]:
+        """
+        Reduce absolute ``paths`` to the smallest set of paths covering all
+        of them, given that directories are watched recursively.
+
+        :param paths: absolute paths
+
+        :return: covering paths
+        """
+        roots: list[str] = []
+        for path in sorted(set(paths), key=lambda p: p.split(os.sep)):
+            if roots and (path == roots[-1] or
+                          path.startswith(roots[-1].rstrip(os.sep) + os.sep)):
+                continue
+            roots.append(path)
+        return roots
+
+    async def build_index(self) -> list[WatchfilesTask]:
+        """
+        Resolve the paths of all registered tasks and rebuild the index.
+        Tasks are only indexed if all their paths exist.
+
+        A retry of a task with missing paths is only counted once its
+        ``timeout`` elapsed since the previous retry, not on rebuilds
+        triggered by other tasks. Tasks running out of retries are dropped.
+
+        :raises TaskError: if all tasks were dropped
+
+        :return: tasks with missing paths
+        """
+        now = asyncio.get_running_loop().time()
+        self.index = {}
+        missing = []
+        error = None
+        for task in list(self.tasks):
+            abs_paths = []
+            for path in task.paths:
+                if not pathlib.Path.exists(pathlib.Path(path)):
+                    if now >= self.due.get(task.name, now):
+                        try:
+                            self.missing(task, path)
+                        except TaskError as err:
+                            error = err
+                            await self.drop(task)
+                            break
+                        self.due[task.name] = now + task.timeout
+                    missing.append(task)
+                    break
+                abs_paths.append(str(pathlib.Path(path).resolve()))
+            else:
+                self.retries[task.name] = 0
+                self.due.pop(task.name, None)
+                task.abs_paths = set(abs_paths)
+                task.watch_filter.roots = task.abs_paths
+                for abs_path in abs_paths:
+                    self.index.setdefault(abs_path, []).append(task)
+
+        if not self.tasks and error is not None:
+            raise error
+
+        self.roots = self.covering_paths(list(self.index))
+        return missing
+
+    async def drop(self, task: WatchfilesTask):
+        """
+        Unregister a task which ran out of retries.
+        """
+        self.tasks.remove(task)
+        del self.retries[task.name]
+        self.due.pop(task.name, None)
+        await task.stop()
+        logger.error(f'{task.name} ({task.__class__}) dropped from global '
+                     f'watcher')
+
+    def missing(self, task: WatchfilesTask, path: str):
+        """
+        Account for a missing path of ``task``.
+
+        :raises TaskError: if the task ran out of retries
+        """
+        retry = self.retries[task.name]
+        if retry == task.max_retry and task.max_retry > -1:
+            logger.error(f'in task {task.name}'
+                         f' path {path} does not exist '
+                         f'and max_retry {task.max_retry} '
+                         'was reached')
+            raise TaskError(task.name)
+
+        self.retries[task.name] = retry + 1
+        max_retry = 'inf' if task.max_retry == -1 else task.max_retry
+        logger.warning(f'in task {task.name}'
+                       f' path {path} does not exist (anymore)'
+                       f'... retrying after {task.timeout} sec timeout '
+                       f' ({retry + 1}/{max_retry} retries)')
+
+    def route(self, changes: set[tuple[watchfiles.Change, str]]
+              ) -> dict[WatchfilesTask, set[tuple[watchfiles.Change, str]]]:
+        """
+        Route a batch of changes to the tasks watching them.
+
+        :param changes: batch of ``(change, path)`` tuples
+
+        :return: changes per task
+        """
+        routed: dict[WatchfilesTask, set] = {}
+        for (change, path) in changes:
+            prefix = path
+            while True:
+                for task in self.index.get(prefix, ()):
+                    if task.watch_filter(change, path):
+                        routed.setdefault(task, set()).add((change, path))
+                parent = os.path.dirname(prefix)
+                if parent == prefix:
+                    break
+                prefix = parent
+        return routed
+
+    @staticmethod
+    async def catching_up(watching: Awaitable, catching: Awaitable):
+        """
+        Run a ``watching`` loop alongside ``catching`` up on missed changes.
+
+        The catch-up runs in a separate task which starts once the watcher
+        was armed by the first step of ``watching``, so changes made during
+        the catch-up walk are not lost (but may be passed on twice). If the
+        catch-up fails, watching is cancelled and the error is raised.
+        """
+        current = asyncio.current_task()
+        catcher = asyncio.ensure_future(catching)
+
+        def failed(catcher: asyncio.Future) -> bool:
+            return (catcher.done() and not catcher.cancelled() and
+                    catcher.exception() is not None)
+
+        def caught(catcher: asyncio.Future):
+            if failed(catcher):
+                current.cancel()
+
+        catcher.add_done_callback(caught)
+        try:
+            await watching
+        except BaseException:
+            if failed(catcher):
+                current.uncancel()
+                raise catcher.exception() from None
+            raise
+        finally:
+            catcher.remove_done_callback(caught)
+            catcher.cancel()
+            await asyncio.gather(catcher, return_exceptions=True)
+
+    async def __call__(self):
+        try:
+            await self.watch()
+        finally:
+            await asyncio.gather(*(task.stop() for task in self.tasks))
+
+    async def watch(self):
+        """
+        Watch the covering roots and rebuild the index whenever a watched
+        path is deleted or missing paths are due for a retry.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            missing = await self.build_index()
+            timeout = None
+            if missing:
+                timeout = max(0, min(self.due[task.name] for task in missing)
+                              - loop.time())
+
+            if not self.roots:
+                await asyncio.sleep(timeout or 0)
+                continue
+
+            logger.debug(f'global watcher watching {len(self.roots)} roots '
+                         f'for {len(self.tasks)} tasks')
+            indexed = {task for tasks in self.index.values() for task in tasks}
+            await self.catching_up(
+                self.awatch_loop(missing, timeout),
+                asyncio.gather(*(task.catch_up() for task in indexed)))
+
+    async def awatch_loop(self, missing: list[WatchfilesTask],
+                          timeout: Optional[float]):
+        """
+        Watch the covering roots until a watched path is deleted or, if
+        there are tasks with ``missing`` paths, ``timeout`` elapses.
+        """
+        loop = asyncio.get_running_loop()
+        rust_timeout = None if timeout is None else int(timeout * 1000) + 1
+        deadline = None if timeout is None else loop.time() + timeout
+        async for changes in watchfiles.awatch(
+                *self.roots, rust_timeout=rust_timeout,
+                yield_on_timeout=timeout is not None):
+            routed = self.route(changes)
+            await asyncio.gather(
+                *(task.process_changes(task_changes, task.callbacks)
+                  for task, task_changes in routed.items()))
+
+            for (change, path) in changes:
+                if (change == watchfiles.Change.deleted and
+                        path in self.index):
+                    return
+
+            if missing and loop.time() >= deadline:
+                return
 
 
 class TaskRunner:
@@ -300,12 +1529,58 @@ class TaskRunner:
             self.loop.add_signal_handler(s, lambda s=s: asyncio.create_task(
                 self.signal_handler(s)))
 
+        # callbacks shared by tasks are started and stopped once
+        self.callbacks = list({id(callback): callback for task in tasks
+                               for callback in task.callbacks}.values())
+
+        manager = WatchManager()
         for task in tasks:
+            if task.watcher == 'global':
+                manager.register(task)
+                continue
+
+            if task.watcher == 'task':
+                if task.callbacks:
+                    self.tasks.append(self.loop.create_task(task()))
+                continue
+
             for callback in task.callbacks:
                 self.tasks.append(
                     self.loop.create_task(task(callback)))
 
+        if manager.tasks:
+            self.tasks.append(self.loop.create_task(manager()))
+
     async def __call__(self):
+        try:
+            for callback in self.callbacks:
+                await callback.start()
+            await self.wait()
+        finally:
+            for callback in self.callbacks:
+                await callback.stop()
+
+            stats = self.stats()
+            for name, usage in stats.callbacks.items():
+                logger.info(f'callback {name} resource usage: {usage}')
+            for name, usage in stats.tasks.items():
+                logger.info(f'task {name} resource usage: {usage}')
+
+    def stats(self) -> ResourceStats:
+        """
+        :return: resource usage of the subprocesses of all callbacks,
+                 aggregated per callback and per task
+        """
+        stats = ResourceStats()
+        for callback in self.callbacks:
+            if getattr(callback, 'stats', None) is not None:
+                stats.merge(callback.stats)
+        return stats
+
+    async def wait(self):
+        """
+        Wait for all tasks.
+        """
         for task in asyncio.as_completed(self.tasks):
             try:
                 await task
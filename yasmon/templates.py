@@ -0,0 +1,486 @@
+from typing import Any, Optional, Union, Iterable, Callable
+from datetime import datetime
+import functools
+import string
+import re
+import socket
+import pwd
+import grp
+import os
+
+
+class TemplateCircularError(Exception):
+    """
+    Raised when attributes referenced by a template depend on themselves.
+    """
+
+    def __init__(self, chain: list[str],
+                 message="{chain}\ndetected circular attributes"):
+        self.chain = chain
+        self.message = message.format(chain=' -> '.join(chain))
+        super().__init__(self.message)
+
+
+CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+# compiled template parts are literal strings or fields
+# ``(name, conversion, format_spec, filters, nested)``, where ``nested``
+# are the parts of an attribute template expanded in place (``None`` for
+# fields looked up at render time)
+Part = Union[str, tuple[str, Optional[str], str, tuple[Callable, ...],
+                        Optional[tuple]]]
+
+FILTERS = frozenset({'basename', 'dirname', 'lower', 'upper', 'human',
+                     'strftime', 're', 'format'})
+
+
+def human(value: Any) -> str:
+    """
+    :return: human readable size of ``value`` bytes (e.g. ``1.5 MiB``)
+    """
+    if value == '':
+        return ''
+    size = float(value)
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'PiB'
+    return f'{size:.0f} B' if unit == 'B' else f'{size:.1f} {unit}'
+
+
+def strftime(value: Any, fmt: str) -> str:
+    """
+    :param value: ISO 8601 time or POSIX timestamp
+    :param fmt: :meth:`datetime.datetime.strftime` format
+
+    :return: formatted time
+    """
+    if value == '':
+        return ''
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromtimestamp(float(value)).astimezone()
+        except ValueError:
+            value = datetime.fromisoformat(str(value))
+    return value.strftime(fmt)
+
+
+def search(value: Any, pattern: re.Pattern) -> str:
+    """
+    :return: first group (or the whole match, if there are no groups) of
+             ``pattern`` in ``value``, empty if there is no match
+    """
+    match = pattern.search(str(value))
+    if match is None:
+        return ''
+    return match.group(1 if pattern.groups else 0) or ''
+
+
+def compile_filter(expr: str) -> Callable[[Any], Any]:
+    """
+    Compile a filter expression ``name[:argument]``.
+
+    :raises ValueError: on invalid filters or arguments
+
+    :return: filter function
+    """
+    name, _, arg = expr.partition(':')
+    match name.strip():
+        case 'basename':
+            return lambda value: os.path.basename(str(value))
+        case 'dirname':
+            return lambda value: os.path.dirname(str(value))
+        case 'lower':
+            return lambda value: str(value).lower()
+        case 'upper':
+            return lambda value: str(value).upper()
+        case 'human':
+            return human
+        case 'strftime':
+            fmt = arg or '%Y-%m-%d %H:%M:%S'
+            return lambda value: strftime(value, fmt)
+        case 're':
+            try:
+                pattern = re.compile(arg)
+            except re.error as err:
+                raise ValueError(f'invalid regex {arg} ({err})')
+            return lambda value: search(value, pattern)
+        case 'format':
+            return lambda value: format(value, arg)
+    raise ValueError(f'invalid filter {name}')
+
+
+def split_filters(expr: str) -> list[str]:
+    """
+    Split a chain of filter expressions at ``|``. A ``|`` not followed by
+    a filter name is part of the preceding argument (e.g. in ``re:a|b``).
+    """
+    filters: list[str] = []
+    for token in expr.split('|'):
+        if filters and token.partition(':')[0].strip() not in FILTERS:
+            filters[-1] += '|' + token
+        else:
+            filters.append(token)
+    return filters
+
+
+def append(parts: list[Part], part: Part):
+    """
+    Append ``part`` to ``parts``, merging adjacent literal strings.
+    """
+    if isinstance(part, str) and parts and isinstance(parts[-1], str):
+        parts[-1] += part
+    else:
+        parts.append(part)
+
+
+class Template(str):
+    """
+    String with attribute fields (``{attr}``), parsed once on creation.
+
+    Fields follow :meth:`str.format` syntax, so conversions (``{attr!r}``),
+    format specs (``{attr:>10}``) and escaped braces (``{{``, ``}}``) are
+    supported. Templates compare equal to their source string.
+
+    Values can be passed through a chain of filters, compiled once with
+    the template, e.g. ``{path|basename|upper}`` or ``{mtime|strftime:%F}``:
+
+    ==================  ===================================================
+    ``basename``        file name of a path
+    ``dirname``         directory of a path
+    ``lower``           lower case
+    ``upper``           upper case
+    ``human``           human readable size of a number of bytes
+    ``strftime:FMT``    time (ISO 8601 or POSIX timestamp) formatted by
+                        :meth:`datetime.datetime.strftime`
+    ``re:REGEX``        first group (or match) of a regular expression,
+                        empty if there is no match
+    ``format:SPEC``     value formatted by a format spec (e.g. ``>10``)
+    ==================  ===================================================
+
+    :raises ValueError: on unbalanced braces or invalid filters
+    """
+
+    parts: tuple[Part, ...]
+    names: frozenset[str]
+
+    def __new__(cls, source: str) -> 'Template':
+        template = super().__new__(cls, source)
+        parts: list[Part] = []
+        for literal, name, spec, conversion in string.Formatter().parse(
+                source):
+            if literal:
+                append(parts, literal)
+            if name is None:
+                continue
+
+            filters = ()
+            if '|' in name:
+                name, chain = name.split('|', 1)
+                if conversion is not None:
+                    chain += '!' + conversion
+                if spec:
+                    chain += ':' + spec
+                filters = tuple(compile_filter(expr)
+                                for expr in split_filters(chain))
+                conversion, spec = None, ''
+
+            if conversion is not None and conversion not in CONVERSIONS:
+                raise ValueError(f'invalid conversion !{conversion}')
+            append(parts, (name, conversion, spec or '', filters, None))
+        template.parts = tuple(parts)
+        template.names = frozenset(part[0] for part in parts
+                                   if not isinstance(part, str))
+        return template
+
+
+class AttributePlan:
+    """
+    Resolved plan of the (static) attributes of a task.
+
+    Attribute values are parsed as templates once and references between
+    attributes are expanded in place, so rendering a template against
+    the attributes of an event is a single pass without re-parsing.
+    Circular references are detected when the plan is built and raised
+    once a template referencing them is rendered.
+
+    Templates compiled against the plan are cached, so each template is
+    only expanded once per plan.
+    """
+
+    def __init__(self, attrs: dict[str, Any]) -> None:
+        """
+        :param attrs: static attributes, string values are templates
+        """
+        self.attrs = attrs
+        self.templates: dict[str, Template] = {}
+        for name, value in attrs.items():
+            try:
+                if isinstance(value, str):
+                    self.templates[name] = Template(value)
+            except ValueError:
+                pass  # not a template, used literally
+
+        self.resolved: dict[str, tuple[Part, ...]] = {}
+        self.errors: dict[str, TemplateCircularError] = {}
+        for name in self.templates:
+            try:
+                self.resolve(name, [])
+            except TemplateCircularError as err:
+                self.errors[name] = err
+
+        self.compiled: dict[str, tuple[Part, ...]] = {}
+        self.shadowed: dict[frozenset[str], AttributePlan] = {}
+
+    def resolve(self, name: str, chain: list[str]) -> tuple[Part, ...]:
+        """
+        Expand the template of attribute ``name`` in place.
+
+        :param name: attribute name
+        :param chain: attributes currently being resolved
+
+        :raises TemplateCircularError: on circular references
+
+        :return: parts of the expanded template
+        """
+        if name in self.resolved:
+            return self.resolved[name]
+        if name in chain:
+            raise TemplateCircularError(chain[chain.index(name):] + [name])
+
+        parts = self.expand(self.templates[name].parts, chain + [name])
+        self.resolved[name] = parts
+        return parts
+
+    def expand(self, parts: tuple[Part, ...],
+               chain: list[str]) -> tuple[Part, ...]:
+        """
+        Expand references to templated attributes in ``parts``.
+        """
+        expanded: list[Part] = []
+        for part in parts:
+            if isinstance(part, str) or part[0] not in self.templates:
+                append(expanded, part)
+                continue
+
+            name, conversion, spec, filters, _ = part
+            if name in self.errors:
+                raise self.errors[name]
+
+            nested = self.resolve(name, chain)
+            if conversion is None and not spec and not filters:
+                for nested_part in nested:
+                    append(expanded, nested_part)
+            else:
+                append(expanded, (name, conversion, spec, filters, nested))
+        return tuple(expanded)
+
+    def compile(self, template: Template) -> tuple[Part, ...]:
+        """
+        :raises TemplateCircularError: on circular references
+
+        :return: (cached) parts of ``template`` expanded against the plan
+        """
+        parts = self.compiled.get(template)
+        if parts is None:
+            parts = self.expand(template.parts, [])
+            self.compiled[template] = parts
+        return parts
+
+    def names(self, templates: Iterable[Template]) -> set[str]:
+        """
+        :return: names of attributes looked up at render time by
+                 ``templates`` (i.e. attributes not resolved by the plan)
+        """
+        names: set[str] = set()
+        stack = []
+        for template in templates:
+            try:
+                stack.append(self.compile(template))
+            except TemplateCircularError:
+                continue  # raised once rendered
+
+        while stack:
+            for part in stack.pop():
+                if isinstance(part, str):
+                    continue
+                if part[4] is None:
+                    names.add(part[0])
+                else:
+                    stack.append(part[4])
+        return names
+
+    def bind(self, attrs: dict[str, Any]) -> 'Attributes':
+        """
+        Bind the attributes of an event to the plan.
+
+        :param attrs: attributes of an event, taking precedence over static
+                      attributes of the same name
+
+        :return: all attributes
+        """
+        plan = self
+        shadowed = frozenset(self.templates.keys() & attrs.keys())
+        if shadowed:
+            plan = self.shadowed.get(shadowed)
+            if plan is None:
+                static = {name: value for name, value in self.attrs.items()
+                          if name not in shadowed}
+                plan = self.shadowed[shadowed] = AttributePlan(static)
+        return Attributes(self.attrs | attrs, plan)
+
+    def render(self, template: Template, attrs: dict[str, Any]) -> str:
+        """
+        Render ``template`` in a single pass.
+
+        :param template: template to render
+        :param attrs: attributes looked up at render time
+
+        :raises KeyError: on undefined attributes
+        :raises ValueError: on values not accepted by a filter or format spec
+        :raises TemplateCircularError: on circular references
+
+        :return: rendered string
+        """
+        return self.join(self.compile(template), attrs)
+
+    @classmethod
+    def join(cls, parts: tuple[Part, ...], attrs: dict[str, Any]) -> str:
+        """
+        Join compiled ``parts``, looking up fields in ``attrs``.
+        """
+        rendered = []
+        for part in parts:
+            if part.__class__ is str:
+                rendered.append(part)
+                continue
+
+            name, conversion, spec, filters, nested = part
+            if nested is None:
+                value = attrs[name]
+            else:
+                value = cls.join(nested, attrs)
+
+            for apply in filters:
+                value = apply(value)
+            if conversion is not None:
+                value = CONVERSIONS[conversion](value)
+            if spec or value.__class__ is not str:
+                value = format(value, spec)
+            rendered.append(value)
+        return ''.join(rendered)
+
+
+class Attributes(dict):
+    """
+    A dedicated `dictionary` for attributes bound to an
+    :class:`AttributePlan`.
+    """
+
+    def __init__(self, mapping=(), plan: Optional[AttributePlan] = None,
+                 **kwargs):
+        super().__init__(mapping, **kwargs)
+        self.plan = plan
+
+
+class BuiltinAttributes:
+    """
+    Built-in attributes of events, computed from the ``path`` attribute
+    of an event.
+
+    Only the built-in attributes in ``names`` are computed, so events do
+    not pay for attributes not referenced by any template (e.g. an
+    :func:`os.stat` call if none of ``size``, ``mtime``, ``owner`` or
+    ``group`` is referenced). Attributes of a missing path are empty.
+
+    ==============  =======================================================
+    ``basename``    file name of ``path``
+    ``dirname``     directory of ``path``
+    ``size``        size of ``path`` in bytes
+    ``mtime``       modification time of ``path`` (ISO 8601)
+    ``owner``       owner (user name) of ``path``
+    ``group``       group (group name) of ``path``
+    ``hostname``    host name
+    ``timestamp``   time of the call (ISO 8601)
+    ==============  =======================================================
+    """
+
+    available = frozenset({'basename', 'dirname', 'size', 'mtime', 'owner',
+                           'group', 'hostname', 'timestamp'})
+    stat_names = frozenset({'size', 'mtime', 'owner', 'group'})
+
+    def __init__(self, names: Iterable[str]) -> None:
+        """
+        :param names: referenced attribute names, names not available as
+                      built-in attributes are ignored
+        """
+        self.names = self.available & frozenset(names)
+        self.stat = bool(self.names & self.stat_names)
+        self.hostname = socket.gethostname()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def user(uid: int) -> str:
+        """
+        :return: (cached) user name of ``uid``
+        """
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            return str(uid)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def group(gid: int) -> str:
+        """
+        :return: (cached) group name of ``gid``
+        """
+        try:
+            return grp.getgrgid(gid).gr_name
+        except KeyError:
+            return str(gid)
+
+    def __call__(self, attrs: dict[str, Any]) -> dict[str, str]:
+        """
+        Compute the built-in attributes not already defined in ``attrs``.
+
+        :param attrs: attributes of an event
+
+        :return: built-in attributes
+        """
+        names = self.names - attrs.keys()
+        path = attrs.get('path', '')
+        builtins = {}
+
+        st = None
+        if self.stat and path and names & self.stat_names:
+            try:
+                st = os.stat(path)
+            except OSError:
+                pass
+
+        for name in names:
+            match name:
+                case 'basename':
+                    value = os.path.basename(path)
+                case 'dirname':
+                    value = os.path.dirname(path)
+                case 'hostname':
+                    value = self.hostname
+                case 'timestamp':
+                    value = datetime.now().astimezone().isoformat()
+                case _ if st is None:
+                    value = ''
+                case 'size':
+                    value = str(st.st_size)
+                case 'mtime':
+                    value = datetime.fromtimestamp(
+                        st.st_mtime).astimezone().isoformat()
+                case 'owner':
+                    value = self.user(st.st_uid)
+                case 'group':
+                    value = self.group(st.st_gid)
+            builtins[name] = value
+        return builtins